@@ -24,6 +24,8 @@ SOFTWARE.
 
 from __future__ import annotations
 
+import asyncio
+import time
 from pathlib import Path
 
 from fastapi import APIRouter, Depends, FastAPI, Request, WebSocket
@@ -32,12 +34,40 @@ from fastapi.responses import RedirectResponse
 from strawberry.printer import print_schema
 from internals.claim import get_claim_status
 
-from internals.db import KFDatabase
+from internals.db import (
+    KFDatabase,
+    backfill_order_snapshots,
+    create_change_watcher,
+    create_counter_reconciler,
+    create_order_archiver,
+    create_plan_sampler,
+    get_change_watcher,
+    get_counter_reconciler,
+    get_order_archiver,
+    seed_database,
+)
 from internals.discover import discover_routes
-from internals.graphql import KidoFoodContext, KidoGraphQLRouter, schema
+from internals.graphql import (
+    KidoFoodContext,
+    KidoGraphQLRouter,
+    create_cost_limits,
+    create_persisted_query_store,
+    create_response_cache,
+    get_persisted_query_store,
+    get_response_cache,
+    schema,
+    set_cursor_secret,
+    set_tracing_mode,
+)
 from internals.pubsub import get_pubsub
 from internals.responses import ORJSONXResponse, ResponseType
-from internals.session import SessionError, check_session, create_session_handler, get_session_handler
+from internals.session import (
+    SessionError,
+    check_session,
+    create_session_handler,
+    encrypt_password,
+    get_session_handler,
+)
 from internals.storage import get_local_storage
 from internals.tooling import get_env_config, setup_logger
 from internals.utils import get_description, get_version, to_boolean, try_int
@@ -59,11 +89,7 @@ app = FastAPI(
 router = APIRouter(prefix="/api")
 
 
-@app.on_event("startup")
-async def on_app_startup():
-    logger.info("Starting up KidoFood backend...")
-    logger.info("Connecting to database...")
-
+def create_database() -> KFDatabase:
     DB_URL = env_config.get("MONGODB_URL")
     DB_HOST = env_config.get("MONGODB_HOST")
     DB_PORT = env_config.get("MONGODB_PORT")
@@ -71,24 +97,82 @@ async def on_app_startup():
     DB_AUTH_STRING = env_config.get("MONGODB_AUTH_STRING")
     DB_AUTH_SOURCE = env_config.get("MONGODB_AUTH_SOURCE")
     DB_AUTH_TLS = to_boolean(env_config.get("MONGODB_TLS"))
+    DB_COMPRESSORS = env_config.get("MONGODB_COMPRESSORS") or ""
+    DB_SLOW_QUERY_MS = try_int(env_config.get("MONGODB_SLOW_QUERY_MS"))
+    DB_MONITOR_COMMANDS = env_config.get("MONGODB_COMMAND_MONITORING")
+    DB_DIRECT_CONNECTION = env_config.get("MONGODB_DIRECT_CONNECTION")
+    db_options = {
+        "min_pool_size": try_int(env_config.get("MONGODB_MIN_POOL_SIZE")),
+        "max_pool_size": try_int(env_config.get("MONGODB_MAX_POOL_SIZE")),
+        "max_idle_time_ms": try_int(env_config.get("MONGODB_MAX_IDLE_TIME_MS")),
+        "compressors": [comp.strip() for comp in DB_COMPRESSORS.split(",") if comp.strip()],
+        "server_selection_timeout_ms": try_int(env_config.get("MONGODB_SERVER_SELECTION_TIMEOUT_MS")),
+        "socket_timeout_ms": try_int(env_config.get("MONGODB_SOCKET_TIMEOUT_MS")),
+        "read_preference": env_config.get("MONGODB_READ_PREFERENCE") or None,
+        "catalog_read_preference": env_config.get("MONGODB_CATALOG_READ_PREFERENCE") or "secondaryPreferred",
+        "search_mode": env_config.get("MONGODB_SEARCH_MODE") or "text",
+        "direct_connection": None if DB_DIRECT_CONNECTION is None else to_boolean(DB_DIRECT_CONNECTION),
+        "slow_query_ms": 100 if DB_SLOW_QUERY_MS is None else (DB_SLOW_QUERY_MS or None),
+        "monitor_commands": True if DB_MONITOR_COMMANDS is None else to_boolean(DB_MONITOR_COMMANDS),
+    }
 
     if DB_URL is not None:
-        kfdb = KFDatabase(DB_URL, dbname=DB_NAME or "kidofood")
+        return KFDatabase(DB_URL, dbname=DB_NAME or "kidofood", **db_options)
     elif DB_HOST is not None:
-        kfdb = KFDatabase(
+        return KFDatabase(
             DB_HOST,
             try_int(DB_PORT) or 27017,
             DB_NAME or "kidofood",
             DB_AUTH_STRING,
             DB_AUTH_SOURCE or "admin",
             DB_AUTH_TLS,
+            **db_options,
         )
-    else:
-        raise Exception("No database connection information provided!")
+    raise Exception("No database connection information provided!")
+
 
+@app.on_event("startup")
+async def on_app_startup():
+    logger.info("Starting up KidoFood backend...")
+    logger.info("Connecting to database...")
+    kfdb = create_database()
     await kfdb.connect()
+    await kfdb.warm_up()
     logger.info("Connected to database!")
 
+    # Comma separated: orders, items, merchants. Empty to disable.
+    CHANGE_STREAMS = env_config.get("MONGODB_CHANGE_STREAMS")
+    if CHANGE_STREAMS is None:
+        CHANGE_STREAMS = "orders"
+    watched_colls = [coll.strip() for coll in CHANGE_STREAMS.split(",") if coll.strip()]
+    if watched_colls:
+        logger.info(f"Starting change stream watcher for: {', '.join(watched_colls)}")
+        create_change_watcher(kfdb.db, watched_colls).start()
+
+    # Counters are recounted on startup, and then every interval (in seconds)
+    COUNTERS_INTERVAL = try_int(env_config.get("COUNTERS_RECONCILE_INTERVAL")) or 3600
+    logger.info(f"Starting counter reconciliation every {COUNTERS_INTERVAL} seconds...")
+    create_counter_reconciler(COUNTERS_INTERVAL).start()
+
+    # Move finished orders to the archive collection after some days, 0 (default) to disable
+    ARCHIVE_AFTER_DAYS = try_int(env_config.get("ORDERS_ARCHIVE_AFTER_DAYS")) or 0
+    if ARCHIVE_AFTER_DAYS > 0:
+        ARCHIVE_INTERVAL = try_int(env_config.get("ORDERS_ARCHIVE_INTERVAL")) or 3600
+        logger.info(f"Starting order archiver for orders older than {ARCHIVE_AFTER_DAYS} days...")
+        create_order_archiver(ARCHIVE_AFTER_DAYS, interval=ARCHIVE_INTERVAL).start()
+
+    # Fraction (0.0-1.0) of query shapes that will be explained to find collection scans, 0 to disable
+    PLAN_SAMPLE_RATE = env_config.get("MONGODB_PLAN_SAMPLE_RATE")
+    if PLAN_SAMPLE_RATE:
+        try:
+            sample_rate = float(PLAN_SAMPLE_RATE)
+        except ValueError:
+            logger.warning(f"Invalid MONGODB_PLAN_SAMPLE_RATE: {PLAN_SAMPLE_RATE}, query plan sampling disabled")
+            sample_rate = 0.0
+        if sample_rate > 0:
+            logger.info(f"Sampling query plans for {sample_rate:.0%} of the query shapes...")
+            create_plan_sampler(sample_rate, suggest_indexes=to_boolean(env_config.get("MONGODB_PLAN_SUGGEST_INDEXES")))
+
     claim_stat = get_claim_status()
     logger.info("Checking claim status...")
     await claim_stat.set_from_db()
@@ -108,13 +192,57 @@ async def on_app_startup():
         logger.warning("Using default secret key, please change it later since it's not secure!")
     SESSION_MAX_AGE = int(env_config.get("SESSION_MAX_AGE") or 7 * 24 * 60 * 60)
     create_session_handler(SECRET_KEY, REDIS_HOST, try_int(REDIS_PORT) or 6379, REDIS_PASS, SESSION_MAX_AGE)
+    set_cursor_secret(SECRET_KEY)
     logger.info("Session created!")
 
+    # Automatic persisted queries, shared between workers with redis if available
+    APQ_CACHE_SIZE = try_int(env_config.get("APQ_CACHE_SIZE")) or 1000
+    APQ_TTL = try_int(env_config.get("APQ_TTL")) or 7 * 24 * 60 * 60
+    create_persisted_query_store(APQ_CACHE_SIZE, REDIS_HOST, try_int(REDIS_PORT) or 6379, REDIS_PASS, ttl=APQ_TTL)
+
+    # Response cache of the public catalog queries for anonymous users, requires redis (0 to disable)
+    GQL_RESPONSE_CACHE_TTL = try_int(env_config.get("GRAPHQL_RESPONSE_CACHE_TTL")) or 0
+    if create_response_cache(REDIS_HOST, try_int(REDIS_PORT) or 6379, REDIS_PASS, ttl=GQL_RESPONSE_CACHE_TTL):
+        logger.info(f"GraphQL response cache enabled, cached for {GQL_RESPONSE_CACHE_TTL} seconds")
+
+    # Query cost limit per operation, and per session in a time window (0 to disable)
+    GQL_MAX_COST = try_int(env_config.get("GRAPHQL_MAX_COST"))
+    GQL_MAX_DEPTH = try_int(env_config.get("GRAPHQL_MAX_DEPTH"))
+    create_cost_limits(
+        5000 if GQL_MAX_COST is None else GQL_MAX_COST,
+        10 if GQL_MAX_DEPTH is None else GQL_MAX_DEPTH,
+        try_int(env_config.get("GRAPHQL_SESSION_COST_BUDGET")) or 0,
+        try_int(env_config.get("GRAPHQL_SESSION_COST_WINDOW")) or 60,
+    )
+
+    # Trace the timing of every resolver: off, response (in the extensions) or log
+    GQL_TRACING = (env_config.get("GRAPHQL_TRACING") or "off").lower()
+    set_tracing_mode(GQL_TRACING)
+    if GQL_TRACING != "off":
+        logger.info(f"GraphQL tracing enabled, mode: {GQL_TRACING}")
+
 
 @app.on_event("shutdown")
 async def on_app_shutdown():
     logger.info("Shutting down KidoFood backend...")
+    watcher = get_change_watcher()
+    if watcher is not None:
+        logger.info("Stopping change stream watcher...")
+        await watcher.close()
+        logger.info("Stopped change stream watcher!")
+    reconciler = get_counter_reconciler()
+    if reconciler is not None:
+        await reconciler.close()
+    archiver = get_order_archiver()
+    if archiver is not None:
+        await archiver.close()
     logger.info("Closed storage connection!")
+    persisted_queries = get_persisted_query_store()
+    if persisted_queries is not None:
+        await persisted_queries.close()
+    response_cache = get_response_cache()
+    if response_cache is not None:
+        await response_cache.close()
     pubsub = get_pubsub()
     logger.info("Closing pubsub connection...")
     await pubsub.close()
@@ -158,9 +286,15 @@ async def get_context(
 ORJSONDefault = Default(ORJSONXResponse)
 # Auto add routes using discovery
 discover_routes(router, ROOT_DIR / "routes", recursive=True, default_response_class=ORJSONDefault)
+# Maximum operations in a batched request, 0 to disable batching
+GQL_MAX_BATCH_SIZE = try_int(env_config.get("GRAPHQL_MAX_BATCH_SIZE"))
+# Public queries over GET are always revalidated with the ETag, unless max age is set
+GQL_GET_MAX_AGE = try_int(env_config.get("GRAPHQL_GET_MAX_AGE")) or 0
 graphql_app = KidoGraphQLRouter(
     schema,
     context_getter=get_context,
+    max_batch_size=10 if GQL_MAX_BATCH_SIZE is None else GQL_MAX_BATCH_SIZE,
+    cache_control=f"public, max-age={GQL_GET_MAX_AGE}" if GQL_GET_MAX_AGE > 0 else "public, no-cache",
 )
 app.include_router(router)
 app.include_router(graphql_app, prefix="/graphql", include_in_schema=False)
@@ -178,6 +312,16 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     subparser = parser.add_subparsers(dest="cmd")
     subparser.add_parser("generate-schema")
+    subparser.add_parser("backfill-order-snapshots", help="Fill the item snapshot of old food orders")
+    seed_parser = subparser.add_parser("seed", help="Fill the database with synthetic data for load testing")
+    seed_parser.add_argument("--merchants", type=int, default=100, help="Number of merchants")
+    seed_parser.add_argument("--items", type=int, default=50, help="Number of items per merchant")
+    seed_parser.add_argument("--users", type=int, default=1000, help="Number of customers")
+    seed_parser.add_argument("--orders", type=int, default=10000, help="Number of orders")
+    seed_parser.add_argument("--days", type=int, default=365, help="Spread the data over this many past days")
+    seed_parser.add_argument("--seed", type=int, default=0, help="Random seed, same seed gives the same data")
+    seed_parser.add_argument("--batch-size", type=int, default=5000, help="Documents per insert_many")
+    seed_parser.add_argument("--password", default="kidofood", help="Password for every seeded user")
     args = parser.parse_args()
 
     if args.cmd == "generate-schema":
@@ -186,5 +330,38 @@ if __name__ == "__main__":
         with open(schema_file, "wb") as fp:
             fp.write(schematics.encode("utf-8") + b"\n")
         print(f"Schema generated at {schema_file}")
+    elif args.cmd == "backfill-order-snapshots":
+
+        async def run_backfill():
+            kfdb = create_database()
+            await kfdb.connect()
+            updated = await backfill_order_snapshots()
+            print(f"Backfilled item snapshots for {updated} orders")
+
+        asyncio.run(run_backfill())
+    elif args.cmd == "seed":
+
+        async def run_seed():
+            kfdb = create_database()
+            await kfdb.connect()
+            password_hash = await encrypt_password(args.password, loop=asyncio.get_running_loop())
+            t1_seed = time.perf_counter()
+            result = await seed_database(
+                args.merchants,
+                args.items,
+                args.users,
+                args.orders,
+                password_hash=password_hash,
+                seed=args.seed,
+                days=args.days,
+                batch_size=args.batch_size,
+            )
+            t2_seed = time.perf_counter()
+            print(
+                f"Seeded {result.merchants} merchants, {result.items} items, {result.users} users "
+                f"and {result.orders} orders in {t2_seed - t1_seed:.2f}s"
+            )
+
+        asyncio.run(run_seed())
     else:
         print("Unknown command, exiting...")
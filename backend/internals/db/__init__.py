@@ -7,5 +7,17 @@ A database internal module for KidoFood backend.
 :license: MIT, see LICENSE for more details.
 """
 
+from .archive import *
+from .bulk import *
 from .client import *
+from .counters import *
+from .lookups import *
+from .migrations import *
 from .models import *
+from .monitoring import *
+from .plans import *
+from .projection import *
+from .routing import *
+from .search import *
+from .seed import *
+from .watcher import *
@@ -30,7 +30,7 @@ from __future__ import annotations
 
 from datetime import datetime
 from functools import partial as ftpartial
-from typing import ForwardRef, get_args
+from typing import Dict, ForwardRef, Tuple, Type, get_args
 
 import pendulum
 from beanie import Document
@@ -43,6 +43,8 @@ __all__ = (
     "pendulum_utc",
 )
 pendulum_utc = ftpartial(pendulum.now, tz="UTC")
+# Per-class list of fields that need to be coerced, computed on first use.
+_PENDULUM_FIELDS: Dict[Type[Document], Tuple[str, ...]] = {}
 
 
 def _unpack_forwardref(annotation):
@@ -51,40 +53,48 @@ def _unpack_forwardref(annotation):
     return annotation
 
 
+def _is_pendulum_type(type_t) -> bool:
+    act_type = type_t
+    type_arg = get_args(type_t)
+    if len(type_arg) > 0:
+        act_type = type_arg[0]
+    fwd_unpack = _unpack_forwardref(act_type)
+
+    try:
+        return issubclass(act_type, DateTime) or "pendulum.DateTime" in str(fwd_unpack)
+    except Exception:
+        return "pendulum.DateTime" in str(fwd_unpack)
+
+
+def _get_pendulum_fields(model: Type[Document]) -> Tuple[str, ...]:
+    # Resolving the annotation is expensive, so we only do it once per class
+    # and reuse the result for every instance afterward.
+    fields = _PENDULUM_FIELDS.get(model)
+    if fields is not None:
+        return fields
+
+    annotate = resolve_annotations(model.__annotations__, model.__module__)
+    fields = tuple(key for key, type_t in annotate.items() if _is_pendulum_type(type_t))
+    _PENDULUM_FIELDS[model] = fields
+    return fields
+
+
 def _coerce_to_pendulum(clss: Document):
-    # Get annotation list, and check if it's DateTime instance
-    # If it is, then check if it's a pendulum instance or not
-
-    annotations = clss.__annotations__
-    annotate = resolve_annotations(annotations, None)
-
-    for key, type_t in annotate.items():
-        act_type = type_t
-        type_arg = get_args(type_t)
-        if len(type_arg) > 0:
-            act_type = type_arg[0]
-        fwd_unpack = _unpack_forwardref(act_type)
-
-        try:
-            is_pdt_type = issubclass(act_type, DateTime) or "pendulum.DateTime" in str(fwd_unpack)
-        except Exception:
-            is_pdt_type = "pendulum.DateTime" in str(fwd_unpack)
-            if not is_pdt_type:
-                continue
-
-        # check if it's pendulum class type
-        if is_pdt_type:
-            # Coerce to pendulum instance
-            current = object.__getattribute__(clss, key)
-            if current is None:
-                continue
-            if isinstance(current, DateTime):
-                continue
-            if isinstance(current, str):
-                # Assume ISO8601 format
-                object.__setattr__(clss, key, pendulum_parse(current))
-            elif isinstance(current, (int, float)):
-                # Unix timestamp
-                object.__setattr__(clss, key, pendulum.from_timestamp(current))
-            elif isinstance(current, datetime):
-                object.__setattr__(clss, key, pendulum.instance(current))
+    # Get the precomputed DateTime fields of the model, and check if
+    # the current value is a pendulum instance or not
+
+    for key in _get_pendulum_fields(type(clss)):
+        # Coerce to pendulum instance
+        current = object.__getattribute__(clss, key)
+        if current is None:
+            continue
+        if isinstance(current, DateTime):
+            continue
+        if isinstance(current, str):
+            # Assume ISO8601 format
+            object.__setattr__(clss, key, pendulum_parse(current))
+        elif isinstance(current, (int, float)):
+            # Unix timestamp
+            object.__setattr__(clss, key, pendulum.from_timestamp(current))
+        elif isinstance(current, datetime):
+            object.__setattr__(clss, key, pendulum.instance(current))
@@ -0,0 +1,218 @@
+"""
+MIT License
+
+Copyright (c) 2022-present noaione
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import TYPE_CHECKING, Any, List, Literal, Optional, Type
+
+import pendulum
+from beanie.odm.utils.projection import get_projection
+from pymongo import ReplaceOne
+from pymongo.errors import PyMongoError
+
+from internals.enums import OrderStatus
+
+from .models import ORDER_LOOKUP_INDEXES, FoodOrder
+from .plans import sample_query
+
+if TYPE_CHECKING:
+    from motor.core import AgnosticCollection
+
+__all__ = (
+    "TERMINAL_ORDER_STATUSES",
+    "get_archive_collection",
+    "ensure_archive_indexes",
+    "archive_terminal_orders",
+    "find_order",
+    "find_orders_page",
+    "count_orders",
+    "OrderArchiver",
+    "create_order_archiver",
+    "get_order_archiver",
+)
+
+logger = logging.getLogger("KidoFood.Database.Archive")
+TERMINAL_ORDER_STATUSES = (
+    OrderStatus.REJECTED,
+    OrderStatus.CANCELLED,
+    OrderStatus.CANCELED_MERCHANT,
+    OrderStatus.PROBLEM_MERCHANT,
+    OrderStatus.PROBLEM_FAIL_TO_DELIVER,
+    OrderStatus.DONE,
+)
+_ARCHIVE_COLLECTION = "FoodOrdersArchive"
+
+
+def get_archive_collection() -> AgnosticCollection:
+    """
+    The archived orders collection, it has the same document shape as `FoodOrder`.
+    """
+    return FoodOrder.get_motor_collection().database[_ARCHIVE_COLLECTION]
+
+
+async def ensure_archive_indexes() -> None:
+    """
+    Create the indexes of the archive collection, the same lookup indexes as the active orders.
+    """
+    await get_archive_collection().create_indexes(ORDER_LOOKUP_INDEXES)
+
+
+async def archive_terminal_orders(older_than_days: float = 30, batch_size: int = 500) -> int:
+    """
+    Move orders with terminal status that has not been updated for `older_than_days`
+    into the archive collection.
+
+    Each batch is copied first then removed, so an interrupted run can be safely repeated.
+
+    Returns the number of archived orders.
+    """
+    cutoff = pendulum.now("UTC").subtract(seconds=int(older_than_days * 86400))
+    terminal = [status.value for status in TERMINAL_ORDER_STATUSES]
+    orders_coll = FoodOrder.get_motor_collection()
+    archive_coll = get_archive_collection()
+
+    archived = 0
+    while True:
+        batch = (
+            await orders_coll.find({"status": {"$in": terminal}, "updated_at": {"$lt": cutoff}})
+            .sort("_id", 1)
+            .limit(batch_size)
+            .to_list(length=batch_size)
+        )
+        if not batch:
+            break
+        await archive_coll.bulk_write(
+            [ReplaceOne({"_id": order["_id"]}, order, upsert=True) for order in batch], ordered=False
+        )
+        # Terminal status cannot be changed anymore, but make sure we only remove what we copied.
+        await orders_coll.delete_many({"_id": {"$in": [order["_id"] for order in batch]}, "status": {"$in": terminal}})
+        archived += len(batch)
+        logger.info(f"Archived {archived} orders so far")
+        if len(batch) < batch_size:
+            break
+    return archived
+
+
+async def find_order(*args: Any) -> Optional[FoodOrder]:
+    """
+    Find a single order, checking the archive if it's not in the active orders.
+    """
+    order = await sample_query(FoodOrder.find_one(*args))
+    if order is not None:
+        return order
+    archived = await get_archive_collection().find_one(FoodOrder.find(*args).get_filter_query())
+    if archived is None:
+        return None
+    return FoodOrder.parse_obj(archived)
+
+
+async def find_orders_page(
+    *args: Any,
+    direction: Literal["+", "-"] = "+",
+    limit: int = 20,
+    projection_model: Optional[Type[Any]] = None,
+) -> List[Any]:
+    """
+    Find a page of orders sorted by `_id`, from both active and archived orders.
+
+    The active orders are queried first. If the page is full, only the archived orders
+    that would be sorted before the last active order are fetched, which is
+    usually none, so the archive is only really read when the page goes beyond the active orders.
+    """
+    active_query = FoodOrder.find(*args, projection_model=projection_model).sort(f"{direction}_id").limit(limit)
+    active = await sample_query(active_query).to_list()
+    archive_args = list(args)
+    if len(active) >= limit:
+        last_id = active[-1].id
+        archive_args.append(FoodOrder.id < last_id if direction == "+" else FoodOrder.id > last_id)
+    archived_docs = (
+        await get_archive_collection()
+        .find(
+            FoodOrder.find(*archive_args).get_filter_query(),
+            projection=get_projection(projection_model) if projection_model is not None else None,
+        )
+        .sort("_id", 1 if direction == "+" else -1)
+        .limit(limit)
+        .to_list(length=limit)
+    )
+    if not archived_docs:
+        return active
+    model = projection_model or FoodOrder
+    archived = [model.parse_obj(order) for order in archived_docs]
+    merged = sorted([*active, *archived], key=lambda order: order.id, reverse=direction == "-")
+    return merged[:limit]
+
+
+async def count_orders(*args: Any) -> int:
+    active, archived = await asyncio.gather(
+        FoodOrder.find(*args).count(),
+        get_archive_collection().count_documents(FoodOrder.find(*args).get_filter_query()),
+    )
+    return active + archived
+
+
+class OrderArchiver:
+    def __init__(self, older_than_days: float = 30, *, interval: float = 3600.0, batch_size: int = 500):
+        self._older_than_days = older_than_days
+        self._interval = interval
+        self._batch_size = batch_size
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                total = await archive_terminal_orders(self._older_than_days, self._batch_size)
+                if total > 0:
+                    logger.info(f"Archived {total} orders older than {self._older_than_days} days")
+            except PyMongoError as exc:
+                logger.error(f"Failed to archive orders: {exc}")
+            await asyncio.sleep(self._interval)
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="kidofood-order-archiver")
+
+    async def close(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+
+_GLOBAL_ARCHIVER: Optional[OrderArchiver] = None
+
+
+def create_order_archiver(older_than_days: float = 30, **kwargs: Any) -> OrderArchiver:
+    global _GLOBAL_ARCHIVER
+
+    if _GLOBAL_ARCHIVER is None:
+        _GLOBAL_ARCHIVER = OrderArchiver(older_than_days, **kwargs)
+    return _GLOBAL_ARCHIVER
+
+
+def get_order_archiver() -> Optional[OrderArchiver]:
+    return _GLOBAL_ARCHIVER
@@ -0,0 +1,178 @@
+"""
+MIT License
+
+Copyright (c) 2022-present noaione
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Union
+
+from beanie.odm.utils.dump import get_dict
+from bson import ObjectId
+from bson.errors import InvalidId
+from pydantic import ValidationError
+from pymongo import InsertOne
+from pymongo.errors import BulkWriteError
+
+from internals.enums import ApprovalStatus
+
+from .counters import item_counter, update_counters
+from .models import FoodItem, Merchant
+
+if TYPE_CHECKING:
+    from motor.core import AgnosticClientSession
+
+__all__ = (
+    "BulkRowError",
+    "BulkImportResult",
+    "FoodItemBulkImporter",
+    "get_importable_merchant",
+)
+
+logger = logging.getLogger("KidoFood.Database.Bulk")
+
+
+@dataclass
+class BulkRowError:
+    row: int
+    """The row number (1-based) of the failed item"""
+    message: str
+    """The reason why the row failed"""
+
+
+@dataclass
+class BulkImportResult:
+    inserted: int = 0
+    """How much items got inserted"""
+    errors: List[BulkRowError] = field(default_factory=list)
+    """The list of failed rows"""
+
+
+async def get_importable_merchant(
+    merchant_id: Optional[str], session: Optional[AgnosticClientSession] = None
+) -> Union[Merchant, str]:
+    """
+    Get the merchant that is allowed to add new items, or the error message if not.
+    """
+    if merchant_id is None:
+        return "You are not a merchant!"
+    try:
+        merchant_oid = ObjectId(merchant_id)
+    except (TypeError, InvalidId):
+        return "Your merchant acccout cannot be found!"
+    merchant = await Merchant.find_one(Merchant.id == merchant_oid, session=session)
+    if merchant is None:
+        return "Your merchant acccout cannot be found!"
+    if merchant.approved != ApprovalStatus.APPROVED:
+        return "Your merchant account is not approved yet!"
+    return merchant
+
+
+class FoodItemBulkImporter:
+    """
+    Import a lot of food items for a single merchant.
+
+    The rows are validated as they are added, and then written in batches
+    using a single `bulk_write` per batch. Any invalid row or failed write is reported
+    back with the row number instead of failing the whole import.
+
+    When `ordered` is `True`, the import stops at the first failed write.
+    """
+
+    def __init__(self, merchant: Merchant, *, batch_size: int = 500, ordered: bool = False):
+        self._merchant = merchant
+        self._batch_size = max(batch_size, 1)
+        self._ordered = ordered
+
+        self._pending: List[InsertOne] = []
+        self._pending_rows: List[int] = []
+        self._result = BulkImportResult()
+        self._halted = False
+
+    @property
+    def halted(self) -> bool:
+        """Whether the import is stopped because of a failed ordered write"""
+        return self._halted
+
+    def add_error(self, row: int, message: str) -> None:
+        self._result.errors.append(BulkRowError(row=row, message=message))
+
+    async def add(self, row: int, data: Dict[str, Any]) -> None:
+        if self._halted:
+            return
+        try:
+            item_type = data.get("type")
+            food_item = FoodItem(
+                name=data.get("name"),
+                description=data.get("description") or "",
+                stock=data.get("stock"),
+                price=data.get("price"),
+                type=item_type.lower() if isinstance(item_type, str) else item_type,
+                merchant=self._merchant,  # type: ignore
+            )
+        except ValidationError as exc:
+            message = ", ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in exc.errors())
+            self.add_error(row, message)
+            return
+
+        self._pending.append(InsertOne(get_dict(food_item, to_db=True)))
+        self._pending_rows.append(row)
+        if len(self._pending) >= self._batch_size:
+            await self.flush()
+
+    async def flush(self) -> None:
+        if not self._pending:
+            return
+        operations = self._pending
+        rows = self._pending_rows
+        self._pending = []
+        self._pending_rows = []
+
+        collection = FoodItem.get_motor_collection()
+        inserted = 0
+        try:
+            result = await collection.bulk_write(operations, ordered=self._ordered)
+            inserted = result.inserted_count
+        except BulkWriteError as exc:
+            details = exc.details
+            inserted = details.get("nInserted", 0)
+            failed_idx = set()
+            for write_error in details.get("writeErrors", []):
+                index = write_error["index"]
+                failed_idx.add(index)
+                self.add_error(rows[index], write_error.get("errmsg", "Failed to write item"))
+            if self._ordered:
+                # Everything after the failed write is not executed
+                last_failed = max(failed_idx) if failed_idx else -1
+                for row in rows[last_failed + 1 :]:
+                    self.add_error(row, "Not inserted because of a previous failed row")
+                self._halted = True
+        self._result.inserted += inserted
+        await update_counters({item_counter(): inserted, item_counter(self._merchant.id): inserted})
+        logger.info(f"Merchant<{self._merchant.id}>: Imported {self._result.inserted} items so far")
+
+    async def finish(self) -> BulkImportResult:
+        await self.flush()
+        self._result.errors.sort(key=lambda err: err.row)
+        return self._result
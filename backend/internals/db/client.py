@@ -24,9 +24,10 @@ SOFTWARE.
 
 from __future__ import annotations
 
+import asyncio
 import logging
 import time
-from typing import TYPE_CHECKING, Optional
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
 
 from beanie import init_beanie
 from motor.motor_asyncio import AsyncIOMotorClient
@@ -35,9 +36,14 @@ from pymongo.errors import PyMongoError
 if TYPE_CHECKING:
     from motor.core import AgnosticClient, AgnosticDatabase
 
+from .archive import ensure_archive_indexes
 from .models import FoodItem, FoodOrder, Merchant, User
+from .monitoring import CommandMonitor, TraceCommandListener
 
-__all__ = ("KFDatabase",)
+__all__ = (
+    "KFDatabase",
+    "get_database",
+)
 
 
 class KFDatabase:
@@ -49,6 +55,19 @@ class KFDatabase:
         auth_string: Optional[str] = None,
         auth_source: str = "admin",
         tls: bool = False,
+        *,
+        min_pool_size: Optional[int] = None,
+        max_pool_size: Optional[int] = None,
+        max_idle_time_ms: Optional[int] = None,
+        compressors: Optional[List[str]] = None,
+        server_selection_timeout_ms: Optional[int] = None,
+        socket_timeout_ms: Optional[int] = None,
+        read_preference: Optional[str] = None,
+        catalog_read_preference: str = "secondaryPreferred",
+        search_mode: str = "text",
+        direct_connection: Optional[bool] = None,
+        slow_query_ms: Optional[float] = 100.0,
+        monitor_commands: bool = True,
     ):
         self.logger = logging.getLogger("KidoFood.Database")
         self.__ip_hostname_or_url = ip_hostname_or_url
@@ -58,19 +77,58 @@ class KFDatabase:
         self._auth_source = auth_source
         self._tls = tls
 
+        self._min_pool_size = min_pool_size or 0
+        self._max_pool_size = max_pool_size
+        self._max_idle_time_ms = max_idle_time_ms
+        self._compressors = compressors or []
+        self._server_selection_timeout_ms = server_selection_timeout_ms
+        self._socket_timeout_ms = socket_timeout_ms
+        self._read_preference = read_preference
+        self._catalog_read_preference = catalog_read_preference
+        if search_mode not in ("text", "regex"):
+            raise ValueError(f"Invalid search mode: {search_mode}, must be either text or regex")
+        self._search_mode = search_mode
+        # Direct connection never discover the other replica set members, so only use it
+        # (unless configured) when every read goes to the primary anyway.
+        self._direct_connection_option = direct_connection
+        if direct_connection is None:
+            direct_connection = (read_preference or "primary") == "primary" and catalog_read_preference == "primary"
+        self._direct_connection = direct_connection
+        self._command_monitor = CommandMonitor(slow_query_ms) if monitor_commands else None
+        self._trace_listener = TraceCommandListener()
+
         self._url = self.__ip_hostname_or_url if self.__ip_hostname_or_url.startswith("mongodb") else ""
         self._ip_hostname = ""
         if self._url == "":
             self._ip_hostname = self.__ip_hostname_or_url
             self._generate_url()
 
-        self._client: AgnosticClient = AsyncIOMotorClient(self._url)
+        self._client: AgnosticClient = AsyncIOMotorClient(self._url, **self._client_options())
         self._db: AgnosticDatabase = self._client[self._dbname]
 
     @property
     def db(self):
         return self._db
 
+    @property
+    def client(self):
+        return self._client
+
+    @property
+    def catalog_read_preference(self) -> str:
+        """The read preference used by catalog queries that tolerate slight staleness"""
+        return self._catalog_read_preference
+
+    @property
+    def search_mode(self) -> str:
+        """How the catalog search is done, `text` (text index) or `regex`"""
+        return self._search_mode
+
+    @property
+    def command_monitor(self) -> Optional[CommandMonitor]:
+        """The command listener that records the query latency, if enabled"""
+        return self._command_monitor
+
     def _generate_url(self):
         self._url = "mongodb"
         if self._tls:
@@ -82,10 +140,38 @@ class KFDatabase:
         if not self._tls:
             self._url += f":{self._port}"
         self._url += "/"
-        self._url += f"?authSource={self._auth_source}&readPreference=primary&directConnection=true"
+        self._url += f"?authSource={self._auth_source}"
+        if self._direct_connection and not self._tls:
+            # Not allowed with mongodb+srv
+            self._url += "&directConnection=true"
         if self._tls:
             self._url += "&retryWrites=true&w=majority"
 
+    def _client_options(self) -> Dict[str, Any]:
+        # Keyword options take precedence over the one in the URL
+        options: Dict[str, Any] = {}
+        if self._read_preference:
+            # Only when configured, so the one in the URL is kept otherwise (or the driver default primary)
+            options["readPreference"] = self._read_preference
+        if self._min_pool_size > 0:
+            options["minPoolSize"] = self._min_pool_size
+        if self._max_pool_size is not None:
+            options["maxPoolSize"] = self._max_pool_size
+        if self._max_idle_time_ms is not None:
+            options["maxIdleTimeMS"] = self._max_idle_time_ms
+        if self._compressors:
+            options["compressors"] = ",".join(self._compressors)
+        if self._server_selection_timeout_ms is not None:
+            options["serverSelectionTimeoutMS"] = self._server_selection_timeout_ms
+        if self._socket_timeout_ms is not None:
+            options["socketTimeoutMS"] = self._socket_timeout_ms
+        if self._direct_connection_option is not None and not self._url.startswith("mongodb+srv"):
+            options["directConnection"] = self._direct_connection_option
+        options["event_listeners"] = [self._trace_listener]
+        if self._command_monitor is not None:
+            options["event_listeners"].append(self._command_monitor)
+        return options
+
     async def validate_connection(self):
         return await self._db.command({"ping": 1})  # type: ignore
 
@@ -101,7 +187,30 @@ class KFDatabase:
         except (ValueError, PyMongoError):
             return False, 99999
 
+    async def warm_up(self):
+        """
+        Open `minPoolSize` connections to the server before the first request arrives.
+
+        Each concurrent ping checks out its own connection from the pool, which force
+        the driver to establish them now instead of on the first burst of requests.
+        """
+        if self._min_pool_size < 1:
+            return
+        t1_warm = time.perf_counter()
+        self.logger.info(f"Warming up connection pool with {self._min_pool_size} connections...")
+        results = await asyncio.gather(
+            *[self.validate_connection() for _ in range(self._min_pool_size)],
+            return_exceptions=True,
+        )
+        failures = [res for res in results if isinstance(res, BaseException)]
+        t2_warm = time.perf_counter()
+        if failures:
+            self.logger.warning(f"Failed to open {len(failures)} connections while warming up: {failures[0]!r}")
+        self.logger.info(f"Connection pool warmed up in {(t2_warm - t1_warm) * 1000:.2f}ms")
+
     async def connect(self):
+        global _GLOBAL_DATABASE
+
         await init_beanie(
             database=self._db,
             document_models=[
@@ -111,3 +220,17 @@ class KFDatabase:
                 User,
             ],  # type: ignore (complained badly)
         )
+        try:
+            await ensure_archive_indexes()
+        except PyMongoError as exc:
+            self.logger.warning(f"Failed to create the archived orders indexes: {exc}")
+        _GLOBAL_DATABASE = self
+
+
+_GLOBAL_DATABASE: Optional[KFDatabase] = None
+
+
+def get_database() -> KFDatabase:
+    if _GLOBAL_DATABASE is None:
+        raise ValueError("Database is not connected yet, call KFDatabase.connect first")
+    return _GLOBAL_DATABASE
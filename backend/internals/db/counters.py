@@ -0,0 +1,213 @@
+"""
+MIT License
+
+Copyright (c) 2022-present noaione
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Union
+
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+
+from internals.enums import ApprovalStatus, OrderStatus
+
+from .archive import get_archive_collection
+from .models import FoodItem, FoodOrder, Merchant
+
+if TYPE_CHECKING:
+    from motor.core import AgnosticCollection
+
+__all__ = (
+    "merchant_counter",
+    "item_counter",
+    "order_counter",
+    "update_counters",
+    "move_counter",
+    "get_counters_total",
+    "reconcile_counters",
+    "CounterReconciler",
+    "create_counter_reconciler",
+    "get_counter_reconciler",
+)
+
+logger = logging.getLogger("KidoFood.Database.Counters")
+_COUNTERS_COLLECTION = "Counters"
+
+
+def _get_collection() -> AgnosticCollection:
+    return Merchant.get_motor_collection().database[_COUNTERS_COLLECTION]
+
+
+def merchant_counter(status: Union[ApprovalStatus, str]) -> str:
+    return f"merchants:{ApprovalStatus(status).value}"
+
+
+def item_counter(merchant_id: Optional[Union[ObjectId, str]] = None) -> str:
+    if merchant_id is None:
+        return "items"
+    return f"items:merchant:{merchant_id}"
+
+
+def order_counter(status: Optional[Union[OrderStatus, str]] = None) -> str:
+    if status is None:
+        return "orders"
+    return f"orders:{OrderStatus(status).value}"
+
+
+async def update_counters(changes: Dict[str, int]) -> None:
+    """
+    Increment (or decrement) the counters.
+
+    This never raise, a failed update will be fixed by the next reconciliation.
+    """
+    operations = [
+        UpdateOne({"_id": key}, {"$inc": {"value": amount}}, upsert=True) for key, amount in changes.items() if amount
+    ]
+    if not operations:
+        return
+    try:
+        await _get_collection().bulk_write(operations, ordered=False)
+    except PyMongoError as exc:
+        logger.warning(f"Failed to update counters {list(changes.keys())!r}: {exc}")
+
+
+async def move_counter(old_key: str, new_key: str) -> None:
+    if old_key == new_key:
+        return
+    await update_counters({old_key: -1, new_key: 1})
+
+
+async def get_counters_total(keys: Iterable[str]) -> Optional[int]:
+    """
+    Get the sum of the counters.
+
+    Returns `None` if one of the counters is missing, which means
+    the caller should count the documents directly.
+    """
+    keys = list(set(keys))
+    try:
+        counters = await _get_collection().find({"_id": {"$in": keys}}).to_list(length=None)
+    except PyMongoError as exc:
+        logger.warning(f"Failed to get counters {keys!r}: {exc}")
+        return None
+    if len(counters) != len(keys):
+        return None
+    return sum(max(counter.get("value", 0), 0) for counter in counters)
+
+
+async def _aggregate_counts(collection: AgnosticCollection, pipeline: List[Dict[str, Any]]) -> Dict[Any, int]:
+    results = await collection.aggregate(pipeline + [{"$group": {"_id": "$_key", "value": {"$sum": 1}}}]).to_list(
+        length=None
+    )
+    return {result["_id"]: result["value"] for result in results}
+
+
+async def reconcile_counters() -> int:
+    """
+    Recount every counter from the collections and overwrite the stored value.
+
+    Counter updates that happen while this is running might be lost,
+    but it will be corrected again on the next reconciliation.
+    """
+    counters: Dict[str, int] = {}
+    for status in ApprovalStatus:
+        counters[merchant_counter(status)] = 0
+    for status in OrderStatus:
+        counters[order_counter(status)] = 0
+
+    merchants = await _aggregate_counts(Merchant.get_motor_collection(), [{"$project": {"_key": "$approved"}}])
+    for status, value in merchants.items():
+        counters[merchant_counter(status)] = value
+
+    orders = await _aggregate_counts(FoodOrder.get_motor_collection(), [{"$project": {"_key": "$status"}}])
+    archived = await _aggregate_counts(get_archive_collection(), [{"$project": {"_key": "$status"}}])
+    for status, value in archived.items():
+        orders[status] = orders.get(status, 0) + value
+    for status, value in orders.items():
+        counters[order_counter(status)] = value
+    counters[order_counter()] = sum(orders.values())
+
+    # The merchant link is stored as DBRef, which cannot be grouped by `$merchant.$id` directly.
+    items = await _aggregate_counts(
+        FoodItem.get_motor_collection(),
+        [
+            {"$project": {"_ref": {"$objectToArray": "$merchant"}}},
+            {"$unwind": "$_ref"},
+            {"$match": {"_ref.k": "$id"}},
+            {"$project": {"_key": "$_ref.v"}},
+        ],
+    )
+    for merchant_id, value in items.items():
+        counters[item_counter(merchant_id)] = value
+    counters[item_counter()] = sum(items.values())
+
+    collection = _get_collection()
+    operations = [UpdateOne({"_id": key}, {"$set": {"value": value}}, upsert=True) for key, value in counters.items()]
+    await collection.bulk_write(operations, ordered=False)
+    # Reset any counter that no longer have any documents (e.g. merchant with no items left)
+    await collection.update_many({"_id": {"$nin": list(counters.keys())}}, {"$set": {"value": 0}})
+    return len(counters)
+
+
+class CounterReconciler:
+    def __init__(self, interval: float = 3600.0):
+        self._interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                total = await reconcile_counters()
+                logger.info(f"Reconciled {total} counters")
+            except PyMongoError as exc:
+                logger.error(f"Failed to reconcile counters: {exc}")
+            await asyncio.sleep(self._interval)
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="kidofood-counter-reconciler")
+
+    async def close(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+
+_GLOBAL_RECONCILER: Optional[CounterReconciler] = None
+
+
+def create_counter_reconciler(interval: float = 3600.0) -> CounterReconciler:
+    global _GLOBAL_RECONCILER
+
+    if _GLOBAL_RECONCILER is None:
+        _GLOBAL_RECONCILER = CounterReconciler(interval)
+    return _GLOBAL_RECONCILER
+
+
+def get_counter_reconciler() -> Optional[CounterReconciler]:
+    return _GLOBAL_RECONCILER
@@ -0,0 +1,221 @@
+"""
+MIT License
+
+Copyright (c) 2022-present noaione
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Collection, Dict, List, Literal, Optional, Type
+
+from beanie.odm.utils.projection import get_projection
+from bson import ObjectId
+
+from .archive import get_archive_collection
+from .models import FoodItem, FoodOrder, Merchant, User
+from .plans import sample_query
+
+if TYPE_CHECKING:
+    from motor.core import AgnosticCollection
+
+__all__ = (
+    "ORDER_LOOKUPS",
+    "OrderWithLookups",
+    "find_orders_page_with_lookups",
+)
+
+ORDER_LOOKUPS = ("merchant", "user", "items")
+
+
+@dataclass
+class OrderWithLookups:
+    order: Any
+    """The order, either `FoodOrder` or the projection model"""
+    lookups: Collection[str]
+    """The looked up relation, the one that are not in here is not fetched"""
+    merchant: Optional[Merchant] = None
+    user: Optional[User] = None
+    items: Dict[ObjectId, FoodItem] = field(default_factory=dict)
+
+
+def _ref_id(path: str) -> Dict[str, Any]:
+    # A link is stored as DBRef ({"$ref": ..., "$id": ...}), and `$id` cannot be
+    # used in a field path, so we need to go through `$objectToArray` to get it.
+    # Old orders embed the item document instead, which has `_id`.
+    return {
+        "$ifNull": [
+            f"{path}._id",
+            {
+                "$let": {
+                    "vars": {
+                        "ref": {
+                            "$arrayElemAt": [
+                                {
+                                    "$filter": {
+                                        "input": {"$objectToArray": path},
+                                        "cond": {"$eq": ["$$this.k", {"$literal": "$id"}]},
+                                    }
+                                },
+                                0,
+                            ]
+                        }
+                    },
+                    "in": "$$ref.v",
+                }
+            },
+        ]
+    }
+
+
+def _lookup_pipeline(
+    filter_query: Dict[str, Any],
+    direction: str,
+    limit: int,
+    projection: Optional[Dict[str, Any]],
+    lookups: Collection[str],
+) -> List[Dict[str, Any]]:
+    pipeline: List[Dict[str, Any]] = [
+        {"$match": filter_query},
+        {"$sort": {"_id": 1 if direction == "+" else -1}},
+        {"$limit": limit},
+    ]
+    if projection:
+        pipeline.append({"$project": {**projection, "merchant": 1, "user": 1, "items": 1}})
+    if "merchant" in lookups:
+        pipeline.append({"$addFields": {"_merchant_id": _ref_id("$merchant")}})
+        pipeline.append(
+            {
+                "$lookup": {
+                    "from": Merchant.get_collection_name(),
+                    "localField": "_merchant_id",
+                    "foreignField": "_id",
+                    "as": "_merchant",
+                }
+            }
+        )
+    if "user" in lookups:
+        pipeline.append({"$addFields": {"_user_id": _ref_id("$user")}})
+        pipeline.append(
+            {
+                "$lookup": {
+                    "from": User.get_collection_name(),
+                    "localField": "_user_id",
+                    "foreignField": "_id",
+                    "as": "_user",
+                }
+            }
+        )
+        # Do not send the password hash around, it's never needed here.
+        pipeline.append(
+            {
+                "$addFields": {
+                    "_user": {"$map": {"input": "$_user", "in": {"$mergeObjects": ["$$this", {"password": ""}]}}}
+                }
+            }
+        )
+    if "items" in lookups:
+        pipeline.append({"$addFields": {"_item_ids": {"$map": {"input": "$items", "in": _ref_id("$$this.data")}}}})
+        pipeline.append(
+            {
+                "$lookup": {
+                    "from": FoodItem.get_collection_name(),
+                    "localField": "_item_ids",
+                    "foreignField": "_id",
+                    "as": "_items",
+                }
+            }
+        )
+    return pipeline
+
+
+async def _aggregate_orders(
+    collection: AgnosticCollection,
+    filter_query: Dict[str, Any],
+    direction: str,
+    limit: int,
+    projection_model: Optional[Type[Any]],
+    lookups: Collection[str],
+) -> List[OrderWithLookups]:
+    projection = get_projection(projection_model) if projection_model is not None else None
+    pipeline = _lookup_pipeline(filter_query, direction, limit, projection, lookups)
+    results = await collection.aggregate(pipeline).to_list(length=None)
+
+    model = projection_model or FoodOrder
+    orders: List[OrderWithLookups] = []
+    for result in results:
+        merchants = result.pop("_merchant", [])
+        users = result.pop("_user", [])
+        items = result.pop("_items", [])
+        for extra in ("_merchant_id", "_user_id", "_item_ids"):
+            result.pop(extra, None)
+        orders.append(
+            OrderWithLookups(
+                order=model.parse_obj(result),
+                lookups=lookups,
+                merchant=Merchant.parse_obj(merchants[0]) if merchants else None,
+                user=User.parse_obj(users[0]) if users else None,
+                items={item["_id"]: FoodItem.parse_obj(item) for item in items},
+            )
+        )
+    return orders
+
+
+async def find_orders_page_with_lookups(
+    *args: Any,
+    lookups: Collection[str],
+    direction: Literal["+", "-"] = "+",
+    limit: int = 20,
+    projection_model: Optional[Type[Any]] = None,
+) -> List[OrderWithLookups]:
+    """
+    Same as `find_orders_page`, but the requested relations (merchant, user, items)
+    are joined with `$lookup` in the same aggregation instead of being fetched per order.
+    """
+    invalid = set(lookups) - set(ORDER_LOOKUPS)
+    if invalid:
+        raise ValueError(f"Unknown order lookups: {', '.join(invalid)}")
+
+    active_query = sample_query(FoodOrder.find(*args).sort(f"{direction}_id"))
+    active = await _aggregate_orders(
+        FoodOrder.get_motor_collection(),
+        active_query.get_filter_query(),
+        direction,
+        limit,
+        projection_model,
+        lookups,
+    )
+    archive_args = list(args)
+    if len(active) >= limit:
+        last_id = active[-1].order.id
+        archive_args.append(FoodOrder.id < last_id if direction == "+" else FoodOrder.id > last_id)
+    archived = await _aggregate_orders(
+        get_archive_collection(),
+        FoodOrder.find(*archive_args).get_filter_query(),
+        direction,
+        limit,
+        projection_model,
+        lookups,
+    )
+    if not archived:
+        return active
+    merged = sorted([*active, *archived], key=lambda result: result.order.id, reverse=direction == "-")
+    return merged[:limit]
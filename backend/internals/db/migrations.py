@@ -0,0 +1,111 @@
+"""
+MIT License
+
+Copyright (c) 2022-present noaione
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+from __future__ import annotations
+
+import logging
+from typing import Any, Dict, List
+
+from bson import DBRef, ObjectId
+from pymongo import UpdateOne
+
+from .models import FoodItem, FoodOrder
+
+__all__ = ("backfill_order_snapshots",)
+
+logger = logging.getLogger("KidoFood.Database.Migrations")
+
+
+def _snapshot_from_raw(item: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "item_id": item["item_id"],
+        "name": item["name"],
+        "price": item["price"],
+        "type": item["type"],
+        "avatar": item.get("avatar") or {"key": "", "format": ""},
+    }
+
+
+async def _backfill_order_batch(orders: List[Dict[str, Any]]) -> int:
+    items_coll = FoodItem.get_motor_collection()
+    orders_coll = FoodOrder.get_motor_collection()
+
+    # Collect every referenced item first, so we only do a single lookup per batch
+    missing_ids: List[ObjectId] = []
+    for order in orders:
+        for line in order.get("items", []):
+            data = line.get("data")
+            if line.get("snapshot") is None and isinstance(data, DBRef):
+                missing_ids.append(data.id)
+    items_map: Dict[ObjectId, Dict[str, Any]] = {}
+    if missing_ids:
+        async for item in items_coll.find({"_id": {"$in": list(set(missing_ids))}}):
+            items_map[item["_id"]] = item
+
+    updates: List[UpdateOne] = []
+    for order in orders:
+        changes: Dict[str, Any] = {}
+        for idx, line in enumerate(order.get("items", [])):
+            if line.get("snapshot") is not None:
+                continue
+            data = line.get("data")
+            if isinstance(data, DBRef):
+                item = items_map.get(data.id)
+                if item is None:
+                    logger.warning(f"Order<{order['_id']}>: Item {data.id} not found, skipping line {idx}")
+                    continue
+                changes[f"items.{idx}.snapshot"] = _snapshot_from_raw(item)
+            elif isinstance(data, dict):
+                # Old orders embed the whole item, use it as the snapshot and replace it with a reference
+                changes[f"items.{idx}.snapshot"] = _snapshot_from_raw(data)
+                changes[f"items.{idx}.data"] = DBRef(items_coll.name, data["_id"])
+        if changes:
+            updates.append(UpdateOne({"_id": order["_id"]}, {"$set": changes}))
+
+    if not updates:
+        return 0
+    result = await orders_coll.bulk_write(updates, ordered=False)
+    return result.modified_count
+
+
+async def backfill_order_snapshots(batch_size: int = 500) -> int:
+    """
+    Fill the item snapshot of every order line that does not have it yet.
+
+    Returns the number of updated orders.
+    """
+    orders_coll = FoodOrder.get_motor_collection()
+    cursor = orders_coll.find({"items.snapshot": None}, projection={"items": 1}, batch_size=batch_size)
+
+    total = 0
+    batch: List[Dict[str, Any]] = []
+    async for order in cursor:
+        batch.append(order)
+        if len(batch) >= batch_size:
+            total += await _backfill_order_batch(batch)
+            logger.info(f"Backfilled {total} orders so far...")
+            batch = []
+    if batch:
+        total += await _backfill_order_batch(batch)
+    return total
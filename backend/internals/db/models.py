@@ -24,12 +24,13 @@ SOFTWARE.
 
 from __future__ import annotations
 
-from typing import Optional
+from typing import ClassVar, List, Optional, Tuple
 from uuid import UUID, uuid4
 
 from beanie import Document, Link, Replace, SaveChanges, Update, after_event, before_event
 from pendulum.datetime import DateTime
 from pydantic import BaseModel, Field
+from pymongo import ASCENDING, TEXT, IndexModel
 
 from internals.enums import ApprovalStatus, ItemType, OrderStatus, UserType
 from internals.pubsub import get_pubsub
@@ -43,10 +44,49 @@ __all__ = (
     "User",
     "FoodOrder",
     "FoodOrderItem",
+    "FoodItemSnapshot",
+    "ORDER_LOOKUP_INDEXES",
     "PaymentReceipt",
+    "make_sort_indexes",
+    "make_text_index",
 )
 
 
+# Shared by the active and archived orders, since both are queried with the same filter
+ORDER_LOOKUP_INDEXES = [
+    IndexModel([("order_id", ASCENDING)], name="order_id", unique=True),
+    IndexModel([("user.$id", ASCENDING)], name="user_id"),
+    IndexModel([("merchant.$id", ASCENDING)], name="merchant_id"),
+]
+
+
+def make_text_index(name_weight: int = 10, description_weight: int = 2) -> IndexModel:
+    """
+    Create the weighted text index over `name` and `description` used by the text search mode.
+    """
+    return IndexModel(
+        [("name", TEXT), ("description", TEXT)],
+        weights={"name": name_weight, "description": description_weight},
+        name="name_description_text",
+    )
+
+
+def make_sort_indexes(fields: Tuple[str, ...], prefix: Tuple[str, ...] = ()) -> List[IndexModel]:
+    """
+    Create the compound `(*prefix, field, _id)` indexes used by the keyset pagination of each sort field.
+
+    The `prefix` is the equality filter that is always used together with the sort, the index
+    is also used for the descending sort since MongoDB can walk it backward.
+    """
+    return [
+        IndexModel(
+            [*((name, ASCENDING) for name in prefix), (field, ASCENDING), ("_id", ASCENDING)],
+            name="_".join((*prefix, field, "sort")),
+        )
+        for field in fields
+    ]
+
+
 class AvatarImage(BaseModel):
     key: str = ""
     format: str = ""
@@ -72,6 +112,11 @@ class Merchant(Document):
     class Settings:
         name = "FoodMerchants"
         use_state_management = True
+        indexes = [
+            make_text_index(),
+            IndexModel([("approved", ASCENDING), ("_id", ASCENDING)], name="approved_sort"),
+            *make_sort_indexes(("name", "created_at", "updated_at"), prefix=("approved",)),
+        ]
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -100,6 +145,7 @@ class FoodItem(Document):
     class Settings:
         name = "FoodItems"
         use_state_management = True
+        indexes = [make_text_index(), *make_sort_indexes(("name", "price", "created_at", "updated_at"))]
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -148,9 +194,32 @@ class User(Document):
         self.updated_at = pendulum_utc()
 
 
+class FoodItemSnapshot(BaseModel):
+    """The item information at the time it's ordered"""
+
+    item_id: UUID
+    name: str
+    price: float
+    type: ItemType
+    # S3 key
+    avatar: AvatarImage = Field(default_factory=AvatarImage)
+
+    @classmethod
+    def from_item(cls, item: FoodItem):
+        return cls(
+            item_id=item.item_id,
+            name=item.name,
+            price=item.price,
+            type=item.type,
+            avatar=item.avatar.copy(),
+        )
+
+
 class FoodOrderItem(BaseModel):
     data: Link[FoodItem]
     quantity: int = 1
+    # Older order might not have this, see `app.py backfill-order-snapshots`
+    snapshot: Optional[FoodItemSnapshot] = None
 
 
 class FoodOrder(Document):
@@ -166,9 +235,18 @@ class FoodOrder(Document):
     created_at: DateTime = Field(default_factory=pendulum_utc)
     updated_at: DateTime = Field(default_factory=pendulum_utc)
 
-    class Config:
-        collection = "FoodOrders"
+    # Disabled when the change stream watcher is running, see `watcher.py`
+    publish_on_save: ClassVar[bool] = True
+
+    class Settings:
+        # Beanie ignored the old `Config.collection`, so the orders always lived in `FoodOrder`
+        name = "FoodOrder"
         use_state_management = True
+        indexes = [
+            *ORDER_LOOKUP_INDEXES,
+            # Used by the archiver to find the finished orders
+            IndexModel([("status", ASCENDING), ("updated_at", ASCENDING)], name="status_updated_at"),
+        ]
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -180,5 +258,7 @@ class FoodOrder(Document):
 
     @after_event(Replace, Update, SaveChanges)
     def publish_changes(self):
+        if not FoodOrder.publish_on_save:
+            return
         ps = get_pubsub()
         ps.publish(f"order:updated:{str(self.order_id)}", self)
@@ -0,0 +1,252 @@
+"""
+MIT License
+
+Copyright (c) 2022-present noaione
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+from bisect import bisect_left
+from typing import Any, Dict, Mapping, Optional, Tuple, TypedDict
+
+from pymongo import monitoring
+
+from internals.tracing import TraceSpan, current_span, record_call
+
+__all__ = (
+    "CommandStats",
+    "LatencyHistogram",
+    "CommandMonitor",
+    "TraceCommandListener",
+    "redact_shape",
+)
+
+logger = logging.getLogger("KidoFood.Database.Monitor")
+# Latency histogram buckets upper bound, in milliseconds
+_BUCKETS_MS = (1.0, 2.0, 5.0, 10.0, 25.0, 50.0, 100.0, 250.0, 500.0, 1000.0, 2500.0, 5000.0, float("inf"))
+_MONITORED_COMMANDS = {
+    "find",
+    "getMore",
+    "aggregate",
+    "count",
+    "distinct",
+    "insert",
+    "update",
+    "delete",
+    "findAndModify",
+}
+
+
+class CommandStats(TypedDict):
+    count: int
+    failed: int
+    slow: int
+    mean: float
+    max: float
+    p50: float
+    p95: float
+    p99: float
+
+
+def redact_shape(value: Any) -> Any:
+    """
+    Replace every value in a query with `?` while keeping the keys and operators,
+    so the query shape can be logged without leaking any user data.
+    """
+    if isinstance(value, Mapping):
+        return {key: redact_shape(inner) for key, inner in value.items()}
+    if isinstance(value, (list, tuple)):
+        if not value:
+            return []
+        # Pipeline stages or `$or`/`$and` clauses, keep the structure
+        if all(isinstance(inner, Mapping) for inner in value):
+            return [redact_shape(inner) for inner in value]
+        return ["?"]
+    return "?"
+
+
+def _command_shape(command_name: str, command: Mapping[str, Any]) -> Any:
+    if command_name == "find":
+        return {"filter": redact_shape(command.get("filter", {})), "sort": command.get("sort")}
+    if command_name == "aggregate":
+        return {"pipeline": redact_shape(command.get("pipeline", []))}
+    if command_name in ("count", "distinct", "findAndModify"):
+        return {"query": redact_shape(command.get("query", {}))}
+    if command_name == "update":
+        return {"q": [redact_shape(update.get("q", {})) for update in command.get("updates", [])[:1]]}
+    if command_name == "delete":
+        return {"q": [redact_shape(delete.get("q", {})) for delete in command.get("deletes", [])[:1]]}
+    return None
+
+
+class LatencyHistogram:
+    def __init__(self) -> None:
+        self.buckets = [0] * len(_BUCKETS_MS)
+        self.count = 0
+        self.failed = 0
+        self.slow = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, duration_ms: float) -> None:
+        self.buckets[bisect_left(_BUCKETS_MS, duration_ms)] += 1
+        self.count += 1
+        self.total += duration_ms
+        self.max = max(self.max, duration_ms)
+
+    def percentile(self, percent: float) -> float:
+        """
+        Estimate the percentile using the bucket upper bound (capped by the max latency).
+        """
+        if self.count == 0:
+            return 0.0
+        threshold = self.count * percent / 100.0
+        running = 0
+        for upper, amount in zip(_BUCKETS_MS, self.buckets):
+            running += amount
+            if running >= threshold:
+                return min(upper, self.max)
+        return self.max
+
+    def to_dict(self) -> CommandStats:
+        return {
+            "count": self.count,
+            "failed": self.failed,
+            "slow": self.slow,
+            "mean": round(self.total / self.count, 3) if self.count else 0.0,
+            "max": round(self.max, 3),
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+        }
+
+
+def _command_collection(event: monitoring.CommandStartedEvent) -> str:
+    collection = event.command.get(event.command_name)
+    if not isinstance(collection, str):
+        # getMore has the cursor id as the value
+        collection = event.command.get("collection", "?")
+    return collection
+
+
+class CommandMonitor(monitoring.CommandListener):
+    """
+    Record the latency of each command per collection and command type,
+    and log any command that is slower than `slow_query_ms`.
+
+    The listener is called from the driver threads, so everything is guarded with a lock.
+    """
+
+    def __init__(self, slow_query_ms: Optional[float] = 100.0) -> None:
+        self._slow_query_ms = slow_query_ms
+        self._lock = threading.Lock()
+        self._pending: Dict[Tuple[Any, int], Tuple[str, str, Any]] = {}
+        self._histograms: Dict[Tuple[str, str], LatencyHistogram] = {}
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        if event.command_name not in _MONITORED_COMMANDS:
+            return
+        command = event.command
+        collection = _command_collection(event)
+        shape = None
+        if self._slow_query_ms is not None:
+            shape = _command_shape(event.command_name, command)
+        with self._lock:
+            self._pending[(event.connection_id, event.request_id)] = (collection, event.command_name, shape)
+
+    def _finish(self, event: Any, failed: bool) -> None:
+        with self._lock:
+            started = self._pending.pop((event.connection_id, event.request_id), None)
+            if started is None:
+                return
+            collection, command_name, shape = started
+            duration_ms = event.duration_micros / 1000.0
+            histogram = self._histograms.get((collection, command_name))
+            if histogram is None:
+                histogram = LatencyHistogram()
+                self._histograms[(collection, command_name)] = histogram
+            histogram.record(duration_ms)
+            if failed:
+                histogram.failed += 1
+            is_slow = self._slow_query_ms is not None and duration_ms >= self._slow_query_ms
+            if is_slow:
+                histogram.slow += 1
+        if is_slow:
+            logger.warning(f"Slow query on {collection}.{command_name} took {duration_ms:.2f}ms: {shape}")
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        self._finish(event, False)
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        self._finish(event, True)
+
+    def snapshot(self) -> Dict[str, CommandStats]:
+        """
+        Get the latency stats (in milliseconds) keyed by `collection.command`.
+        """
+        with self._lock:
+            return {
+                f"{collection}.{command_name}": histogram.to_dict()
+                for (collection, command_name), histogram in sorted(self._histograms.items())
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+
+
+class TraceCommandListener(monitoring.CommandListener):
+    """
+    Record the commands to the trace span of the GraphQL resolver that run it, if the request is traced.
+
+    Motor copy the context to the executor thread, so the span is still available here.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._pending: Dict[Tuple[Any, int], Tuple[TraceSpan, str]] = {}
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        span = current_span()
+        if span is None:
+            return
+        with self._lock:
+            self._pending[(event.connection_id, event.request_id)] = (
+                span,
+                f"{_command_collection(event)}.{event.command_name}",
+            )
+
+    def _finish(self, event: Any) -> None:
+        if not self._pending:
+            return
+        with self._lock:
+            started = self._pending.pop((event.connection_id, event.request_id), None)
+        if started is not None:
+            span, name = started
+            record_call("mongodb", name, event.duration_micros / 1000.0, span)
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        self._finish(event)
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        self._finish(event)
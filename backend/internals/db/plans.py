@@ -0,0 +1,263 @@
+"""
+MIT License
+
+Copyright (c) 2022-present noaione
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+from contextvars import ContextVar, Token
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Dict, List, Mapping, Optional, Set, Tuple, TypeVar
+
+import orjson
+from pymongo.errors import PyMongoError
+
+from .monitoring import redact_shape
+
+if TYPE_CHECKING:
+    from motor.core import AgnosticCollection
+
+__all__ = (
+    "QueryPlan",
+    "QueryPlanSampler",
+    "create_plan_sampler",
+    "current_query_origin",
+    "get_plan_sampler",
+    "reset_query_origin",
+    "sample_query",
+    "set_query_origin",
+)
+
+QueryT = TypeVar("QueryT")
+_RANGE_OPERATORS = {"$gt", "$gte", "$lt", "$lte", "$ne", "$nin", "$regex", "$exists"}
+_GLOBAL_PLAN_SAMPLER: Optional[QueryPlanSampler] = None
+# The resolver that is currently running (e.g. `Query.orders`), reported as the origin of the sampled queries.
+# Motor copy the context to the executor thread, so it's available on any database call made by the resolver.
+_QUERY_ORIGIN: ContextVar[Optional[str]] = ContextVar("kidofood_query_origin", default=None)
+
+
+def current_query_origin() -> Optional[str]:
+    return _QUERY_ORIGIN.get()
+
+
+def set_query_origin(origin: Optional[str]) -> Token:
+    return _QUERY_ORIGIN.set(origin)
+
+
+def reset_query_origin(token: Token) -> None:
+    _QUERY_ORIGIN.reset(token)
+
+
+@dataclass
+class QueryPlan:
+    collection: str
+    shape: str
+    stages: List[str]
+    origins: Set[str] = field(default_factory=set)
+    suggestion: Optional[List[Tuple[str, int]]] = None
+
+    @property
+    def collection_scan(self) -> bool:
+        return "COLLSCAN" in self.stages
+
+    @property
+    def in_memory_sort(self) -> bool:
+        return "SORT" in self.stages
+
+    @property
+    def problematic(self) -> bool:
+        return self.collection_scan or self.in_memory_sort
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "collection": self.collection,
+            "shape": self.shape,
+            "stages": self.stages,
+            "origins": sorted(self.origins),
+            "collection_scan": self.collection_scan,
+            "in_memory_sort": self.in_memory_sort,
+            "suggested_index": self.suggestion,
+        }
+
+
+def _plan_stages(plan: Any) -> List[str]:
+    # The plan is a tree of stages, newer server version nest it inside `queryPlan`
+    stages: List[str] = []
+    if isinstance(plan, Mapping):
+        stage = plan.get("stage")
+        if isinstance(stage, str):
+            stages.append(stage)
+        for value in plan.values():
+            stages.extend(_plan_stages(value))
+    elif isinstance(plan, list):
+        for value in plan:
+            stages.extend(_plan_stages(value))
+    return stages
+
+
+def _suggest_index(filter: Mapping[str, Any], sort: List[Tuple[str, int]]) -> Optional[List[Tuple[str, int]]]:
+    """
+    Suggest an index following the equality, sort, range order.
+    """
+    equality: List[Tuple[str, int]] = []
+    ranges: List[Tuple[str, int]] = []
+    for key, value in filter.items():
+        if key.startswith("$"):
+            # $or, $and, $text, cannot be suggested from the shape alone
+            continue
+        if isinstance(value, Mapping) and any(op in _RANGE_OPERATORS for op in value.keys()):
+            ranges.append((key, 1))
+        else:
+            equality.append((key, 1))
+    sort_keys = [(key, direction) for key, direction in sort if key not in filter]
+    keys = equality + sort_keys + ranges
+    return keys or None
+
+
+class QueryPlanSampler:
+    """
+    Run `explain()` for a fraction of the query shapes, and report any shape
+    that ends up doing a collection scan or an in-memory sort.
+
+    Each shape is only decided once, so a shape that is skipped will stay skipped
+    until the sampler is reset.
+    """
+
+    def __init__(self, sample_rate: float = 0.1, *, suggest_indexes: bool = True) -> None:
+        self.logger = logging.getLogger("KidoFood.Database.Plans")
+        self._sample_rate = sample_rate
+        self._suggest_indexes = suggest_indexes
+        self._decided: Dict[Tuple[str, str], Optional[QueryPlan]] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    @staticmethod
+    def _shape_key(filter: Mapping[str, Any], sort: List[Tuple[str, int]]) -> str:
+        shape = {"filter": redact_shape(filter), "sort": sort}
+        return orjson.dumps(shape, default=str, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+
+    def observe(
+        self,
+        collection: AgnosticCollection,
+        filter: Mapping[str, Any],
+        sort: Optional[List[Tuple[str, int]]] = None,
+        origin: Optional[str] = None,
+    ) -> None:
+        """
+        Observe a find query, the explain is scheduled in the background if the shape is sampled.
+        """
+        sort = [(key, int(direction)) for key, direction in sort or []]
+        key = (collection.name, self._shape_key(filter, sort))
+        if key in self._decided:
+            plan = self._decided[key]
+            if plan is not None and origin is not None and origin not in plan.origins:
+                plan.origins.add(origin)
+                if plan.problematic:
+                    self._report(plan)
+            return
+        if random.random() >= self._sample_rate:
+            self._decided[key] = None
+            return
+        plan = QueryPlan(collection=key[0], shape=key[1], stages=[])
+        if origin is not None:
+            plan.origins.add(origin)
+        self._decided[key] = plan
+        task = asyncio.create_task(self._explain(collection, plan, filter, sort))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _explain(
+        self,
+        collection: AgnosticCollection,
+        plan: QueryPlan,
+        filter: Mapping[str, Any],
+        sort: List[Tuple[str, int]],
+    ) -> None:
+        find_cmd: Dict[str, Any] = {"find": collection.name, "filter": filter}
+        if sort:
+            find_cmd["sort"] = dict(sort)
+        try:
+            result = await collection.database.command({"explain": find_cmd, "verbosity": "queryPlanner"})
+        except PyMongoError as exc:
+            self.logger.warning(f"Failed to explain query on {plan.collection}: {exc}")
+            self._decided.pop((plan.collection, plan.shape), None)
+            return
+        plan.stages = _plan_stages(result.get("queryPlanner", {}).get("winningPlan", {}))
+        if plan.problematic:
+            if self._suggest_indexes:
+                plan.suggestion = _suggest_index(filter, sort)
+            self._report(plan)
+
+    def _report(self, plan: QueryPlan) -> None:
+        problems = []
+        if plan.collection_scan:
+            problems.append("COLLSCAN")
+        if plan.in_memory_sort:
+            problems.append("in-memory SORT")
+        origins = ", ".join(sorted(plan.origins)) or "unknown"
+        message = f"Query on {plan.collection} from {origins} is doing {' and '.join(problems)}: {plan.shape}"
+        if plan.suggestion:
+            message += f" (suggested index: {plan.suggestion})"
+        self.logger.warning(message)
+
+    def report(self) -> List[Dict[str, Any]]:
+        """
+        Get all the sampled query shapes that do a collection scan or an in-memory sort.
+        """
+        return [plan.to_dict() for plan in self._decided.values() if plan is not None and plan.problematic]
+
+    def reset(self) -> None:
+        self._decided.clear()
+
+
+def sample_query(query: QueryT, origin: Optional[str] = None) -> QueryT:
+    """
+    Sample the plan of a Beanie find query (if the sampler is enabled) and return the query back.
+
+    If the origin is not provided, the currently running resolver will be used.
+    """
+    sampler = get_plan_sampler()
+    if sampler is None:
+        return query
+    if origin is None:
+        origin = _QUERY_ORIGIN.get()
+    sort = getattr(query, "sort_expressions", None) or []
+    sampler.observe(
+        query.document_model.get_motor_collection(),  # type: ignore
+        query.get_filter_query(),  # type: ignore
+        sort,
+        origin,
+    )
+    return query
+
+
+def create_plan_sampler(sample_rate: float, *, suggest_indexes: bool = True) -> QueryPlanSampler:
+    global _GLOBAL_PLAN_SAMPLER
+
+    _GLOBAL_PLAN_SAMPLER = QueryPlanSampler(sample_rate, suggest_indexes=suggest_indexes)
+    return _GLOBAL_PLAN_SAMPLER
+
+
+def get_plan_sampler() -> Optional[QueryPlanSampler]:
+    return _GLOBAL_PLAN_SAMPLER
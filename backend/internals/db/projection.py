@@ -0,0 +1,86 @@
+"""
+MIT License
+
+Copyright (c) 2022-present noaione
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+from __future__ import annotations
+
+from typing import Dict, FrozenSet, Iterable, Optional, Tuple, Type
+
+from beanie import Document
+from pydantic import BaseModel, Field, create_model
+
+from ._doc import _coerce_to_pendulum
+
+__all__ = ("create_projection",)
+
+
+class _ProjectionModel(BaseModel):
+    # Coerce the DateTime fields just like the full document, so both serialize the same way
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        _coerce_to_pendulum(self)  # type: ignore
+
+    class Config:
+        allow_population_by_field_name = True
+        arbitrary_types_allowed = True
+
+
+_PROJECTION_MODELS: Dict[Tuple[Type[Document], FrozenSet[str]], Type[BaseModel]] = {}
+
+
+def create_projection(document: Type[Document], fields: Iterable[str]) -> Type[BaseModel]:
+    """
+    Create a Beanie projection model for a document that only contains the requested fields.
+
+    Every field in the projection model is optional and defaults to `None` since the document data
+    is only partially fetched, and the `id` field is always included since we need it for the
+    pagination cursor.
+    The created model is cached per document and field set.
+    """
+
+    field_set = frozenset(fields) | {"id"}
+    cache_key = (document, field_set)
+    projection = _PROJECTION_MODELS.get(cache_key)
+    if projection is not None:
+        return projection
+
+    model_fields = {}
+    projected = {}
+    for name, field in document.__fields__.items():
+        # Keep every field so the model can be used in place of the document,
+        # but only ask MongoDB for the selected one.
+        model_fields[name] = (Optional[field.outer_type_], Field(None, alias=field.alias))
+        if name in field_set:
+            projected[field.alias] = 1
+
+    class Settings:
+        projection = projected
+
+    projection = create_model(
+        f"{document.__name__}Projection",
+        __base__=_ProjectionModel,
+        **model_fields,
+    )
+    projection.Settings = Settings  # type: ignore
+    _PROJECTION_MODELS[cache_key] = projection
+    return projection
@@ -0,0 +1,232 @@
+"""
+MIT License
+
+Copyright (c) 2022-present noaione
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+from __future__ import annotations
+
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, AsyncIterator, Dict, List, Optional, Tuple, Type, TypeVar
+
+from beanie import Document
+from beanie.odm.queries.find import FindMany
+from beanie.odm.utils.projection import get_projection
+from bson import Timestamp
+from pymongo.read_preferences import Primary, _ServerMode, make_read_preference, read_pref_mode_from_name
+
+from .client import get_database
+from .plans import current_query_origin, get_plan_sampler
+
+if TYPE_CHECKING:
+    from motor.core import AgnosticClientSession
+
+__all__ = (
+    "ReadRoute",
+    "RoutedFindMany",
+    "CausalTokenStore",
+    "parse_read_preference",
+    "find_routed",
+    "catalog_route",
+    "causal_write_session",
+)
+
+DocumentT = TypeVar("DocumentT", bound=Document)
+
+
+def parse_read_preference(name: Optional[str]) -> _ServerMode:
+    """
+    Parse read preference name like `secondaryPreferred` into the pymongo read preference object.
+    """
+    if not name:
+        return Primary()
+    try:
+        mode = read_pref_mode_from_name(name)
+    except (KeyError, ValueError):
+        raise ValueError(f"Invalid read preference: {name}")
+    return make_read_preference(mode, None)
+
+
+@dataclass
+class ReadRoute:
+    """Where a read query should be routed to, and which session should be used."""
+
+    read_preference: _ServerMode
+    session: Optional[AgnosticClientSession] = None
+
+
+class RoutedFindMany(FindMany):
+    """
+    A FindMany query that can be routed to a different read preference than the
+    one used by the document collection, and also run inside a client session.
+    """
+
+    _route: Optional[ReadRoute] = None
+    _origin: Optional[str] = None
+
+    def route(self, route: Optional[ReadRoute]) -> RoutedFindMany:
+        self._route = route
+        if route is not None and route.session is not None:
+            self.set_session(route.session)  # type: ignore
+        return self
+
+    def _routed_collection(self):
+        collection = self.document_model.get_motor_collection()
+        if self._route is None:
+            return collection
+        return collection.with_options(read_preference=self._route.read_preference)
+
+    def _sample_plan(self, sort: bool = True):
+        sampler = get_plan_sampler()
+        if sampler is not None:
+            sampler.observe(
+                self.document_model.get_motor_collection(),
+                self.get_filter_query(),
+                self.sort_expressions if sort else None,
+                self._origin,
+            )
+
+    @property
+    def motor_cursor(self):
+        self._sample_plan()
+        if self._route is None or self.fetch_links:
+            return super().motor_cursor
+        return self._routed_collection().find(
+            filter=self.get_filter_query(),
+            sort=self.sort_expressions,
+            projection=get_projection(self.projection_model),
+            skip=self.skip_number,
+            limit=self.limit_number,
+            session=self.session,
+            **self.pymongo_kwargs,
+        )
+
+    async def count(self) -> int:
+        self._sample_plan(sort=False)
+        return await self._routed_collection().count_documents(self.get_filter_query(), session=self.session)
+
+    def aggregate_routed(self, pipeline: List[Dict[str, Any]]):
+        """
+        Run the aggregation pipeline on the routed collection, with the find filter as the first stage.
+        """
+        self._sample_plan(sort=False)
+        return self._routed_collection().aggregate(
+            [{"$match": self.get_filter_query()}, *pipeline], session=self.session, **self.pymongo_kwargs
+        )
+
+
+def find_routed(
+    document: Type[DocumentT],
+    *args: Any,
+    route: Optional[ReadRoute] = None,
+    projection_model: Optional[Type[Any]] = None,
+) -> RoutedFindMany:
+    """
+    Same as `Document.find(...)` but the query is routed using the provided route.
+    """
+    query = RoutedFindMany(document_model=document).find_many(*args, projection_model=projection_model)
+    if get_plan_sampler() is not None:
+        # Remember the resolver so any bad query plan can be traced back to it
+        query._origin = current_query_origin()
+    return query.route(route)  # type: ignore
+
+
+class CausalTokenStore:
+    """
+    Store the latest cluster and operation time of each user writes.
+
+    This is used to continue a causally consistent session in the next request,
+    so any read to a secondary member will wait until it has caught up to the user writes.
+    The token is discarded after `ttl` seconds since the replication lag should be gone by then.
+    """
+
+    def __init__(self, ttl: float = 60.0) -> None:
+        self._ttl = ttl
+        self._tokens: Dict[str, Tuple[float, Dict[str, Any], Timestamp]] = {}
+
+    def _cleanup(self) -> None:
+        now = time.monotonic()
+        expired = [key for key, (expire_at, _, _) in self._tokens.items() if expire_at < now]
+        for key in expired:
+            self._tokens.pop(key, None)
+
+    def save(self, key: str, session: AgnosticClientSession) -> None:
+        cluster_time = session.cluster_time
+        operation_time = session.operation_time
+        if cluster_time is None or operation_time is None:
+            return
+        self._cleanup()
+        self._tokens[key] = (time.monotonic() + self._ttl, cluster_time, operation_time)
+
+    def get(self, key: str) -> Optional[Tuple[Dict[str, Any], Timestamp]]:
+        token = self._tokens.get(key)
+        if token is None:
+            return None
+        expire_at, cluster_time, operation_time = token
+        if expire_at < time.monotonic():
+            self._tokens.pop(key, None)
+            return None
+        return cluster_time, operation_time
+
+    def advance(self, key: str, session: AgnosticClientSession) -> bool:
+        token = self.get(key)
+        if token is None:
+            return False
+        cluster_time, operation_time = token
+        session.advance_cluster_time(cluster_time)
+        session.advance_operation_time(operation_time)
+        return True
+
+
+_CAUSAL_TOKENS = CausalTokenStore()
+
+
+@asynccontextmanager
+async def catalog_route(user_key: Optional[str] = None) -> AsyncIterator[ReadRoute]:
+    """
+    Create a read route for catalog queries that tolerate slight staleness.
+
+    If the user just did some writes, the read will be done inside a causally consistent
+    session that continue from the user last write, so they can still read their own writes.
+    """
+    kfdb = get_database()
+    read_preference = parse_read_preference(kfdb.catalog_read_preference)
+    if user_key is None or _CAUSAL_TOKENS.get(user_key) is None:
+        yield ReadRoute(read_preference=read_preference)
+        return
+
+    async with await kfdb.client.start_session(causal_consistency=True) as session:
+        _CAUSAL_TOKENS.advance(user_key, session)
+        yield ReadRoute(read_preference=read_preference, session=session)
+
+
+@asynccontextmanager
+async def causal_write_session(user_key: str) -> AsyncIterator[AgnosticClientSession]:
+    """
+    Start a causally consistent session for writes, and remember the session
+    cluster and operation time for the next catalog reads from the same user.
+    """
+    async with await get_database().client.start_session(causal_consistency=True) as session:
+        _CAUSAL_TOKENS.advance(user_key, session)
+        yield session
+        _CAUSAL_TOKENS.save(user_key, session)
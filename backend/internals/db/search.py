@@ -0,0 +1,82 @@
+"""
+MIT License
+
+Copyright (c) 2022-present noaione
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+from __future__ import annotations
+
+from typing import Any, List, Literal, Optional, Tuple, Type
+
+from beanie.odm.utils.projection import get_projection
+from bson import ObjectId
+
+from .routing import RoutedFindMany
+
+__all__ = (
+    "SearchMode",
+    "TextCursor",
+    "find_text_page",
+)
+
+SearchMode = Literal["text", "regex"]
+TextCursor = Tuple[float, ObjectId]
+_SCORE_FIELD = "_score"
+
+
+async def find_text_page(
+    query: RoutedFindMany,
+    *,
+    limit: int,
+    cursor: Optional[TextCursor] = None,
+    projection_model: Optional[Type[Any]] = None,
+) -> List[Tuple[float, Any]]:
+    """
+    Fetch a page of a `$text` query, sorted by the relevance score.
+
+    The `_id` is used as a tie breaker so a page boundary between documents with
+    the same score is stable. The cursor is inclusive, like the other paginated queries.
+
+    Returns the list of `(score, document)`.
+    """
+    pipeline: List[dict] = [{"$addFields": {_SCORE_FIELD: {"$meta": "textScore"}}}]
+    if cursor is not None:
+        score, obj_id = cursor
+        pipeline.append(
+            {
+                "$match": {
+                    "$or": [
+                        {_SCORE_FIELD: {"$lt": score}},
+                        {_SCORE_FIELD: score, "_id": {"$gte": obj_id}},
+                    ]
+                }
+            }
+        )
+    pipeline.append({"$sort": {_SCORE_FIELD: -1, "_id": 1}})
+    pipeline.append({"$limit": limit})
+    if projection_model is not None:
+        projection = get_projection(projection_model)
+        if projection:
+            pipeline.append({"$project": {**projection, _SCORE_FIELD: 1}})
+
+    model = projection_model or query.document_model
+    results = await query.aggregate_routed(pipeline).to_list(length=None)
+    return [(result.pop(_SCORE_FIELD), model.parse_obj(result)) for result in results]
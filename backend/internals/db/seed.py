@@ -0,0 +1,378 @@
+"""
+MIT License
+
+Copyright (c) 2022-present noaione
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+import struct
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from itertools import accumulate
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Set, Tuple
+from uuid import UUID
+
+from bson import Binary, DBRef, ObjectId
+
+from internals.enums import ApprovalStatus, ItemType, OrderStatus, UserType
+
+from .counters import reconcile_counters
+from .models import FoodItem, FoodOrder, Merchant, User
+
+if TYPE_CHECKING:
+    from motor.core import AgnosticCollection
+
+__all__ = (
+    "SeedResult",
+    "seed_database",
+)
+
+logger = logging.getLogger("KidoFood.Database.Seed")
+_ADJECTIVES = (
+    "Spicy Golden Crispy Sweet Savory Fresh Smoky Tangy Hearty Green "
+    "Royal Little Happy Sunny Midnight Rustic Urban Lucky Humble Classic"
+).split()
+_NOUNS = (
+    "Kitchen Bistro Corner Garden Diner Wok Grill Bakery Canteen Table "
+    "Spoon Pantry House Cafe Eatery Stall Noodles Express Oven Market"
+).split()
+_DISHES = {
+    ItemType.MEAL: ["Fried Rice", "Chicken Satay", "Beef Rendang", "Noodle Soup", "Grilled Fish", "Curry", "Burger"],
+    ItemType.DRINK: ["Iced Tea", "Lemonade", "Coffee", "Milkshake", "Orange Juice", "Coconut Water", "Matcha Latte"],
+    ItemType.PACKAGE: ["Family Bundle", "Lunch Box", "Party Platter", "Combo Set", "Breakfast Set", "Snack Box"],
+}
+_STREETS = ["Jalan Merdeka", "Jalan Sudirman", "Jalan Thamrin", "Jalan Gatot Subroto", "Jalan Diponegoro"]
+_PAYMENT_METHODS = ["card", "ewallet", "bank_transfer", "cash"]
+# Orders are mostly placed around lunch and dinner, in Jakarta time (UTC+7, no DST)
+_LOCAL_TZ = timezone(timedelta(hours=7), "Asia/Jakarta")
+_ORDER_HOURS = list(range(24))
+_ORDER_HOUR_WEIGHTS = [1, 1, 0, 0, 0, 1, 2, 4, 5, 4, 6, 10, 12, 9, 5, 4, 5, 8, 11, 12, 9, 6, 3, 2]
+# Status for finished orders, the rest are still in progress
+_FINISHED_STATUSES = [
+    OrderStatus.DONE,
+    OrderStatus.CANCELLED,
+    OrderStatus.REJECTED,
+    OrderStatus.CANCELED_MERCHANT,
+    OrderStatus.PROBLEM_FAIL_TO_DELIVER,
+]
+_FINISHED_WEIGHTS = [90, 5, 2, 2, 1]
+_ACTIVE_STATUSES = [
+    OrderStatus.PENDING,
+    OrderStatus.FORWARDED,
+    OrderStatus.ACCEPTED,
+    OrderStatus.PROCESSING,
+    OrderStatus.DELIVERING,
+]
+_APPROVAL_STATUSES = [ApprovalStatus.APPROVED, ApprovalStatus.PENDING, ApprovalStatus.REJECTED]
+_APPROVAL_WEIGHTS = [85, 10, 5]
+_ITEM_TYPES = [ItemType.MEAL, ItemType.DRINK, ItemType.PACKAGE]
+_ITEM_TYPE_WEIGHTS = [60, 30, 10]
+
+
+@dataclass
+class SeedResult:
+    merchants: int = 0
+    items: int = 0
+    users: int = 0
+    orders: int = 0
+
+
+# A compact item info kept in memory to build the order lines
+_ItemInfo = Tuple[ObjectId, Binary, str, float, str]
+
+
+class _BatchWriter:
+    """
+    Buffer the documents and write them with `insert_many`, keeping a few batches in flight.
+    """
+
+    def __init__(self, collection: AgnosticCollection, batch_size: int, concurrency: int) -> None:
+        self._collection = collection
+        self._batch_size = batch_size
+        self._buffer: List[Dict[str, Any]] = []
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._tasks: Set[asyncio.Task] = set()
+        # The first failed write, kept here since the finished task is discarded right away
+        self._error: Optional[BaseException] = None
+        self.written = 0
+
+    async def _write(self, documents: List[Dict[str, Any]]) -> None:
+        try:
+            await self._collection.insert_many(documents, ordered=False, bypass_document_validation=True)
+            self.written += len(documents)
+        except Exception as exc:
+            if self._error is None:
+                self._error = exc
+        finally:
+            self._semaphore.release()
+
+    def _raise_error(self) -> None:
+        if self._error is not None:
+            raise self._error
+
+    async def add(self, document: Dict[str, Any]) -> None:
+        self._buffer.append(document)
+        if len(self._buffer) >= self._batch_size:
+            await self.flush()
+
+    async def flush(self) -> None:
+        if not self._buffer:
+            return
+        documents, self._buffer = self._buffer, []
+        await self._semaphore.acquire()
+        task = asyncio.create_task(self._write(documents))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        # Re-raise any failed write early
+        self._raise_error()
+
+    async def close(self) -> None:
+        await self.flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks)
+        self._raise_error()
+
+
+class _Generator:
+    def __init__(self, seed: int, now: datetime, days: int) -> None:
+        self.rng = random.Random(seed)
+        self.now = now
+        self.days = days
+
+    def object_id(self, at: datetime) -> ObjectId:
+        # Same layout as a normal ObjectId (timestamp + random), but from the seeded random
+        return ObjectId(struct.pack(">I", int(at.timestamp())) + self.rng.getrandbits(64).to_bytes(8, "big"))
+
+    def uuid(self) -> Binary:
+        return Binary.from_uuid(UUID(int=self.rng.getrandbits(128), version=4))
+
+    def past_time(self) -> datetime:
+        # Skewed to recent days, like a growing service
+        days_ago = min(int(self.rng.expovariate(3.0 / self.days)), self.days - 1)
+        hour = self.rng.choices(_ORDER_HOURS, _ORDER_HOUR_WEIGHTS)[0]
+        local_now = self.now.astimezone(_LOCAL_TZ)
+        day = (local_now - timedelta(days=days_ago)).replace(hour=hour, minute=0, second=0, microsecond=0)
+        moment = (day + timedelta(seconds=self.rng.randrange(3600))).astimezone(timezone.utc)
+        return min(moment, self.now)
+
+    def address(self) -> str:
+        return f"{self.rng.choice(_STREETS)} No. {self.rng.randint(1, 250)}, Jakarta"
+
+    def merchant_name(self) -> str:
+        return f"{self.rng.choice(_ADJECTIVES)} {self.rng.choice(_NOUNS)}"
+
+
+async def seed_database(
+    merchants: int = 100,
+    items_per_merchant: int = 50,
+    users: int = 1000,
+    orders: int = 10000,
+    *,
+    password_hash: str,
+    seed: int = 0,
+    days: int = 365,
+    batch_size: int = 5000,
+    concurrency: int = 4,
+) -> SeedResult:
+    """
+    Fill the database with synthetic merchants, items, users and orders.
+
+    The generated data is the same for the same `seed` (except the current time it's relative to),
+    every user shares the same `password_hash` since hashing is too slow to do per user.
+    The counters are reconciled at the end so the totals include the seeded data.
+    """
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    gen = _Generator(seed, now, max(days, 1))
+    rng = gen.rng
+    result = SeedResult()
+
+    merchant_coll = Merchant.get_motor_collection()
+    items_coll = FoodItem.get_motor_collection()
+    users_coll = User.get_motor_collection()
+    orders_coll = FoodOrder.get_motor_collection()
+
+    merchant_writer = _BatchWriter(merchant_coll, batch_size, concurrency)
+    items_writer = _BatchWriter(items_coll, batch_size, concurrency)
+    users_writer = _BatchWriter(users_coll, batch_size, concurrency)
+    orders_writer = _BatchWriter(orders_coll, batch_size, concurrency)
+
+    logger.info(f"Seeding {merchants} merchants with {items_per_merchant} items each...")
+    merchant_items: List[Tuple[ObjectId, List[_ItemInfo]]] = []
+    for idx in range(merchants):
+        created_at = gen.past_time()
+        merchant_id = gen.object_id(created_at)
+        name = gen.merchant_name()
+        approved = rng.choices(_APPROVAL_STATUSES, _APPROVAL_WEIGHTS)[0]
+        await merchant_writer.add(
+            {
+                "_id": merchant_id,
+                "merchant_id": gen.uuid(),
+                "name": name,
+                "description": f"{name} serving home-made food since {created_at.year}",
+                "address": gen.address(),
+                "avatar": {"key": "", "format": ""},
+                "approved": approved.value,
+                "phone": f"+628{rng.randrange(10**9, 10**10)}",
+                "email": f"seed{seed}.merchant{idx}@example.com",
+                "website": None,
+                "created_at": created_at,
+                "updated_at": created_at,
+            }
+        )
+        # The merchant owner account
+        await users_writer.add(
+            {
+                "_id": gen.object_id(created_at),
+                "user_id": gen.uuid(),
+                "name": f"{name} Owner",
+                "email": f"seed{seed}.owner{idx}@example.com",
+                "password": password_hash,
+                "type": UserType.MERCHANT.value,
+                "address": [],
+                "avatar": {"key": "", "format": ""},
+                "merchant": DBRef(merchant_coll.name, merchant_id),
+                "created_at": created_at,
+                "updated_at": created_at,
+            }
+        )
+
+        item_infos: List[_ItemInfo] = []
+        for _ in range(items_per_merchant):
+            item_type = rng.choices(_ITEM_TYPES, _ITEM_TYPE_WEIGHTS)[0]
+            item_name = f"{rng.choice(_ADJECTIVES)} {rng.choice(_DISHES[item_type])}"
+            price = float(rng.randrange(5, 150) * 1000)
+            item_created = created_at + (now - created_at) * rng.random() * 0.1
+            item_oid = gen.object_id(item_created)
+            item_uuid = gen.uuid()
+            await items_writer.add(
+                {
+                    "_id": item_oid,
+                    "item_id": item_uuid,
+                    "name": item_name,
+                    "description": f"{item_name} from {name}",
+                    "stock": rng.randrange(0, 200),
+                    "price": price,
+                    "type": item_type.value,
+                    "avatar": {"key": "", "format": ""},
+                    "merchant": DBRef(merchant_coll.name, merchant_id),
+                    "created_at": item_created,
+                    "updated_at": item_created,
+                }
+            )
+            item_infos.append((item_oid, item_uuid, item_name, price, item_type.value))
+        merchant_items.append((merchant_id, item_infos))
+    await merchant_writer.close()
+    await items_writer.close()
+    result.merchants = merchant_writer.written
+    result.items = items_writer.written
+
+    logger.info(f"Seeding {users} customers...")
+    customer_ids: List[Tuple[ObjectId, datetime]] = []
+    for idx in range(users):
+        created_at = gen.past_time()
+        user_oid = gen.object_id(created_at)
+        await users_writer.add(
+            {
+                "_id": user_oid,
+                "user_id": gen.uuid(),
+                "name": f"Customer {idx}",
+                "email": f"seed{seed}.user{idx}@example.com",
+                "password": password_hash,
+                "type": UserType.CUSTOMER.value,
+                "address": [gen.address() for _ in range(rng.randint(1, 2))],
+                "avatar": {"key": "", "format": ""},
+                "merchant": None,
+                "created_at": created_at,
+                "updated_at": created_at,
+            }
+        )
+        customer_ids.append((user_oid, created_at))
+    await users_writer.close()
+    result.users = users_writer.written
+
+    # Only merchant with items can get an order
+    orderable = [(merchant_id, infos) for merchant_id, infos in merchant_items if infos]
+    if not orderable or not customer_ids:
+        orders = 0
+    logger.info(f"Seeding {orders} orders...")
+    # Some merchants are a lot more popular than the others
+    popularity = list(accumulate(1.0 / (rank + 1) for rank in range(len(orderable))))
+    for _ in range(orders):
+        created_at = gen.past_time()
+        user_oid, _ = rng.choice(customer_ids)
+        merchant_id, item_infos = rng.choices(orderable, cum_weights=popularity)[0]
+        lines: List[Dict[str, Any]] = []
+        amount = 0.0
+        for item_oid, item_uuid, item_name, price, item_type in rng.sample(
+            item_infos, min(len(item_infos), rng.randint(1, 4))
+        ):
+            quantity = rng.randint(1, 3)
+            amount += price * quantity
+            lines.append(
+                {
+                    "data": DBRef(items_coll.name, item_oid),
+                    "quantity": quantity,
+                    "snapshot": {
+                        "item_id": item_uuid,
+                        "name": item_name,
+                        "price": price,
+                        "type": item_type,
+                        "avatar": {"key": "", "format": ""},
+                    },
+                }
+            )
+        # Anything older than a few hours should be finished by now
+        if now - created_at > timedelta(hours=3):
+            status = rng.choices(_FINISHED_STATUSES, _FINISHED_WEIGHTS)[0]
+            updated_at = created_at + timedelta(minutes=rng.randint(15, 90))
+        else:
+            status = rng.choice(_ACTIVE_STATUSES)
+            updated_at = created_at + (now - created_at) * rng.random()
+        await orders_writer.add(
+            {
+                "_id": gen.object_id(created_at),
+                "order_id": gen.uuid(),
+                "items": lines,
+                "user": DBRef(users_coll.name, user_oid),
+                "rider": None,
+                "merchant": DBRef(merchant_coll.name, merchant_id),
+                "status": status.value,
+                "target_address": gen.address(),
+                "receipt": {
+                    "pay_id": gen.uuid(),
+                    "method": rng.choice(_PAYMENT_METHODS),
+                    "amount": amount,
+                    "data": "seed",
+                },
+                "created_at": created_at,
+                "updated_at": min(updated_at, now),
+            }
+        )
+    await orders_writer.close()
+    result.orders = orders_writer.written
+
+    logger.info("Reconciling counters...")
+    await reconcile_counters()
+    return result
@@ -0,0 +1,224 @@
+"""
+MIT License
+
+Copyright (c) 2022-present noaione
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from functools import partial
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Mapping, Optional, Type
+
+from beanie import Document
+from pymongo.errors import OperationFailure, PyMongoError
+
+from internals.pubsub import get_pubsub
+
+from .models import FoodItem, FoodOrder, Merchant
+
+if TYPE_CHECKING:
+    from motor.core import AgnosticDatabase
+
+__all__ = (
+    "ChangeStreamWatcher",
+    "create_change_watcher",
+    "get_change_watcher",
+)
+
+logger = logging.getLogger("KidoFood.Database.Watcher")
+# Change streams are only supported on replica set or sharded cluster.
+_CHANGE_STREAM_UNSUPPORTED = (40573, 40324)
+# The resume token is too old and no longer exists in the oplog.
+_CHANGE_STREAM_HISTORY_LOST = (136, 280, 286)
+_WATCH_PIPELINE = [{"$match": {"operationType": {"$in": ["insert", "update", "replace"]}}}]
+
+
+@dataclass
+class WatchedCollection:
+    name: str
+    """The name used for the resume token"""
+    document: Type[Document]
+    topic: Callable[[Document], str]
+    """Create the pubsub topic for the changed document"""
+
+
+WATCHABLE_COLLECTIONS: Dict[str, WatchedCollection] = {
+    "orders": WatchedCollection("orders", FoodOrder, lambda doc: f"order:updated:{doc.order_id}"),  # type: ignore
+    "items": WatchedCollection("items", FoodItem, lambda doc: f"item:updated:{doc.item_id}"),  # type: ignore
+    "merchants": WatchedCollection(
+        "merchants", Merchant, lambda doc: f"merchant:updated:{doc.merchant_id}"  # type: ignore
+    ),
+}
+
+
+class ChangeStreamWatcher:
+    """
+    Tail the collections change stream and publish every changed document to the pubsub,
+    so changes made outside of this process (scripts, bulk updates, other services) reach
+    the subscribers too.
+
+    The resume token is saved to the database so we can continue from where we stopped
+    after a restart.
+    """
+
+    def __init__(
+        self,
+        database: AgnosticDatabase,
+        collections: List[str],
+        *,
+        token_collection: str = "ChangeStreamTokens",
+        flush_interval: float = 1.0,
+        retry_delay: float = 5.0,
+    ):
+        self._database = database
+        self._watched = [WATCHABLE_COLLECTIONS[name] for name in collections]
+        self._tokens = database[token_collection]
+        self._flush_interval = flush_interval
+        self._retry_delay = retry_delay
+
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._pending_tokens: Dict[str, Mapping[str, Any]] = {}
+        self._last_flush: Dict[str, float] = {}
+
+    @property
+    def running(self) -> bool:
+        return any(not task.done() for task in self._tasks.values())
+
+    async def _load_token(self, name: str) -> Optional[Mapping[str, Any]]:
+        saved = await self._tokens.find_one({"_id": name})
+        if saved is None:
+            return None
+        return saved.get("token")
+
+    async def _save_token(self, name: str, *, force: bool = False) -> None:
+        token = self._pending_tokens.get(name)
+        if token is None:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_flush.get(name, 0.0) < self._flush_interval:
+            return
+        self._pending_tokens.pop(name, None)
+        self._last_flush[name] = now
+        try:
+            await self._tokens.update_one({"_id": name}, {"$set": {"token": token}}, upsert=True)
+        except PyMongoError as exc:
+            logger.warning(f"Watcher<{name}>: Failed to save resume token: {exc}")
+
+    async def _clear_token(self, name: str) -> None:
+        self._pending_tokens.pop(name, None)
+        await self._tokens.delete_one({"_id": name})
+
+    def _publish(self, watched: WatchedCollection, change: Mapping[str, Any]) -> None:
+        full_document = change.get("fullDocument")
+        if full_document is None:
+            # Document got deleted before we manage to look it up
+            return
+        document = watched.document.parse_obj(full_document)
+        get_pubsub().publish(watched.topic(document), document)
+
+    async def _watch(self, watched: WatchedCollection) -> None:
+        collection = watched.document.get_motor_collection()
+        is_orders = watched.document is FoodOrder
+        while True:
+            resume_token = await self._load_token(watched.name)
+            try:
+                async with collection.watch(
+                    _WATCH_PIPELINE, full_document="updateLookup", resume_after=resume_token
+                ) as stream:
+                    logger.info(f"Watcher<{watched.name}>: Watching change stream...")
+                    if is_orders:
+                        # The stream now takes care of publishing the order changes
+                        FoodOrder.publish_on_save = False
+                    async for change in stream:
+                        try:
+                            self._publish(watched, change)
+                        except Exception:
+                            # Skip the bad document (e.g. failed validation), but keep watching
+                            logger.exception(f"Watcher<{watched.name}>: Failed to publish change, skipping")
+                        self._pending_tokens[watched.name] = stream.resume_token
+                        await self._save_token(watched.name)
+            except asyncio.CancelledError:
+                await self._save_token(watched.name, force=True)
+                raise
+            except OperationFailure as exc:
+                if exc.code in _CHANGE_STREAM_UNSUPPORTED:
+                    logger.warning(
+                        f"Watcher<{watched.name}>: Change stream is not supported by the server, "
+                        "falling back to publishing on save"
+                    )
+                    FoodOrder.publish_on_save = True
+                    return
+                if exc.code in _CHANGE_STREAM_HISTORY_LOST:
+                    logger.warning(f"Watcher<{watched.name}>: Resume token expired, starting from now")
+                    await self._clear_token(watched.name)
+                    continue
+                logger.error(f"Watcher<{watched.name}>: Change stream failed, retrying: {exc}")
+            except PyMongoError as exc:
+                logger.error(f"Watcher<{watched.name}>: Change stream failed, retrying: {exc}")
+            await self._save_token(watched.name, force=True)
+            await asyncio.sleep(self._retry_delay)
+
+    def _on_task_done(self, watched: WatchedCollection, task: asyncio.Task) -> None:
+        if task.cancelled():
+            return
+        exc = task.exception()
+        if exc is not None:
+            logger.error(f"Watcher<{watched.name}>: Stopped unexpectedly", exc_info=exc)
+        if watched.document is FoodOrder:
+            # Nobody is publishing the order changes anymore
+            FoodOrder.publish_on_save = True
+
+    def start(self) -> None:
+        for watched in self._watched:
+            if watched.name in self._tasks:
+                continue
+            task = asyncio.create_task(self._watch(watched), name=f"kidofood-watcher-{watched.name}")
+            task.add_done_callback(partial(self._on_task_done, watched))
+            self._tasks[watched.name] = task
+
+    async def close(self) -> None:
+        for task in self._tasks.values():
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        self._tasks.clear()
+        FoodOrder.publish_on_save = True
+
+
+_GLOBAL_WATCHER: Optional[ChangeStreamWatcher] = None
+
+
+def create_change_watcher(database: AgnosticDatabase, collections: List[str], **kwargs: Any) -> ChangeStreamWatcher:
+    global _GLOBAL_WATCHER
+
+    unknown = [name for name in collections if name not in WATCHABLE_COLLECTIONS]
+    if unknown:
+        raise ValueError(f"Unknown change stream collections: {', '.join(unknown)}")
+    if _GLOBAL_WATCHER is None:
+        _GLOBAL_WATCHER = ChangeStreamWatcher(database, collections, **kwargs)
+    return _GLOBAL_WATCHER
+
+
+def get_change_watcher() -> Optional[ChangeStreamWatcher]:
+    return _GLOBAL_WATCHER
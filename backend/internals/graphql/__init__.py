@@ -10,8 +10,13 @@ Contains all of the GraphQL schema and mutations
 from . import models
 from .client import *
 from .context import *
+from .cost import *
+from .extensions import *
 from .mutations import *
+from .persisted import *
 from .resolvers import *
+from .response_cache import *
 from .router import *
 from .scalars import *
+from .selections import *
 from .subscriptions import *
@@ -32,13 +32,16 @@ from strawberry.file_uploads import Upload
 from strawberry.types import Info
 
 from internals.db import Merchant as MerchantDB
+from internals.db import catalog_route, causal_write_session, get_database
 from internals.session import UserSession
 
 from .context import KidoFoodContext
 from .enums import ApprovalStatusGQL, OrderStatusGQL, UserTypeGQL
+from .extensions import DocumentCacheExtension, QueryCostExtension, QueryOriginExtension, TracingExtension
 from .models import (
     Connection,
     FoodItemGQL,
+    FoodItemImportGQL,
     FoodItemInputGQL,
     FoodOrderGQL,
     FoodOrderItemInputGQL,
@@ -50,6 +53,7 @@ from .models import (
 )
 from .mutations import (
     mutate_apply_new_merchant,
+    mutate_bulk_new_food_items,
     mutate_login_user,
     mutate_make_new_order,
     mutate_new_food_item,
@@ -61,11 +65,13 @@ from .mutations import (
 from .resolvers import (
     Cursor,
     SortDirection,
+    SortField,
     resolve_food_items_paginated,
     resolve_food_order_paginated,
     resolve_merchant_paginated,
     resolve_user_from_db,
 )
+from .response_cache import ITEM_LIST_TAG, MERCHANT_LIST_TAG, merchant_items_tag, merchant_tag
 from .scalars import UUID as UUID2
 from .scalars import Upload as UploadGQL
 from .subscriptions import subs_order_update
@@ -78,6 +84,31 @@ __all__ = (
 )
 
 
+def _user_key(info: Info[KidoFoodContext, None]) -> Optional[str]:
+    user = info.context.user
+    return user.user_id if user is not None else None
+
+
+def _tag_merchants(
+    info: Info[KidoFoodContext, None], results: Connection[MerchantGQL], listing: bool
+) -> Connection[MerchantGQL]:
+    if listing:
+        info.context.add_cache_tags(MERCHANT_LIST_TAG)
+    info.context.add_cache_tags(*(merchant_tag(node.merchant_id) for node in results.nodes))
+    return results
+
+
+def _tag_items(
+    info: Info[KidoFoodContext, None], results: Connection[FoodItemGQL], listing: bool
+) -> Connection[FoodItemGQL]:
+    if listing:
+        info.context.add_cache_tags(ITEM_LIST_TAG)
+    info.context.add_cache_tags(
+        *(merchant_items_tag(node.merchant_id) for node in results.nodes if node.merchant_id is not None)
+    )
+    return results
+
+
 @gql.type(description="Simple result of mutation")
 class Result:
     success: bool = gql.field(description="Success status")
@@ -86,31 +117,70 @@ class Result:
 
 @gql.type(description="Search for items on specific fields")
 class QuerySearch:
-    @gql.field(description="Search for merchants by name")
+    @gql.field(
+        description=(
+            "Search for merchants by name, sorted by relevance when the text search is enabled on the server "
+            "and `sortBy` is `ID`"
+        ),
+        metadata={"cost": 1},
+    )
     async def merchants(
         self,
+        info: Info[KidoFoodContext, None],
         query: str,
         limit: int = 20,
         cursor: Optional[Cursor] = gql.UNSET,
         sort: SortDirection = SortDirection.ASC,
+        sort_by: SortField = SortField.ID,
         status: list[ApprovalStatusGQL] = [ApprovalStatusGQL.APPROVED],
     ) -> Connection[MerchantGQL]:
-        return await resolve_merchant_paginated(query=query, limit=limit, cursor=cursor, sort=sort, status=status)
-
-    @gql.field(description="Search for food items by name")
+        async with catalog_route(_user_key(info)) as route:
+            results = await resolve_merchant_paginated(
+                query=query,
+                limit=limit,
+                cursor=cursor,
+                sort=sort,
+                sort_by=sort_by,
+                status=status,
+                info=info,
+                route=route,
+                search_mode=get_database().search_mode,
+            )
+        return _tag_merchants(info, results, listing=True)
+
+    @gql.field(
+        description=(
+            "Search for food items by name, sorted by relevance when the text search is enabled on the server "
+            "and `sortBy` is `ID`"
+        ),
+        metadata={"cost": 1},
+    )
     async def items(
         self,
+        info: Info[KidoFoodContext, None],
         query: str,
         limit: int = 20,
         cursor: Optional[Cursor] = gql.UNSET,
         sort: SortDirection = SortDirection.ASC,
+        sort_by: SortField = SortField.ID,
     ) -> Connection[FoodItemGQL]:
-        return await resolve_food_items_paginated(query=query, limit=limit, cursor=cursor, sort=sort)
+        async with catalog_route(_user_key(info)) as route:
+            results = await resolve_food_items_paginated(
+                query=query,
+                limit=limit,
+                cursor=cursor,
+                sort=sort,
+                sort_by=sort_by,
+                info=info,
+                route=route,
+                search_mode=get_database().search_mode,
+            )
+        return _tag_items(info, results, listing=True)
 
 
 @gql.type
 class Query:
-    @gql.field(description="Get the current user")
+    @gql.field(description="Get the current user", metadata={"cost": 1})
     async def user(self, info: Info[KidoFoodContext, None]) -> UserGQL:
         if info.context.user is None:
             raise Exception("You are not logged in")
@@ -118,38 +188,54 @@ class Query:
         user = await resolve_user_from_db(UserGQL.from_session(info.context.user))
         return UserGQL.from_db(user)
 
-    @gql.field(description="Get single or multiple merchants")
+    @gql.field(description="Get single or multiple merchants", metadata={"cost": 1})
     async def merchants(
         self,
+        info: Info[KidoFoodContext, None],
         id: Optional[list[gql.ID]] = gql.UNSET,
         limit: int = 20,
         cursor: Optional[Cursor] = gql.UNSET,
         sort: SortDirection = SortDirection.ASC,
+        sort_by: SortField = SortField.ID,
         status: list[ApprovalStatusGQL] = [ApprovalStatusGQL.APPROVED],
     ) -> Connection[MerchantGQL]:
-        return await resolve_merchant_paginated(id=id, limit=limit, cursor=cursor, sort=sort, status=status)
-
-    @gql.field(description="Get single or multiple food items")
+        async with catalog_route(_user_key(info)) as route:
+            results = await resolve_merchant_paginated(
+                id=id, limit=limit, cursor=cursor, sort=sort, sort_by=sort_by, status=status, info=info, route=route
+            )
+        # Merchants fetched by their ids can only change when one of them is updated
+        return _tag_merchants(info, results, listing=not id)
+
+    @gql.field(description="Get single or multiple food items", metadata={"cost": 1})
     async def items(
         self,
+        info: Info[KidoFoodContext, None],
         id: Optional[list[gql.ID]] = gql.UNSET,
         limit: int = 20,
         cursor: Optional[Cursor] = gql.UNSET,
         sort: SortDirection = SortDirection.ASC,
+        sort_by: SortField = SortField.ID,
     ) -> Connection[FoodItemGQL]:
-        return await resolve_food_items_paginated(id=id, limit=limit, cursor=cursor, sort=sort)
+        async with catalog_route(_user_key(info)) as route:
+            results = await resolve_food_items_paginated(
+                id=id, limit=limit, cursor=cursor, sort=sort, sort_by=sort_by, info=info, route=route
+            )
+        return _tag_items(info, results, listing=not id)
 
-    @gql.field(description="Get single or multiple food orders")
+    @gql.field(description="Get single or multiple food orders", metadata={"cost": 1})
     async def orders(
         self,
+        info: Info[KidoFoodContext, None],
         id: Optional[list[gql.ID]] = gql.UNSET,
         limit: int = 20,
         cursor: Optional[Cursor] = gql.UNSET,
         sort: SortDirection = SortDirection.ASC,
     ) -> Connection[FoodOrderGQL]:
-        return await resolve_food_order_paginated(id=id, limit=limit, cursor=cursor, sort=sort)
+        return await resolve_food_order_paginated(id=id, limit=limit, cursor=cursor, sort=sort, info=info)
 
-    search: QuerySearch = gql.field(description="Search for items on specific fields")
+    @gql.field(description="Search for items on specific fields")
+    def search(self) -> QuerySearch:
+        return QuerySearch()
 
 
 ItemResult = gql.union(
@@ -161,6 +247,11 @@ MerchantResult = gql.union(
 OrderResult = gql.union(
     "OrderResult", (Result, FoodOrderGQL), description="Either `FoodOrder` if success or `Result` if failure detected"
 )
+ItemImportResult = gql.union(
+    "ItemImportResult",
+    (Result, FoodItemImportGQL),
+    description="Either `FoodItemImport` if success or `Result` if failure detected",
+)
 UserResult = gql.union(
     "UserResult", (Result, UserGQL), description="Either `User` if success or `Result` if failure detected"
 )
@@ -238,11 +329,13 @@ class Mutation:
         if info.context.user is None:
             raise Exception("You are not logged in")
         user = UserGQL.from_session(info.context.user)
-        is_success, update_merchant = await mutate_update_merchant(
-            id=id,
-            user=user,
-            merchant=merchant,
-        )
+        async with causal_write_session(str(user.id)) as session:
+            is_success, update_merchant = await mutate_update_merchant(
+                id=id,
+                user=user,
+                merchant=merchant,
+                session=session,
+            )
         if not is_success and isinstance(update_merchant, str):
             return Result(success=False, message=update_merchant)
         return MerchantGQL.from_db(cast(MerchantDB, update_merchant))
@@ -306,11 +399,27 @@ class Mutation:
         if info.context.user is None:
             raise Exception("You are not logged in")
         user = UserGQL.from_session(info.context.user)
-        _, item_or_str = await mutate_new_food_item(user, item)
+        async with causal_write_session(str(user.id)) as session:
+            _, item_or_str = await mutate_new_food_item(user, item, session=session)
         if isinstance(item_or_str, str):
             return Result(success=False, message=item_or_str)
         return item_or_str
 
+    @gql.mutation(description="Create multiple food items at once, image upload is not supported")
+    async def create_items(
+        self,
+        info: Info[KidoFoodContext, None],
+        items: list[FoodItemInputGQL],
+        ordered: bool = False,
+    ) -> ItemImportResult:
+        if info.context.user is None:
+            raise Exception("You are not logged in")
+        user = UserGQL.from_session(info.context.user)
+        _, result_or_str = await mutate_bulk_new_food_items(user, items, ordered=ordered)
+        if isinstance(result_or_str, str):
+            return Result(success=False, message=result_or_str)
+        return result_or_str
+
 
 @gql.type
 class Subscription:
@@ -319,6 +428,8 @@ class Subscription:
         if info.context.user is None:
             raise Exception("You are not logged in")
         async for order in subs_order_update(id):
+            # The context lives as long as the websocket, so don't serve stale relations
+            info.context.loaders.clear()
             yield order
 
 
@@ -341,6 +452,7 @@ if _has_any_function_or_attr(Subscription):
 
 schema = gql.Schema(
     **_schema_params,
+    extensions=[DocumentCacheExtension, QueryCostExtension, QueryOriginExtension, TracingExtension],
     scalar_overrides={
         UUID: UUID2,
         Upload: UploadGQL,
@@ -24,17 +24,43 @@ SOFTWARE.
 
 from __future__ import annotations
 
-from typing import Optional
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional, Set
 
 from strawberry.fastapi import BaseContext
 
 from internals.session import SessionHandler, UserSession
 
+from .loaders import KidoFoodLoaders
+
 __all__ = ("KidoFoodContext",)
 
+# Tags of the operation being executed, the batched operations share the same context
+_OPERATION_CACHE_TAGS: ContextVar[Optional[Set[str]]] = ContextVar("kidofood_operation_cache_tags", default=None)
+
 
 class KidoFoodContext(BaseContext):
     def __init__(self, session: SessionHandler, user: Optional[UserSession] = None):
         self.session: SessionHandler = session
         self.user: Optional[UserSession] = user
         self.session_latch: bool = False
+        self.loaders: KidoFoodLoaders = KidoFoodLoaders()
+        # Entity tags of the data in the response, used to invalidate the response cache
+        self.cache_tags: Set[str] = set()
+
+    def add_cache_tags(self, *tags: str) -> None:
+        self.cache_tags.update(tags)
+        operation_tags = _OPERATION_CACHE_TAGS.get()
+        if operation_tags is not None:
+            operation_tags.update(tags)
+
+    @contextmanager
+    def collect_cache_tags(self) -> Iterator[Set[str]]:
+        """Collect the cache tags added by the operation executed inside the block."""
+        tags: Set[str] = set()
+        token = _OPERATION_CACHE_TAGS.set(tags)
+        try:
+            yield tags
+        finally:
+            _OPERATION_CACHE_TAGS.reset(token)
@@ -0,0 +1,228 @@
+"""
+MIT License
+
+Copyright (c) 2022-present noaione
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+from graphql import (
+    DocumentNode,
+    FieldNode,
+    FragmentDefinitionNode,
+    FragmentSpreadNode,
+    GraphQLInterfaceType,
+    GraphQLObjectType,
+    GraphQLSchema,
+    InlineFragmentNode,
+    OperationDefinitionNode,
+    OperationType,
+    SelectionSetNode,
+    get_named_type,
+    value_from_ast,
+)
+from graphql.type.definition import GraphQLCompositeType
+
+__all__ = (
+    "MAX_PAGE_LIMIT",
+    "QueryCost",
+    "QueryCostLimits",
+    "CostBudget",
+    "analyze_query_cost",
+    "create_cost_limits",
+    "get_cost_limits",
+)
+
+# The maximum `limit` a paginated field will use, anything higher is clamped
+MAX_PAGE_LIMIT = 100
+_DEFINITION_BACKREF = "strawberry-definition"
+_GLOBAL_COST_LIMITS: Optional[QueryCostLimits] = None
+
+
+@dataclass
+class QueryCost:
+    cost: int
+    depth: int
+
+
+@dataclass
+class QueryCostLimits:
+    max_cost: int = 5000
+    """The maximum cost of a single operation, 0 to disable"""
+    max_depth: int = 10
+    """The maximum depth of a single operation, 0 to disable"""
+    session_budget: int = 0
+    """The maximum total cost of a session (or client) in `session_window` seconds, 0 to disable"""
+    session_window: float = 60.0
+
+
+def _field_metadata(parent_type: GraphQLCompositeType, field_name: str) -> Tuple[Any, Dict[str, Any]]:
+    if not isinstance(parent_type, (GraphQLObjectType, GraphQLInterfaceType)):
+        return None, {}
+    field = parent_type.fields.get(field_name)
+    if field is None:
+        return None, {}
+    definition = (field.extensions or {}).get(_DEFINITION_BACKREF)
+    metadata = getattr(definition, "metadata", None) or {}
+    return field, metadata
+
+
+class _CostAnalyzer:
+    def __init__(
+        self,
+        schema: GraphQLSchema,
+        fragments: Dict[str, FragmentDefinitionNode],
+        variables: Optional[Dict[str, Any]],
+    ) -> None:
+        self.schema = schema
+        self.fragments = fragments
+        self.variables = variables or {}
+
+    def _limit_of(self, field: Any, node: FieldNode) -> Optional[int]:
+        limit_arg = field.args.get("limit")
+        if limit_arg is None:
+            return None
+        limit = limit_arg.default_value
+        for argument in node.arguments or []:
+            if argument.name.value == "limit":
+                limit = value_from_ast(argument.value, limit_arg.type, self.variables)
+        if not isinstance(limit, int):
+            return MAX_PAGE_LIMIT
+        return max(1, min(limit, MAX_PAGE_LIMIT))
+
+    def visit(self, parent_type: GraphQLCompositeType, selection_set: SelectionSetNode, depth: int) -> QueryCost:
+        total = 0
+        max_depth = depth
+        for selection in selection_set.selections:
+            if isinstance(selection, FieldNode):
+                if selection.name.value.startswith("__"):
+                    # Introspection is not hitting the database
+                    continue
+                field, metadata = _field_metadata(parent_type, selection.name.value)
+                if field is None:
+                    continue
+                total += int(metadata.get("cost", 0))
+                max_depth = max(max_depth, depth + 1)
+                if selection.selection_set is None:
+                    continue
+                multiplier = self._limit_of(field, selection) or int(metadata.get("list_size", 1))
+                child = self.visit(get_named_type(field.type), selection.selection_set, depth + 1)
+                total += multiplier * child.cost
+                max_depth = max(max_depth, child.depth)
+            elif isinstance(selection, InlineFragmentNode):
+                fragment_type = parent_type
+                if selection.type_condition is not None:
+                    fragment_type = self.schema.get_type(selection.type_condition.name.value) or parent_type
+                child = self.visit(fragment_type, selection.selection_set, depth)
+                total += child.cost
+                max_depth = max(max_depth, child.depth)
+            elif isinstance(selection, FragmentSpreadNode):
+                fragment = self.fragments.get(selection.name.value)
+                if fragment is None:
+                    continue
+                fragment_type = self.schema.get_type(fragment.type_condition.name.value) or parent_type
+                child = self.visit(fragment_type, fragment.selection_set, depth)
+                total += child.cost
+                max_depth = max(max_depth, child.depth)
+        return QueryCost(cost=total, depth=max_depth)
+
+
+def analyze_query_cost(
+    schema: GraphQLSchema,
+    document: DocumentNode,
+    operation_name: Optional[str] = None,
+    variables: Optional[Dict[str, Any]] = None,
+) -> QueryCost:
+    """
+    Statically compute the cost and depth of the operation before it's executed.
+
+    Each field cost comes from the `cost` metadata of the field (0 by default),
+    and the cost of the selection below a paginated field is multiplied by its `limit`
+    (or by the `list_size` metadata for a plain list).
+    """
+    fragments: Dict[str, FragmentDefinitionNode] = {}
+    operation: Optional[OperationDefinitionNode] = None
+    for definition in document.definitions:
+        if isinstance(definition, FragmentDefinitionNode):
+            fragments[definition.name.value] = definition
+        elif isinstance(definition, OperationDefinitionNode):
+            if operation_name is None or (definition.name and definition.name.value == operation_name):
+                operation = operation or definition
+    if operation is None:
+        return QueryCost(cost=0, depth=0)
+
+    root_type = {
+        OperationType.QUERY: schema.query_type,
+        OperationType.MUTATION: schema.mutation_type,
+        OperationType.SUBSCRIPTION: schema.subscription_type,
+    }.get(operation.operation)
+    if root_type is None:
+        return QueryCost(cost=0, depth=0)
+    return _CostAnalyzer(schema, fragments, variables).visit(root_type, operation.selection_set, 0)
+
+
+class CostBudget:
+    """
+    A fixed window budget of query cost per session (or per client when not logged in).
+    """
+
+    def __init__(self) -> None:
+        self._spent: Dict[str, Tuple[float, int]] = {}
+
+    def _cleanup(self, now: float, window: float) -> None:
+        expired = [key for key, (started, _) in self._spent.items() if now - started >= window]
+        for key in expired:
+            self._spent.pop(key, None)
+
+    def spend(self, key: str, cost: int, budget: int, window: float) -> bool:
+        """
+        Spend the cost from the key budget, return False (and spend nothing) if it goes over the budget.
+        """
+        now = time.monotonic()
+        if len(self._spent) > 10000:
+            self._cleanup(now, window)
+        started, spent = self._spent.get(key, (now, 0))
+        if now - started >= window:
+            started, spent = now, 0
+        if spent + cost > budget:
+            return False
+        self._spent[key] = (started, spent + cost)
+        return True
+
+
+def create_cost_limits(
+    max_cost: int = 5000, max_depth: int = 10, session_budget: int = 0, session_window: float = 60.0
+) -> QueryCostLimits:
+    global _GLOBAL_COST_LIMITS
+
+    _GLOBAL_COST_LIMITS = QueryCostLimits(max_cost, max_depth, session_budget, session_window)
+    return _GLOBAL_COST_LIMITS
+
+
+def get_cost_limits() -> QueryCostLimits:
+    # Use the default limits if the app did not configure it (e.g. generating schema)
+    if _GLOBAL_COST_LIMITS is None:
+        return create_cost_limits()
+    return _GLOBAL_COST_LIMITS
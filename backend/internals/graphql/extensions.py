@@ -0,0 +1,353 @@
+"""
+MIT License
+
+Copyright (c) 2022-present noaione
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+from __future__ import annotations
+
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from inspect import isawaitable
+from typing import Any, Awaitable, Dict, List, Literal, Optional, Tuple
+
+import orjson
+from graphql import ExecutionResult as GraphQLExecutionResult
+from graphql import GraphQLError, GraphQLResolveInfo
+from graphql.language import DocumentNode
+from graphql.pyutils import Path
+from strawberry.extensions import Extension
+from strawberry.extensions.utils import is_introspection_field
+
+from internals.db import get_plan_sampler, reset_query_origin, set_query_origin
+from internals.enums import UserType
+from internals.tracing import TraceSpan, reset_span, set_span
+from internals.utils import to_boolean
+
+from .cost import CostBudget, QueryCost, analyze_query_cost, get_cost_limits
+
+__all__ = (
+    "DocumentCache",
+    "DocumentCacheExtension",
+    "QueryCostExtension",
+    "QueryOriginExtension",
+    "TracingExtension",
+    "TRACE_HEADER",
+    "get_document_cache",
+    "get_tracing_mode",
+    "set_tracing_mode",
+)
+TracingMode = Literal["off", "response", "log"]
+# Header used by an admin to trace a single request
+TRACE_HEADER = "X-KidoFood-Trace"
+_TRACING_MODE: TracingMode = "off"
+trace_logger = logging.getLogger("GraphQL.Tracing")
+
+
+class DocumentCache:
+    """
+    A bounded LRU of the parsed and validated document, keyed by the query text.
+
+    Only documents that passed the validation are stored, so a cached document
+    can skip both the parsing and validation step.
+    """
+
+    def __init__(self, maxsize: int = 1000) -> None:
+        self._maxsize = maxsize
+        self._documents: OrderedDict[str, DocumentNode] = OrderedDict()
+
+    def get(self, query: str) -> Optional[DocumentNode]:
+        document = self._documents.get(query)
+        if document is not None:
+            self._documents.move_to_end(query)
+        return document
+
+    def set(self, query: str, document: DocumentNode) -> None:
+        self._documents[query] = document
+        self._documents.move_to_end(query)
+        while len(self._documents) > self._maxsize:
+            self._documents.popitem(last=False)
+
+    def clear(self) -> None:
+        self._documents.clear()
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+
+_GLOBAL_DOCUMENT_CACHE = DocumentCache()
+
+
+def get_document_cache() -> DocumentCache:
+    return _GLOBAL_DOCUMENT_CACHE
+
+
+class DocumentCacheExtension(Extension):
+    """
+    Reuse the parsed and validated document of a query that has been seen before.
+
+    The extension is created per request, while the cache itself is shared.
+    """
+
+    cached: bool = False
+
+    def on_parsing_start(self) -> None:
+        query = self.execution_context.query
+        if not query or self.execution_context.graphql_document is not None:
+            return
+        document = get_document_cache().get(query)
+        if document is not None:
+            self.execution_context.graphql_document = document
+            self.cached = True
+
+    def on_validation_start(self) -> None:
+        if self.cached and self.execution_context.errors is None:
+            # Already validated when it's cached, an empty list skip the validation
+            self.execution_context.errors = []
+
+    def on_validation_end(self) -> None:
+        execution_context = self.execution_context
+        if self.cached or execution_context.errors or execution_context.graphql_document is None:
+            return
+        if execution_context.query:
+            get_document_cache().set(execution_context.query, execution_context.graphql_document)
+
+
+class QueryOriginExtension(Extension):
+    """
+    Mark the database queries with the resolver that made them (e.g. `FoodOrder.merchant`)
+    for the query plan sampler, only when the sampler is enabled.
+    """
+
+    async def _resolve_async(self, result: Awaitable[Any], origin: str) -> Any:
+        token = set_query_origin(origin)
+        try:
+            return await result
+        finally:
+            reset_query_origin(token)
+
+    def resolve(self, _next, root, info: GraphQLResolveInfo, *args, **kwargs) -> Any:
+        if get_plan_sampler() is None:
+            return _next(root, info, *args, **kwargs)
+        origin = f"{info.parent_type.name}.{info.field_name}"
+        token = set_query_origin(origin)
+        try:
+            result = _next(root, info, *args, **kwargs)
+        finally:
+            reset_query_origin(token)
+        if isawaitable(result):
+            return self._resolve_async(result, origin)
+        return result
+
+
+_COST_BUDGET = CostBudget()
+
+
+def _budget_key(context: Any) -> Optional[str]:
+    user = getattr(context, "user", None)
+    if user is not None:
+        return f"session:{user.session_id}"
+    request = getattr(context, "request", None)
+    client = getattr(request, "client", None)
+    if client is not None and client.host:
+        return f"client:{client.host}"
+    return None
+
+
+class QueryCostExtension(Extension):
+    """
+    Reject an operation that is too expensive or too deep before it's executed,
+    and report the computed cost in the response extensions.
+    """
+
+    query_cost: Optional[QueryCost] = None
+
+    def _reject(self, message: str, code: str) -> None:
+        error = GraphQLError(message, extensions={"code": code})
+        self.execution_context.result = GraphQLExecutionResult(data=None, errors=[error])
+
+    def on_executing_start(self) -> None:
+        execution_context = self.execution_context
+        if execution_context.graphql_document is None:
+            return
+        limits = get_cost_limits()
+        query_cost = analyze_query_cost(
+            execution_context.schema._schema,
+            execution_context.graphql_document,
+            execution_context.operation_name,
+            execution_context.variables,
+        )
+        self.query_cost = query_cost
+        if limits.max_depth > 0 and query_cost.depth > limits.max_depth:
+            self._reject(f"Query is too deep: {query_cost.depth}, maximum is {limits.max_depth}", "QUERY_TOO_DEEP")
+            return
+        if limits.max_cost > 0 and query_cost.cost > limits.max_cost:
+            self._reject(
+                f"Query is too expensive: {query_cost.cost}, maximum is {limits.max_cost}", "QUERY_TOO_EXPENSIVE"
+            )
+            return
+        if limits.session_budget > 0:
+            budget_key = _budget_key(execution_context.context)
+            if budget_key is not None and not _COST_BUDGET.spend(
+                budget_key, query_cost.cost, limits.session_budget, limits.session_window
+            ):
+                self._reject("Query cost budget exceeded, please try again later", "QUERY_BUDGET_EXCEEDED")
+
+    def get_results(self) -> Dict[str, Any]:
+        if self.query_cost is None:
+            return {}
+        limits = get_cost_limits()
+        return {
+            "cost": {
+                "requested": self.query_cost.cost,
+                "depth": self.query_cost.depth,
+                "maximum": limits.max_cost,
+                "maximumDepth": limits.max_depth,
+            }
+        }
+
+
+def set_tracing_mode(mode: str) -> None:
+    """
+    Set the tracing of every request, `off` to only trace the requests of admin with the trace header,
+    `response` to send the trace in the response extensions, and `log` to write the trace to the log.
+    """
+    global _TRACING_MODE
+
+    if mode not in ("off", "response", "log"):
+        raise ValueError(f"Unknown tracing mode: {mode}")
+    _TRACING_MODE = mode  # type: ignore
+
+
+def get_tracing_mode() -> TracingMode:
+    return _TRACING_MODE
+
+
+def _trace_requested(context: Any) -> bool:
+    user = getattr(context, "user", None)
+    request = getattr(context, "request", None)
+    if user is None or user.type != UserType.ADMIN or request is None:
+        return False
+    return to_boolean(request.headers.get(TRACE_HEADER))
+
+
+def _format_path(path: Optional[Path]) -> str:
+    keys: List[str] = []
+    while path is not None:
+        keys.append(f"[{path.key}]" if isinstance(path.key, int) else f".{path.key}")
+        path = path.prev
+    return "".join(reversed(keys)).lstrip(".")
+
+
+def _ms(duration_ns: int) -> float:
+    return round(duration_ns / 1e6, 3)
+
+
+class TracingExtension(Extension):
+    """
+    Record the timing of the parsing, validation and every resolver, along with the database
+    and redis calls made by each resolver.
+
+    Loads that are batched by the DataLoader are attributed to the resolver that started the batch.
+    """
+
+    enabled: bool = False
+    to_response: bool = False
+
+    def on_request_start(self) -> None:
+        mode = get_tracing_mode()
+        requested = _trace_requested(self.execution_context.context)
+        self.enabled = mode != "off" or requested
+        self.to_response = mode == "response" or requested
+        self.start_time = datetime.now(timezone.utc)
+        self.origin_ns = time.perf_counter_ns()
+        self.phases: Dict[str, Tuple[int, int]] = {}
+        self.spans: List[TraceSpan] = []
+
+    def _phase_start(self, name: str) -> None:
+        if self.enabled:
+            self.phases[name] = (time.perf_counter_ns(), 0)
+
+    def _phase_end(self, name: str) -> None:
+        if self.enabled and name in self.phases:
+            self.phases[name] = (self.phases[name][0], time.perf_counter_ns())
+
+    def on_parsing_start(self) -> None:
+        self._phase_start("parsing")
+
+    def on_parsing_end(self) -> None:
+        self._phase_end("parsing")
+
+    def on_validation_start(self) -> None:
+        self._phase_start("validation")
+
+    def on_validation_end(self) -> None:
+        self._phase_end("validation")
+
+    async def _resolve_async(self, result: Awaitable[Any], span: TraceSpan) -> Any:
+        token = set_span(span)
+        try:
+            return await result
+        finally:
+            reset_span(token)
+            span.finish()
+
+    def resolve(self, _next, root, info: GraphQLResolveInfo, *args, **kwargs) -> Any:
+        if not self.enabled or is_introspection_field(info):
+            return _next(root, info, *args, **kwargs)
+        span = TraceSpan(_format_path(info.path))
+        self.spans.append(span)
+        token = set_span(span)
+        try:
+            result = _next(root, info, *args, **kwargs)
+        except Exception:
+            span.finish()
+            raise
+        finally:
+            reset_span(token)
+        if isawaitable(result):
+            return self._resolve_async(result, span)
+        span.finish()
+        return result
+
+    def make_trace(self) -> Dict[str, Any]:
+        trace: Dict[str, Any] = {
+            "startTime": self.start_time.isoformat(),
+            "duration": _ms(time.perf_counter_ns() - self.origin_ns),
+        }
+        for name, (start_ns, end_ns) in self.phases.items():
+            trace[name] = {"startOffset": _ms(start_ns - self.origin_ns), "duration": _ms(end_ns - start_ns)}
+        trace["resolvers"] = [span.to_dict(self.origin_ns) for span in self.spans]
+        return trace
+
+    def get_results(self) -> Dict[str, Any]:
+        if not self.enabled or not self.to_response:
+            return {}
+        return {"tracing": self.make_trace()}
+
+    def on_request_end(self) -> None:
+        if not self.enabled or get_tracing_mode() != "log":
+            return
+        trace = self.make_trace()
+        trace["operationName"] = self.execution_context.operation_name
+        trace_logger.info(orjson.dumps(trace).decode("utf-8"))
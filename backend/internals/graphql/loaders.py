@@ -0,0 +1,90 @@
+"""
+MIT License
+
+Copyright (c) 2022-present noaione
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+from __future__ import annotations
+
+from typing import Dict, List, Optional, Type, TypeVar
+
+from beanie import Document
+from beanie.operators import In as OpIn
+from bson import ObjectId
+from bson.errors import InvalidId
+from strawberry.dataloader import DataLoader
+
+from internals.db import FoodItem as FoodItemDB
+from internals.db import Merchant as MerchantDB
+from internals.db import User as UserDB
+
+__all__ = ("KidoFoodLoaders",)
+DocumentT = TypeVar("DocumentT", bound=Document)
+
+
+async def _load_documents(document: Type[DocumentT], keys: List[str]) -> List[Optional[DocumentT]]:
+    """
+    Load all the documents with a single `$in` query, the result follow the order of `keys`.
+    """
+    object_ids: Dict[str, ObjectId] = {}
+    for key in keys:
+        try:
+            object_ids[key] = ObjectId(key)
+        except (InvalidId, TypeError):
+            continue
+    unique_ids = list(set(object_ids.values()))
+    if not unique_ids:
+        return [None] * len(keys)
+    results = await document.find(OpIn(document.id, unique_ids)).to_list()
+    mapped = {str(result.id): result for result in results}
+    return [mapped.get(key) for key in keys]
+
+
+async def _load_merchants(keys: List[str]) -> List[Optional[MerchantDB]]:
+    return await _load_documents(MerchantDB, keys)
+
+
+async def _load_users(keys: List[str]) -> List[Optional[UserDB]]:
+    return await _load_documents(UserDB, keys)
+
+
+async def _load_items(keys: List[str]) -> List[Optional[FoodItemDB]]:
+    return await _load_documents(FoodItemDB, keys)
+
+
+class KidoFoodLoaders:
+    """
+    The request-scoped data loaders, keyed by the stringified ObjectId.
+
+    Every `load` in the same tick is batched into a single query per document type,
+    and the same ID is only fetched once for the whole request.
+    """
+
+    def __init__(self) -> None:
+        self.merchant: DataLoader[str, Optional[MerchantDB]] = DataLoader(load_fn=_load_merchants)
+        self.user: DataLoader[str, Optional[UserDB]] = DataLoader(load_fn=_load_users)
+        self.item: DataLoader[str, Optional[FoodItemDB]] = DataLoader(load_fn=_load_items)
+
+    def clear(self) -> None:
+        """Clear the cached results, used by long-lived context like subscriptions."""
+        self.merchant.clear_all()
+        self.user.clear_all()
+        self.item.clear_all()
@@ -29,12 +29,14 @@ from typing import Optional
 from uuid import UUID
 
 import strawberry as gql
-from bson import ObjectId
+from strawberry.types import Info
 
+from internals.db import BulkImportResult
 from internals.db import FoodItem as FoodItemModel
 from internals.db import Merchant as MerchantModel
 from internals.enums import AvatarType
 
+from ..context import KidoFoodContext
 from ..enums import ItemTypeGQL
 from ..scalars import Upload
 from .common import AvatarImageGQL
@@ -43,6 +45,8 @@ from .merchant import MerchantGQL
 __all__ = (
     "FoodItemGQL",
     "FoodItemInputGQL",
+    "FoodItemImportErrorGQL",
+    "FoodItemImportGQL",
 )
 
 
@@ -60,12 +64,12 @@ class FoodItemGQL:
 
     merchant_id: gql.Private[Optional[str]]
 
-    @gql.field(description="The associated merchant for the item")
-    async def merchant(self) -> Optional[MerchantGQL]:
+    @gql.field(description="The associated merchant for the item", metadata={"cost": 1})
+    async def merchant(self, info: Info[KidoFoodContext, None]) -> Optional[MerchantGQL]:
         # Resolve merchant
         if self.merchant_id is None:
             return None
-        merchant = await MerchantModel.find_one(MerchantModel.id == ObjectId(self.merchant_id))
+        merchant = await info.context.loaders.merchant.load(self.merchant_id)
         if merchant is None:
             return None
         return MerchantGQL.from_db(merchant)
@@ -103,3 +107,22 @@ class FoodItemInputGQL:
     stock: int = gql.field(description="The current stock of the item")
     type: ItemTypeGQL = gql.field(description="The item type")
     image: Optional[Upload] = gql.field(description="The image of the item", default=gql.UNSET)
+
+
+@gql.type(name="FoodItemImportError", description="A failed row on bulk item import")
+class FoodItemImportErrorGQL:
+    row: int = gql.field(description="The row number (1-based) of the failed item")
+    message: str = gql.field(description="The reason why the item failed to be imported")
+
+
+@gql.type(name="FoodItemImport", description="The result of a bulk item import")
+class FoodItemImportGQL:
+    inserted: int = gql.field(description="How much items got inserted")
+    errors: list[FoodItemImportErrorGQL] = gql.field(description="The list of failed items")
+
+    @classmethod
+    def from_result(cls, result: BulkImportResult):
+        return cls(
+            inserted=result.inserted,
+            errors=[FoodItemImportErrorGQL(row=err.row, message=err.message) for err in result.errors],
+        )
@@ -57,6 +57,8 @@ class MerchantGQL:
     email: Optional[str] = gql.field(description="The email of the merchant")
     website: Optional[str] = gql.field(description="The website of the merchant")
 
+    merchant_id: gql.Private[str]  # ObjectId
+
     @classmethod
     def from_db(cls: Type[MerchantGQL], merch: MerchantModel):
         avatar = None  # type: Optional[AvatarImageGQL]
@@ -74,6 +76,7 @@ class MerchantGQL:
             phone=merch.phone,
             email=merch.email,
             website=merch.website,
+            merchant_id=str(merch.id),
         )
 
 
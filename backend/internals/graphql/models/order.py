@@ -31,14 +31,20 @@ from uuid import UUID
 
 import strawberry as gql
 from bson import ObjectId
+from strawberry.types import Info
 
 from internals.db import FoodItem as FoodItemModel
+from internals.db import FoodItemSnapshot
 from internals.db import FoodOrder as FoodOrderModel
+from internals.db import FoodOrderItem as FoodOrderItemModel
 from internals.db import Merchant as MerchantModel
-from internals.db import PaymentReceipt
+from internals.db import OrderWithLookups, PaymentReceipt
 from internals.db import User as UserModel
+from internals.enums import AvatarType
 
-from ..enums import OrderStatusGQL
+from ..context import KidoFoodContext
+from ..enums import ItemTypeGQL, OrderStatusGQL
+from .common import AvatarImageGQL
 from .items import FoodItemGQL
 from .merchant import MerchantGQL
 from .user import UserGQL
@@ -55,6 +61,22 @@ __all__ = (
 class PrivateItem:
     item_id: str
     quantity: int
+    snapshot: Optional[FoodItemSnapshot] = None
+    # Filled when the item is fetched together with the order
+    prefetched: bool = False
+    data: Optional[FoodItemModel] = None
+
+    @classmethod
+    def from_db(cls: Type[PrivateItem], item: FoodOrderItemModel) -> PrivateItem:
+        snapshot = item.snapshot
+        # Old orders embed the whole item document instead of a reference
+        if isinstance(item.data, FoodItemModel):
+            item_id = str(item.data.id)
+            if snapshot is None:
+                snapshot = FoodItemSnapshot.from_item(item.data)
+        else:
+            item_id = str(item.data.ref.id)
+        return cls(item_id=item_id, quantity=item.quantity, snapshot=snapshot)
 
 
 @gql.type(name="OrderReceipt", description="The payment receipt of an order")
@@ -78,11 +100,45 @@ class OrderReceiptGQL:
 class FoodOrderItemGQL:
     item_id: gql.Private[str]  # ObjectId(s)
     quantity: int = gql.field(description="The quantity of the item")
+    name: Optional[str] = gql.field(description="The name of the item at the time of order")
+    price: Optional[float] = gql.field(description="The unit price of the item at the time of order")
+    type: Optional[ItemTypeGQL] = gql.field(description="The item type at the time of order")  # type: ignore
+    image: Optional[AvatarImageGQL] = gql.field(description="The image of the item at the time of order")
+    private: gql.Private[Optional[PrivateItem]] = None
 
-    @gql.field(description="The item information itself")
-    async def data(self) -> FoodItemGQL:
+    @classmethod
+    def from_private(cls: Type[FoodOrderItemGQL], item: PrivateItem) -> FoodOrderItemGQL:
+        snapshot = item.snapshot
+        if snapshot is None:
+            return cls(
+                item_id=item.item_id,
+                quantity=item.quantity,
+                name=None,
+                price=None,
+                type=None,
+                image=None,
+                private=item,
+            )
+        image = None  # type: Optional[AvatarImageGQL]
+        if snapshot.avatar and snapshot.avatar.key:
+            image = AvatarImageGQL.from_db(snapshot.avatar, AvatarType.ITEMS)
+        return cls(
+            item_id=item.item_id,
+            quantity=item.quantity,
+            name=snapshot.name,
+            price=snapshot.price,
+            type=snapshot.type,
+            image=image,
+            private=item,
+        )
+
+    @gql.field(description="The current item information, might differ from the time of order", metadata={"cost": 1})
+    async def data(self, info: Info[KidoFoodContext, None]) -> FoodItemGQL:
         # Resolve items
-        item = await FoodItemModel.find_one(FoodItemModel.id == ObjectId(self.item_id))
+        if self.private is not None and self.private.prefetched:
+            item = self.private.data
+        else:
+            item = await info.context.loaders.item.load(self.item_id)
         if item is None:
             raise Exception(f"Unable to find item in database: {self.item_id}")
         return FoodItemGQL.from_db(item)
@@ -98,41 +154,69 @@ class FoodOrderGQL:
     receipt: OrderReceiptGQL = gql.field(description="The payment receipt of this order")
 
     items_temp: gql.Private[list[PrivateItem]]  # a list of ObjectId(s)
-    merchant_id: gql.Private[str]
-    user_id: gql.Private[str]
-
-    @gql.field(description="The list of associated items for the order")
+    merchant_id: gql.Private[Optional[str]]
+    user_id: gql.Private[Optional[str]]
+    # Filled when the order is fetched with `$lookup`, see `from_lookups`
+    prefetched: gql.Private[frozenset[str]] = frozenset()
+    merchant_data: gql.Private[Optional[MerchantModel]] = None
+    user_data: gql.Private[Optional[UserModel]] = None
+
+    @gql.field(description="The list of associated items for the order", metadata={"list_size": 5})
     async def items(self) -> list[FoodOrderItemGQL]:
         # Resolve items
-        order_items = [FoodOrderItemGQL(item_id=it.item_id, quantity=it.quantity) for it in self.items_temp]
+        order_items = [FoodOrderItemGQL.from_private(it) for it in self.items_temp]
         return order_items
 
-    @gql.field(description="The associated merchant for the order")
-    async def merchant(self) -> Optional[MerchantGQL]:
+    @gql.field(description="The associated merchant for the order", metadata={"cost": 1})
+    async def merchant(self, info: Info[KidoFoodContext, None]) -> Optional[MerchantGQL]:
         # Resolve merchant
-        merchant = await MerchantModel.find_one(MerchantModel.id == ObjectId(self.merchant_id))
+        if self.merchant_id is None:
+            return None
+        if "merchant" in self.prefetched:
+            merchant = self.merchant_data
+        else:
+            merchant = await info.context.loaders.merchant.load(self.merchant_id)
         return MerchantGQL.from_db(merchant) if merchant else None
 
-    @gql.field(description="The associated user for the order")
-    async def user(self) -> Optional[UserGQL]:
+    @gql.field(description="The associated user for the order", metadata={"cost": 1})
+    async def user(self, info: Info[KidoFoodContext, None]) -> Optional[UserGQL]:
         # Resolve user
-        user = await UserModel.find_one(UserModel.id == ObjectId(self.user_id))
+        if self.user_id is None:
+            return None
+        if "user" in self.prefetched:
+            user = self.user_data
+        else:
+            user = await info.context.loaders.user.load(self.user_id)
         return UserGQL.from_db(user) if user else None
 
     @classmethod
     def from_db(cls: Type[FoodOrderGQL], data: FoodOrderModel) -> FoodOrderGQL:
+        # The data might be a partial projection, so some fields could be missing.
+        receipt = OrderReceiptGQL.from_db(data.receipt) if data.receipt is not None else None
         return cls(
             id=data.order_id,
             target_address=data.target_address,
             created_at=data.created_at,
             updated_at=data.updated_at,
             status=data.status,
-            receipt=OrderReceiptGQL.from_db(data.receipt),
-            items_temp=[PrivateItem(item_id=str(item.data.ref.id), quantity=item.quantity) for item in data.items],
-            merchant_id=str(data.merchant.ref.id),
-            user_id=str(data.user.ref.id),
+            receipt=receipt,  # type: ignore
+            items_temp=[PrivateItem.from_db(item) for item in (data.items or [])],
+            merchant_id=str(data.merchant.ref.id) if data.merchant is not None else None,
+            user_id=str(data.user.ref.id) if data.user is not None else None,
         )
 
+    @classmethod
+    def from_lookups(cls: Type[FoodOrderGQL], result: OrderWithLookups) -> FoodOrderGQL:
+        order = cls.from_db(result.order)
+        order.prefetched = frozenset(result.lookups)
+        order.merchant_data = result.merchant
+        order.user_data = result.user
+        if "items" in result.lookups:
+            for item in order.items_temp:
+                item.prefetched = True
+                item.data = result.items.get(ObjectId(item.item_id))
+        return order
+
 
 @gql.input(name="PaymentMethod", description="The payment method used to pay")
 class PaymentMethodGQL:
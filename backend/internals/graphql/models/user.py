@@ -28,7 +28,7 @@ from typing import Optional
 from uuid import UUID
 
 import strawberry as gql
-from bson import ObjectId
+from strawberry.types import Info
 
 from internals.db import Merchant as MerchantDB
 from internals.db import User as UserDB
@@ -36,6 +36,7 @@ from internals.enums import AvatarType
 from internals.session.models import UserSession
 from internals.utils import make_uuid, to_uuid
 
+from ..context import KidoFoodContext
 from ..enums import UserTypeGQL
 from ..scalars import Upload
 from .common import AvatarImageGQL
@@ -57,12 +58,12 @@ class UserGQL:
     merchant_id: gql.Private[Optional[str]]
     user_id: gql.Private[str]  # ObjectId
 
-    @gql.field(description="The associated merchant information if type is MERCHANT")
-    async def merchant(self) -> Optional[MerchantGQL]:
+    @gql.field(description="The associated merchant information if type is MERCHANT", metadata={"cost": 1})
+    async def merchant(self, info: Info[KidoFoodContext, None]) -> Optional[MerchantGQL]:
         # Resolve merchant
         if self.merchant_id is None:
             return None
-        merchant = await MerchantDB.find_one(MerchantDB.id == ObjectId(self.merchant_id))
+        merchant = await info.context.loaders.merchant.load(self.merchant_id)
         if merchant is None:
             return None
         return MerchantGQL.from_db(merchant)
@@ -25,29 +25,41 @@ SOFTWARE.
 from __future__ import annotations
 
 import logging
-from typing import Literal, Optional, Tuple, TypeVar, Union, cast
+from typing import TYPE_CHECKING, Literal, Optional, Tuple, TypeVar, Union, cast
 from uuid import UUID
 
 import strawberry as gql
 from beanie import WriteRules
 from beanie.operators import In as OpIn
-from bson import ObjectId
 
-from internals.db import AvatarImage
 from internals.db import FoodItem as FoodItemDB
+from internals.db import FoodItemSnapshot as FoodItemSnapshotDB
 from internals.db import FoodOrder as FoodOrderDB
 from internals.db import FoodOrderItem as FoodOrderItemDB
 from internals.db import Merchant as MerchantDB
 from internals.db import PaymentReceipt as PaymentReceiptDB
 from internals.db import User as UserDB
+from internals.db import (
+    find_order,
+    get_importable_merchant,
+    item_counter,
+    merchant_counter,
+    move_counter,
+    order_counter,
+    sample_query,
+    update_counters,
+)
+from internals.db.bulk import FoodItemBulkImporter
+from internals.db.models import AvatarImage
 from internals.enums import ApprovalStatus, AvatarType, UserType
 from internals.session import encrypt_password, verify_password
 from internals.utils import make_uuid, to_uuid
 
-from .enums import ApprovalStatusGQL, OrderStatusGQL, UserTypeGQL
+from .enums import OrderStatusGQL, UserTypeGQL
 from .files import handle_image_upload
 from .models import (
     FoodItemGQL,
+    FoodItemImportGQL,
     FoodItemInputGQL,
     FoodOrderGQL,
     FoodOrderItemInputGQL,
@@ -56,6 +68,16 @@ from .models import (
     UserGQL,
     UserInputGQL,
 )
+from .response_cache import (
+    ITEM_LIST_TAG,
+    MERCHANT_LIST_TAG,
+    invalidate_response_cache,
+    merchant_items_tag,
+    merchant_tag,
+)
+
+if TYPE_CHECKING:
+    from motor.core import AgnosticClientSession
 
 __all__ = (
     "mutate_login_user",
@@ -66,6 +88,7 @@ __all__ = (
     "mutate_make_new_order",
     "mutate_update_order_status",
     "mutate_new_food_item",
+    "mutate_bulk_new_food_items",
 )
 
 logger = logging.getLogger("GraphQL.Mutations")
@@ -77,7 +100,7 @@ async def mutate_login_user(
     email: str,
     password: str,
 ) -> ResultOrT[UserGQL]:
-    user = await UserDB.find_one(UserDB.email == email)
+    user = await sample_query(UserDB.find_one(UserDB.email == email))
     if not user:
         return False, "User with associated email not found"
 
@@ -96,7 +119,7 @@ async def mutate_register_user(
     name: str,
     type: UserTypeGQL = UserTypeGQL.CUSTOMER,
 ) -> ResultOrT[UserDB]:
-    user = await UserDB.find_one(UserDB.email == email)
+    user = await sample_query(UserDB.find_one(UserDB.email == email))
     if user:
         return False, "User with associated email already exists"
 
@@ -127,7 +150,7 @@ async def mutate_apply_new_merchant(
         logger.error(f"User<{user.id}>: Merchant address is required")
         return False, "Merchant address is required", None
 
-    user_acc = await UserDB.find_one(UserDB.user_id == user.id)
+    user_acc = await sample_query(UserDB.find_one(UserDB.user_id == user.id))
     if user_acc is None:
         logger.error(f"User<{user.id}>: User not found at database")
         return False, "User not found", None
@@ -153,6 +176,8 @@ async def mutate_apply_new_merchant(
     logger.info(f"User<{user.id}>: Saving...")
     await user_acc.save(link_rule=WriteRules.WRITE)
     logger.info(f"User<{user.id}>: Saved")
+    await update_counters({merchant_counter(new_merchant.approved): 1})
+    await invalidate_response_cache(MERCHANT_LIST_TAG)
     return True, new_merchant, user_acc
 
 
@@ -161,12 +186,13 @@ async def mutate_update_merchant(
     user: UserGQL,
     merchant: MerchantInputGQL,
     approval: Optional[ApprovalStatus] = gql.UNSET,
+    session: Optional[AgnosticClientSession] = None,
 ) -> ResultOrT[MerchantDB]:
     if merchant.is_unset():
         logger.warning(f"Merchant<{id}>: No changes to update")
         return False, "No changes to Merchant data"
     logger.info(f"Trying to find merchant: {id}")
-    merchant_acc = await MerchantDB.find_one(MerchantDB.merchant_id == to_uuid(id))
+    merchant_acc = await sample_query(MerchantDB.find_one(MerchantDB.merchant_id == to_uuid(id), session=session))
     if merchant_acc is None:
         logger.error(f"Merchant<{id}>: Merchant not found")
         return False, "Merchant not found"
@@ -204,7 +230,8 @@ async def mutate_update_merchant(
     if approval is not None and user.type != UserType.ADMIN:
         logger.error(f"Merchant<{id}>: Only admin can change approval status")
         return False, "Only admin can change approval status"
-    elif approval is not None and user.type == UserType.ADMIN:
+    old_approval = merchant_acc.approved
+    if approval is not None and user.type == UserType.ADMIN:
         merchant_acc.approved = approval
     if avatar is not None:
         avatar_upload = await handle_image_upload(avatar, str(merchant_acc.merchant_id), AvatarType.MERCHANT)
@@ -215,7 +242,14 @@ async def mutate_update_merchant(
         merchant_acc.avatar = avatar_ingfo
 
     logger.info(f"Merchant<{id}>: Saving updates...")
-    await merchant_acc.save_changes()
+    await merchant_acc.save_changes(session=session)
+    await move_counter(merchant_counter(old_approval), merchant_counter(merchant_acc.approved))
+    # The items response include the merchant data too
+    invalidate_tags = [merchant_tag(merchant_acc.id), merchant_items_tag(merchant_acc.id)]
+    if mc_name is not None or mc_description is not None or old_approval != merchant_acc.approved:
+        # Might be included in (or excluded from) another search or status filter
+        invalidate_tags.append(MERCHANT_LIST_TAG)
+    await invalidate_response_cache(*invalidate_tags)
 
     return True, merchant_acc
 
@@ -228,7 +262,7 @@ async def mutate_update_user(
         logger.warning(f"User<{id}>: No changes to update")
         return False, "No changes to User data"
     logger.info(f"Trying to find user: {id}")
-    user_acc = await UserDB.find_one(UserDB.user_id == to_uuid(id))
+    user_acc = await sample_query(UserDB.find_one(UserDB.user_id == to_uuid(id)))
     if user_acc is None:
         logger.error(f"User<{id}>: User not found")
         return False, "User not found"
@@ -278,12 +312,12 @@ async def mutate_make_new_order(
             return False, f"Invalid ID for items[{idx}]: {item.id}"
         items_quant_map[item.id] = item.quantity
     logger.info(f"Fetching user information for: {user.id}")
-    user_info = await UserDB.find_one(UserDB.user_id == user.id)
+    user_info = await sample_query(UserDB.find_one(UserDB.user_id == user.id))
     if user_info is None:
         logger.warning(f"User<{user.id}>: User not found")
         return False, "User not found"
     logger.info(f"Trying to find items: {items_ids!r}")
-    items_data = await FoodItemDB.find(OpIn(FoodItemDB.item_id, items_ids)).to_list()
+    items_data = await sample_query(FoodItemDB.find(OpIn(FoodItemDB.item_id, items_ids))).to_list()
     merchants = []
     mapped_keys = []
     remapped_items: list[FoodOrderItemDB] = []
@@ -292,7 +326,13 @@ async def mutate_make_new_order(
         mapped_keys.append(str(item.item_id))
         merch_id = str(item.merchant.ref.id)
         it_quantity = items_quant_map[str(item.item_id)]
-        remapped_items.append(FoodOrderItemDB(data=item, quantity=it_quantity))  # type: ignore
+        remapped_items.append(
+            FoodOrderItemDB(
+                data=item.to_ref(),  # type: ignore
+                quantity=it_quantity,
+                snapshot=FoodItemSnapshotDB.from_item(item),
+            )
+        )
         if merch_id not in merchants:
             merchants.append(merch_id)
         total_amount += item.price * it_quantity
@@ -319,6 +359,7 @@ async def mutate_make_new_order(
         receipt=pay_receipt,
     )
     await food_order.save(link_rule=WriteRules.DO_NOTHING)
+    await update_counters({order_counter(): 1, order_counter(food_order.status): 1})
     return True, FoodOrderGQL.from_db(food_order)
 
 
@@ -327,7 +368,7 @@ async def mutate_update_order_status(
     status: OrderStatusGQL,
 ) -> ResultOrT[FoodOrderGQL]:
     logger.info(f"Trying to find order: {id}")
-    order = await FoodOrderDB.find_one(FoodOrderDB.order_id == to_uuid(id))
+    order = await find_order(FoodOrderDB.order_id == to_uuid(id))
     if order is None:
         logger.warning(f"Order<{id}>: Order not found")
         return False, "Order not found"
@@ -361,23 +402,21 @@ async def mutate_update_order_status(
         logger.warning(f"Order<{id}>: Status is already {status}")
         return False, "Status is already set to that value"
 
+    old_status = order.status
     order.status = status
     await order.save_changes()
+    await move_counter(order_counter(old_status), order_counter(order.status))
     return True, FoodOrderGQL.from_db(order)
 
 
 async def mutate_new_food_item(
     user: UserGQL,
     item: FoodItemInputGQL,
+    session: Optional[AgnosticClientSession] = None,
 ) -> ResultOrT[FoodItemGQL]:
-    if user.merchant_id is None:
-        return False, "You are not a merchant!"
-
-    merchant = await MerchantDB.find_one(MerchantDB.id == ObjectId(user.merchant_id))
-    if merchant is None:
-        return False, "Your merchant acccout cannot be found!"
-    if merchant.approved != ApprovalStatusGQL.APPROVED:
-        return False, "Your merchant account is not approved yet!"
+    merchant = await get_importable_merchant(user.merchant_id, session=session)
+    if isinstance(merchant, str):
+        return False, merchant
 
     description = item.description if item.description is not gql.UNSET else None
     image = item.image if item.image is not gql.UNSET else None
@@ -399,5 +438,41 @@ async def mutate_new_food_item(
         merchant=merchant,
         image=img_info,
     )
-    await food_item.save(link_rule=WriteRules.DO_NOTHING)
+    await food_item.save(link_rule=WriteRules.DO_NOTHING, session=session)
+    await update_counters({item_counter(): 1, item_counter(merchant.id): 1})
+    await invalidate_response_cache(merchant_items_tag(merchant.id), ITEM_LIST_TAG)
     return True, FoodItemGQL.from_db(food_item)
+
+
+async def mutate_bulk_new_food_items(
+    user: UserGQL,
+    items: list[FoodItemInputGQL],
+    ordered: bool = False,
+) -> ResultOrT[FoodItemImportGQL]:
+    merchant = await get_importable_merchant(user.merchant_id)
+    if isinstance(merchant, str):
+        return False, merchant
+
+    importer = FoodItemBulkImporter(merchant, ordered=ordered)
+    for row, item in enumerate(items, 1):
+        if importer.halted:
+            break
+        if item.image is not gql.UNSET and item.image is not None:
+            importer.add_error(row, "Image upload is not supported on bulk import")
+            continue
+        description = item.description if item.description is not gql.UNSET else None
+        await importer.add(
+            row,
+            {
+                "name": item.name,
+                "description": description,
+                "stock": item.stock,
+                "price": item.price,
+                "type": item.type,
+            },
+        )
+    result = await importer.finish()
+    if result.inserted > 0:
+        await invalidate_response_cache(merchant_items_tag(merchant.id), ITEM_LIST_TAG)
+    logger.info(f"Merchant<{merchant.id}>: Bulk imported {result.inserted} items, {len(result.errors)} failed")
+    return True, FoodItemImportGQL.from_result(result)
@@ -0,0 +1,129 @@
+"""
+MIT License
+
+Copyright (c) 2022-present noaione
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Optional
+
+from internals.redbridge import RedisBridge
+
+__all__ = (
+    "PersistedQueryStore",
+    "create_persisted_query_store",
+    "get_persisted_query_store",
+    "hash_query",
+)
+
+_GLOBAL_PERSISTED_QUERIES: Optional[PersistedQueryStore] = None
+
+
+def hash_query(query: str) -> str:
+    """The sha256 hex digest of the query document, as used by the persisted query protocol."""
+    return hashlib.sha256(query.encode("utf-8")).hexdigest()
+
+
+class PersistedQueryStore:
+    """
+    A hash to query document store for automatic persisted queries.
+
+    Queries are kept in an in-process LRU cache, and backed by Redis (if configured)
+    so every worker can serve a query that was registered on another worker.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 1000,
+        redis: Optional[RedisBridge] = None,
+        *,
+        ttl: int = 7 * 24 * 60 * 60,
+        key_prefix: str = "kidofood:apq:",
+    ) -> None:
+        self.logger = logging.getLogger("GraphQL.PersistedQuery")
+        self._maxsize = maxsize
+        self._cache: OrderedDict[str, str] = OrderedDict()
+        self._redis = redis
+        self._ttl = ttl
+        self._key_prefix = key_prefix
+
+    def _remember(self, query_hash: str, query: str) -> None:
+        self._cache[query_hash] = query
+        self._cache.move_to_end(query_hash)
+        while len(self._cache) > self._maxsize:
+            self._cache.popitem(last=False)
+
+    async def get(self, query_hash: str) -> Optional[str]:
+        query = self._cache.get(query_hash)
+        if query is not None:
+            self._cache.move_to_end(query_hash)
+            return query
+        if self._redis is None:
+            return None
+        if not self._redis.is_connected:
+            await self._redis.connect()
+        data = await self._redis.get(self._key_prefix + query_hash)
+        if not isinstance(data, dict) or not isinstance(data.get("query"), str):
+            return None
+        query = data["query"]
+        # Make sure the stored query is not tampered with
+        if hash_query(query) != query_hash:
+            self.logger.warning(f"Stored persisted query {query_hash} does not match the hash, ignoring")
+            return None
+        self._remember(query_hash, query)
+        return query
+
+    async def set(self, query_hash: str, query: str) -> None:
+        existed = query_hash in self._cache
+        self._remember(query_hash, query)
+        if self._redis is None or existed:
+            return
+        if not self._redis.is_connected:
+            await self._redis.connect()
+        await self._redis.setex(self._key_prefix + query_hash, {"query": query}, self._ttl)
+
+    async def close(self) -> None:
+        if self._redis is not None and self._redis.is_connected:
+            await self._redis.close()
+
+
+def create_persisted_query_store(
+    maxsize: int = 1000,
+    redis_host: Optional[str] = None,
+    redis_port: int = 6379,
+    redis_password: Optional[str] = None,
+    *,
+    ttl: int = 7 * 24 * 60 * 60,
+) -> PersistedQueryStore:
+    global _GLOBAL_PERSISTED_QUERIES
+
+    redis_host = redis_host.strip() if isinstance(redis_host, str) else redis_host
+    redis = RedisBridge(redis_host, redis_port, redis_password) if redis_host else None
+    _GLOBAL_PERSISTED_QUERIES = PersistedQueryStore(maxsize, redis, ttl=ttl)
+    return _GLOBAL_PERSISTED_QUERIES
+
+
+def get_persisted_query_store() -> Optional[PersistedQueryStore]:
+    return _GLOBAL_PERSISTED_QUERIES
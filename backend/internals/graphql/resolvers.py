@@ -24,34 +24,109 @@ SOFTWARE.
 
 from __future__ import annotations
 
+import asyncio
+import base64
+import hashlib
+import hmac
+import logging
+from calendar import timegm
+from datetime import datetime, timedelta, timezone
 from enum import Enum
 from re import escape as escape_re
-from typing import Optional, Union
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple, Type, Union, cast
 
+import orjson
 import strawberry as gql
+from beanie import Document
 from beanie.operators import Eq as OpEq
 from beanie.operators import In as OpIn
 from beanie.operators import RegEx as OpRegEx
+from beanie.operators import Text as OpText
 from bson import ObjectId
 from bson.errors import InvalidId
+from pymongo.errors import OperationFailure
+from strawberry.types import Info
 
 from internals.db import FoodItem as FoodItemDB
 from internals.db import FoodOrder as FoodOrderDB
 from internals.db import Merchant as MerchantDB
 from internals.db import User as UserDB
+from internals.db import (
+    count_orders,
+    create_projection,
+    find_orders_page,
+    find_orders_page_with_lookups,
+    find_routed,
+    find_text_page,
+    get_counters_total,
+    item_counter,
+    merchant_counter,
+    order_counter,
+    sample_query,
+)
+from internals.db.lookups import OrderWithLookups
+from internals.db.routing import ReadRoute
+from internals.db.search import TextCursor
 
+from .cost import MAX_PAGE_LIMIT
 from .enums import ApprovalStatusGQL
 from .models import Connection, FoodItemGQL, FoodOrderGQL, MerchantGQL, PageInfo, UserGQL
+from .selections import get_selected_fields
 
 __all__ = (
     "Cursor",
+    "Keyset",
     "SortDirection",
+    "SortField",
+    "set_cursor_secret",
     "resolve_user_from_db",
+    "resolve_text_search",
     "resolve_merchant_paginated",
     "resolve_food_items_paginated",
     "resolve_food_order_paginated",
 )
 Cursor = str
+logger = logging.getLogger("GraphQL.Resolvers")
+# Mapping of GraphQL field name to the document fields needed to resolve it
+FieldsMap = Dict[str, Tuple[str, ...]]
+_MERCHANT_FIELDS: FieldsMap = {
+    "id": ("merchant_id",),
+    "name": ("name",),
+    "description": ("description",),
+    "address": ("address",),
+    "createdAt": ("created_at",),
+    "updatedAt": ("updated_at",),
+    "approved": ("approved",),
+    "avatar": ("avatar",),
+    "phone": ("phone",),
+    "email": ("email",),
+    "website": ("website",),
+}
+_FOOD_ITEM_FIELDS: FieldsMap = {
+    "id": ("item_id",),
+    "name": ("name",),
+    "description": ("description",),
+    "price": ("price",),
+    "stock": ("stock",),
+    "type": ("type",),
+    "createdAt": ("created_at",),
+    "updatedAt": ("updated_at",),
+    "image": ("avatar",),
+    "merchant": ("merchant",),
+}
+# The merchant is used to tag the item in the response cache
+_FOOD_ITEM_REQUIRED = ("merchant",)
+_FOOD_ORDER_FIELDS: FieldsMap = {
+    "id": ("order_id",),
+    "targetAddress": ("target_address",),
+    "createdAt": ("created_at",),
+    "updatedAt": ("updated_at",),
+    "status": ("status",),
+    "receipt": ("receipt",),
+    "items": ("items",),
+    "merchant": ("merchant",),
+    "user": ("user",),
+}
 
 
 @gql.enum(description="The sort direction for pagination")
@@ -62,19 +137,165 @@ class SortDirection(str, Enum):
     DESCENDING = "desc"
 
 
-def parse_cursor(cursor: Optional[Cursor]) -> Optional[ObjectId]:
-    if cursor is None:
-        return None
-    if cursor is gql.UNSET:
-        return None
+@gql.enum(description="The field used to sort the paginated results, ties are sorted by the ID")
+class SortField(str, Enum):
+    ID = "id"
+    NAME = "name"
+    PRICE = "price"
+    CREATED_AT = "created_at"
+    UPDATED_AT = "updated_at"
+
+
+# Mapping of the sort field to the document field
+_SORT_FIELDS: Dict[SortField, str] = {
+    SortField.ID: "_id",
+    SortField.NAME: "name",
+    SortField.PRICE: "price",
+    SortField.CREATED_AT: "created_at",
+    SortField.UPDATED_AT: "updated_at",
+}
+_DATETIME_SORTS = frozenset({"created_at", "updated_at"})
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_CURSOR_SIGNATURE_SIZE = 12
+_CURSOR_SECRET = b"KIDOFOOD_SECRET_KEY"
+
+
+def set_cursor_secret(secret: str) -> None:
+    """Set the secret used to sign the pagination cursor."""
+    global _CURSOR_SECRET
+
+    _CURSOR_SECRET = secret.encode("utf-8")
+
+
+def _sign_cursor(payload: bytes) -> bytes:
+    return hmac.new(_CURSOR_SECRET, payload, hashlib.sha256).digest()[:_CURSOR_SIGNATURE_SIZE]
+
+
+def _encode_cursor(values: List[Any]) -> Cursor:
+    payload = orjson.dumps(values)
+    return base64.urlsafe_b64encode(payload + _sign_cursor(payload)).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor: Cursor) -> List[Any]:
     try:
-        return ObjectId(cursor)
-    except (TypeError, InvalidId):
-        raise ValueError(f"Invalid cursor: {cursor}")
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload, signature = raw[:-_CURSOR_SIGNATURE_SIZE], raw[-_CURSOR_SIGNATURE_SIZE:]
+        if not hmac.compare_digest(signature, _sign_cursor(payload)):
+            raise ValueError
+        values = orjson.loads(payload)
+        if not isinstance(values, list) or not values:
+            raise ValueError
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid cursor: {cursor}") from None
+    return values
 
 
-def to_cursor(obj_id: Optional[ObjectId]) -> Optional[Cursor]:
-    return str(obj_id) if obj_id is not None else None
+def _to_text_cursor(score: float, obj_id: Optional[ObjectId]) -> Cursor:
+    return _encode_cursor(["text", str(obj_id), score])
+
+
+def _parse_text_cursor(cursor: Optional[Cursor]) -> Optional[TextCursor]:
+    if cursor is None or cursor is gql.UNSET:
+        return None
+    key, *values = _decode_cursor(cursor)
+    if key != "text":
+        raise ValueError("Cursor is made for a different sort")
+    try:
+        obj_id, score = values
+        if not isinstance(score, (int, float)):
+            raise ValueError
+        return float(score), ObjectId(obj_id)
+    except (TypeError, ValueError, InvalidId):
+        raise ValueError(f"Invalid cursor: {cursor}") from None
+
+
+class Keyset:
+    """
+    Keyset pagination over a sort field, with the `_id` as the tiebreaker.
+
+    The cursor is the sort key of the last item in the page, so the next page
+    is an index range scan starting right after it, no matter how deep the page is.
+    It's an opaque signed base64 string, which also remember the sort it's made for.
+    """
+
+    def __init__(self, sort_by: SortField = SortField.ID, direction: SortDirection = SortDirection.ASC):
+        self.field = _SORT_FIELDS[sort_by]
+        self.descending = direction is SortDirection.DESCENDING
+
+    @property
+    def key(self) -> str:
+        return f"{'-' if self.descending else '+'}{self.field}"
+
+    @property
+    def sort(self) -> List[str]:
+        """The sort arguments for Beanie `.sort()`."""
+        order = "-" if self.descending else "+"
+        if self.field == "_id":
+            return [f"{order}_id"]
+        return [f"{order}{self.field}", f"{order}_id"]
+
+    @property
+    def required_fields(self) -> Tuple[str, ...]:
+        """The document fields needed to make the cursor."""
+        return () if self.field == "_id" else (self.field,)
+
+    def _encode_value(self, value: Any) -> Any:
+        if self.field in _DATETIME_SORTS:
+            # MongoDB only keep the milliseconds, naive datetime is in UTC
+            return timegm(value.utctimetuple()) * 1000 + value.microsecond // 1000
+        return value
+
+    def _decode_value(self, value: Any) -> Any:
+        if self.field in _DATETIME_SORTS:
+            if not isinstance(value, int):
+                raise ValueError
+            return _EPOCH + timedelta(milliseconds=value)
+        if self.field == "price" and not isinstance(value, (int, float)):
+            raise ValueError
+        if self.field == "name" and not isinstance(value, str):
+            raise ValueError
+        return value
+
+    def to_cursor(self, document: Any) -> Cursor:
+        values: List[Any] = [self.key, str(document.id)]
+        if self.field != "_id":
+            values.append(self._encode_value(getattr(document, self.field)))
+        return _encode_cursor(values)
+
+    def parse_cursor(self, cursor: Optional[Cursor]) -> Optional[Tuple[ObjectId, Any]]:
+        """Parse the cursor into the `_id` and sort value (`None` for `_id` sort) of the last item."""
+        if cursor is None or cursor is gql.UNSET:
+            return None
+        key, *values = _decode_cursor(cursor)
+        if key != self.key:
+            raise ValueError("Cursor is made for a different sort")
+        try:
+            last_id, *value = values
+            return ObjectId(last_id), self._decode_value(value[0]) if self.field != "_id" else None
+        except (TypeError, ValueError, IndexError, InvalidId):
+            raise ValueError(f"Invalid cursor: {cursor}") from None
+
+    def after(self, cursor: Optional[Cursor]) -> List[Any]:
+        """The query filter for the items after the cursor."""
+        parsed = self.parse_cursor(cursor)
+        if parsed is None:
+            return []
+        last_id, value = parsed
+        op = "$lt" if self.descending else "$gt"
+        if self.field == "_id":
+            return [{"_id": {op: last_id}}]
+        return [{"$or": [{self.field: {op: value}}, {self.field: value, "_id": {op: last_id}}]}]
+
+    def next_cursor(
+        self, items: List[Any], limit: int, document: Callable[[Any], Any] = lambda item: item
+    ) -> Optional[Cursor]:
+        """
+        Remove the extra item fetched to check the next page, and return the cursor of the last item.
+        """
+        if len(items) <= limit:
+            return None
+        del items[limit:]
+        return self.to_cursor(document(items[-1]))
 
 
 def sanitize_query(query: str) -> str:
@@ -118,10 +339,127 @@ def query_or_ids(
     raise ValueError("Query and ids are mutually exclusive")
 
 
+def make_nodes_projection(
+    document: Type[Document], info: Optional[Info], fields_map: FieldsMap, required: Tuple[str, ...] = ()
+):
+    """
+    Create a projection model from the `nodes` selection set of a paginated query,
+    the `required` document fields are always included.
+
+    Returns `None` if the selection cannot be determined or has a field that we
+    cannot map, in which case the full document should be fetched.
+    """
+    selected = get_selected_fields(info, "nodes")
+    if selected is None:
+        return None
+    db_fields: set[str] = set(required)
+    for name in selected:
+        if name == "__typename":
+            continue
+        mapped = fields_map.get(name)
+        if mapped is None:
+            return None
+        db_fields.update(mapped)
+    return create_projection(document, db_fields)
+
+
+def _bound_limit(limit: int) -> int:
+    # The limit is also used by the query cost, so keep it in the same bound
+    return max(1, min(limit, MAX_PAGE_LIMIT))
+
+
+def wants_total_results(info: Optional[Info]) -> bool:
+    """Check if the `pageInfo.totalResults` is selected, assume it is if the selection cannot be determined."""
+    selected = get_selected_fields(info, "pageInfo")
+    return selected is None or "totalResults" in selected
+
+
+async def fetch_page_and_total(
+    page: Awaitable[List[Any]], count_total: Callable[[], Awaitable[int]], info: Optional[Info]
+) -> Tuple[List[Any], int]:
+    """
+    Fetch a page and the total results concurrently, the total is only counted if it's selected.
+
+    The total is `0` if it's not selected, since it will not be sent anyway.
+    """
+    if not wants_total_results(info):
+        return await page, 0
+    items, total = await asyncio.gather(page, count_total())
+    return items, total
+
+
+async def resolve_text_search(
+    document: Type[Document],
+    filters: List[Any],
+    query: str,
+    limit: int,
+    cursor: Optional[Cursor],
+    fields_map: FieldsMap,
+    mapper: Callable[[Any], Any],
+    info: Optional[Info] = None,
+    route: Optional[ReadRoute] = None,
+    required_fields: Tuple[str, ...] = (),
+) -> Optional[Connection]:
+    """
+    Search the document using the text index, sorted by relevance.
+
+    Returns `None` if the text search cannot be done (e.g. missing text index),
+    in which case the caller should fallback to the regex search.
+    """
+    text_cursor = _parse_text_cursor(cursor)
+    text_query = [*filters, OpText(query.strip())]
+
+    try:
+        results, items_count = await fetch_page_and_total(
+            find_text_page(
+                find_routed(document, *text_query, route=route),
+                limit=limit + 1,
+                cursor=text_cursor,
+                projection_model=make_nodes_projection(document, info, fields_map, required_fields),
+            ),
+            lambda: find_routed(document, *text_query, route=route).count(),
+            info,
+        )
+    except OperationFailure as exc:
+        logger.warning(f"Text search on {document.__name__} failed, falling back to regex search: {exc}")
+        return None
+
+    next_cursor = None
+    if len(results) > limit:
+        score, last_item = results.pop()
+        next_cursor = _to_text_cursor(score, last_item.id)
+
+    mapped_items = [mapper(item) for _, item in results]
+
+    return Connection(
+        count=len(mapped_items),
+        page_info=PageInfo(
+            total_results=items_count,
+            per_page=limit,
+            next_cursor=next_cursor,
+            has_next_page=next_cursor is not None,
+        ),
+        nodes=mapped_items,
+    )
+
+
+def get_order_lookups(info: Optional[Info]) -> Set[str]:
+    """
+    Get the order relations that should be joined with `$lookup` from the `nodes` selection set.
+    """
+    selected = get_selected_fields(info, "nodes")
+    if not selected:
+        return set()
+    lookups = selected & {"merchant", "user"}
+    if "items" in selected and "data" in (get_selected_fields(info, "nodes", "items") or set()):
+        lookups.add("items")
+    return lookups
+
+
 async def resolve_user_from_db(
     user: UserGQL,
 ) -> UserDB:
-    find_match = await UserDB.find_one(OpEq(UserDB.user_id, user.id))
+    find_match = await sample_query(UserDB.find_one(OpEq(UserDB.user_id, user.id)))
     if find_match is None:
         raise Exception("User not found")
     return find_match
@@ -133,18 +471,38 @@ async def resolve_merchant_paginated(
     limit: int = 20,
     cursor: Optional[Cursor] = gql.UNSET,
     sort: SortDirection = SortDirection.ASC,
+    sort_by: SortField = SortField.ID,
     status: list[ApprovalStatusGQL] = [
         ApprovalStatusGQL.APPROVED,
         ApprovalStatusGQL.PENDING,
         ApprovalStatusGQL.REJECTED,
     ],
+    info: Optional[Info] = None,
+    route: Optional[ReadRoute] = None,
+    search_mode: str = "regex",
 ) -> Connection[MerchantGQL]:
+    if sort_by is SortField.PRICE:
+        raise ValueError("Merchants cannot be sorted by price")
+    limit = _bound_limit(limit)
     act_limit = limit + 1
-    direction = "-" if sort is SortDirection.DESCENDING else "+"
+    keyset = Keyset(sort_by, sort)
 
     ids_set = query_or_ids(query, id)
-    cursor_id = parse_cursor(cursor)
-
+    # The text search is sorted by relevance, use the regex search if a sort field is requested
+    if search_mode == "text" and sort_by is SortField.ID and isinstance(ids_set, str) and isinstance(query, str):
+        text_results = await resolve_text_search(
+            MerchantDB,
+            [OpIn(MerchantDB.approved, status)],
+            query,
+            limit,
+            cursor,
+            _MERCHANT_FIELDS,
+            MerchantGQL.from_db,
+            info=info,
+            route=route,
+        )
+        if text_results is not None:
+            return text_results
     items_args = []
     items_args.append(OpIn(MerchantDB.approved, status))
     added_query_id = False
@@ -154,44 +512,42 @@ async def resolve_merchant_paginated(
     elif isinstance(ids_set, str):
         items_args.append(OpRegEx(MerchantDB.name, ids_set, options="i"))
         added_query_id = True
-    if cursor_id is not None:
-        items_args.append(MerchantDB.id >= cursor_id)
-
-    items = (
-        await MerchantDB.find(
+    items_args.extend(keyset.after(cursor))
+
+    async def count_total() -> int:
+        if not added_query_id:
+            total = await get_counters_total(merchant_counter(approval) for approval in status)
+            if total is not None:
+                return total
+        # Status filter, and the query/ids filter if any
+        count_args = items_args[0:2] if added_query_id else items_args[0:1]
+        return await find_routed(MerchantDB, *count_args, route=route).count()
+
+    items, items_count = await fetch_page_and_total(
+        find_routed(
+            MerchantDB,
             *items_args,
+            route=route,
+            projection_model=make_nodes_projection(MerchantDB, info, _MERCHANT_FIELDS, keyset.required_fields),
         )
-        .sort(f"{direction}_id")
+        .sort(*keyset.sort)
         .limit(act_limit)
-        .to_list()
+        .to_list(),
+        count_total,
+        info,
     )
-    if len(items) < 1:
-        return Connection(
-            count=0,
-            page_info=PageInfo(total_results=0, per_page=limit, next_cursor=None, has_next_page=False),
-            nodes=[],
-        )
-
-    if added_query_id:
-        items_count = await MerchantDB.find(*items_args[0:2]).count()
-    else:
-        items_count = await MerchantDB.find().count()
 
-    last_item = None
-    if len(items) > limit:
-        last_item = items.pop()
-    next_cursor = last_item.id if last_item is not None else None
-    has_next_page = next_cursor is not None
+    next_cursor = keyset.next_cursor(items, limit)
 
-    mapped_items = [MerchantGQL.from_db(item) for item in items]
+    mapped_items = [MerchantGQL.from_db(cast(MerchantDB, item)) for item in items]
 
     return Connection(
         count=len(mapped_items),
         page_info=PageInfo(
             total_results=items_count,
             per_page=limit,
-            next_cursor=to_cursor(next_cursor),
-            has_next_page=has_next_page,
+            next_cursor=next_cursor,
+            has_next_page=next_cursor is not None,
         ),
         nodes=mapped_items,
     )
@@ -203,12 +559,32 @@ async def resolve_food_items_paginated(
     limit: int = 20,
     cursor: Optional[Cursor] = gql.UNSET,
     sort: SortDirection = SortDirection.ASC,
+    sort_by: SortField = SortField.ID,
+    info: Optional[Info] = None,
+    route: Optional[ReadRoute] = None,
+    search_mode: str = "regex",
 ) -> Connection[FoodItemGQL]:
+    limit = _bound_limit(limit)
     act_limit = limit + 1
-    direction = "-" if sort is SortDirection.DESCENDING else "+"
+    keyset = Keyset(sort_by, sort)
 
     ids_set = query_or_ids(query, id)
-    cursor_id = parse_cursor(cursor)
+    # The text search is sorted by relevance, use the regex search if a sort field is requested
+    if search_mode == "text" and sort_by is SortField.ID and isinstance(ids_set, str) and isinstance(query, str):
+        text_results = await resolve_text_search(
+            FoodItemDB,
+            [],
+            query,
+            limit,
+            cursor,
+            _FOOD_ITEM_FIELDS,
+            FoodItemGQL.from_db,
+            info=info,
+            route=route,
+            required_fields=_FOOD_ITEM_REQUIRED,
+        )
+        if text_results is not None:
+            return text_results
 
     items_args = []
     added_query_id = False
@@ -218,44 +594,43 @@ async def resolve_food_items_paginated(
     elif isinstance(ids_set, str):
         items_args.append(OpRegEx(FoodItemDB.name, ids_set, options="i"))
         added_query_id = True
-    if cursor_id is not None:
-        items_args.append(FoodItemDB.id >= cursor_id)
-
-    items = (
-        await FoodItemDB.find(
+    items_args.extend(keyset.after(cursor))
+
+    async def count_total() -> int:
+        if added_query_id:
+            return await find_routed(FoodItemDB, items_args[0], route=route).count()
+        total = await get_counters_total([item_counter()])
+        if total is None:
+            total = await find_routed(FoodItemDB, route=route).count()
+        return total
+
+    items, items_count = await fetch_page_and_total(
+        find_routed(
+            FoodItemDB,
             *items_args,
+            route=route,
+            projection_model=make_nodes_projection(
+                FoodItemDB, info, _FOOD_ITEM_FIELDS, (*_FOOD_ITEM_REQUIRED, *keyset.required_fields)
+            ),
         )
-        .sort(f"{direction}_id")
+        .sort(*keyset.sort)
         .limit(act_limit)
-        .to_list()
+        .to_list(),
+        count_total,
+        info,
     )
-    if len(items) < 1:
-        return Connection(
-            count=0,
-            page_info=PageInfo(total_results=0, per_page=limit, next_cursor=None, has_next_page=False),
-            nodes=[],
-        )
-
-    if added_query_id:
-        items_count = await FoodItemDB.find(items_args[0]).count()
-    else:
-        items_count = await FoodItemDB.find().count()
 
-    last_item = None
-    if len(items) > limit:
-        last_item = items.pop()
-    next_cursor = last_item.id if last_item is not None else None
-    has_next_page = next_cursor is not None
+    next_cursor = keyset.next_cursor(items, limit)
 
-    mapped_items = [FoodItemGQL.from_db(item) for item in items]
+    mapped_items = [FoodItemGQL.from_db(cast(FoodItemDB, item)) for item in items]
 
     return Connection(
         count=len(mapped_items),
         page_info=PageInfo(
             total_results=items_count,
             per_page=limit,
-            next_cursor=to_cursor(next_cursor),
-            has_next_page=has_next_page,
+            next_cursor=next_cursor,
+            has_next_page=next_cursor is not None,
         ),
         nodes=mapped_items,
     )
@@ -266,56 +641,68 @@ async def resolve_food_order_paginated(
     limit: int = 20,
     cursor: Optional[Cursor] = gql.UNSET,
     sort: SortDirection = SortDirection.ASC,
+    info: Optional[Info] = None,
 ) -> Connection[FoodOrderGQL]:
+    limit = _bound_limit(limit)
     act_limit = limit + 1
     direction = "-" if sort is SortDirection.DESCENDING else "+"
+    # The active and archived orders are merged by the `_id`, so it's the only supported sort
+    keyset = Keyset(SortField.ID, sort)
 
     ids_set = query_or_ids(None, id)
-    cursor_id = parse_cursor(cursor)
 
     items_args = []
     added_query_id = False
     if isinstance(ids_set, list) and len(ids_set) > 0:
         items_args.append(OpIn(FoodOrderDB.id, ids_set))
         added_query_id = True
-    if cursor_id is not None:
-        items_args.append(FoodOrderDB.id >= cursor_id)
+    items_args.extend(keyset.after(cursor))
 
-    items = (
-        await FoodOrderDB.find(
+    projection_model = make_nodes_projection(FoodOrderDB, info, _FOOD_ORDER_FIELDS)
+    lookups = get_order_lookups(info)
+    page: Awaitable[List[Any]]
+    if lookups:
+        page = find_orders_page_with_lookups(
             *items_args,
+            lookups=lookups,
+            direction=direction,
+            limit=act_limit,
+            projection_model=projection_model,
         )
-        .sort(f"{direction}_id")
-        .limit(act_limit)
-        .to_list()
-    )
-    if len(items) < 1:
-        return Connection(
-            count=0,
-            page_info=PageInfo(total_results=0, per_page=limit, next_cursor=None, has_next_page=False),
-            nodes=[],
+    else:
+        page = find_orders_page(
+            *items_args,
+            direction=direction,
+            limit=act_limit,
+            projection_model=projection_model,
         )
 
-    if added_query_id:
-        items_count = await FoodOrderDB.find(items_args[0]).count()
-    else:
-        items_count = await FoodOrderDB.find().count()
+    async def count_total() -> int:
+        if added_query_id:
+            return await count_orders(items_args[0])
+        total = await get_counters_total([order_counter()])
+        if total is None:
+            total = await count_orders()
+        return total
 
-    last_item = None
-    if len(items) > limit:
-        last_item = items.pop()
-    next_cursor = last_item.id if last_item is not None else None
-    has_next_page = next_cursor is not None
+    items, items_count = await fetch_page_and_total(page, count_total, info)
 
-    mapped_items = [FoodOrderGQL.from_db(item) for item in items]
+    next_cursor = keyset.next_cursor(
+        items, limit, lambda item: item.order if isinstance(item, OrderWithLookups) else item
+    )
+
+    if lookups:
+        mapped_items = [FoodOrderGQL.from_lookups(item) for item in items]
+    else:
+        mapped_items = [FoodOrderGQL.from_db(cast(FoodOrderDB, item)) for item in items]
 
     return Connection(
         count=len(mapped_items),
         page_info=PageInfo(
             total_results=items_count,
             per_page=limit,
-            next_cursor=to_cursor(next_cursor),
-            has_next_page=has_next_page,
+            next_cursor=next_cursor,
+            has_next_page=next_cursor is not None,
         ),
         nodes=mapped_items,
     )
@@ -0,0 +1,214 @@
+"""
+MIT License
+
+Copyright (c) 2022-present noaione
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+from typing import Any, Dict, Iterable, Optional
+
+import orjson
+from graphql import DocumentNode, FieldNode, OperationType
+from graphql.utilities import get_operation_ast
+from redis import asyncio as aioredis
+
+from internals.redbridge import RedisBridge
+
+from .persisted import hash_query
+
+__all__ = (
+    "ITEM_LIST_TAG",
+    "MERCHANT_LIST_TAG",
+    "ResponseCache",
+    "create_response_cache",
+    "get_response_cache",
+    "invalidate_response_cache",
+    "is_cacheable_operation",
+    "merchant_items_tag",
+    "merchant_tag",
+)
+
+# Tag for responses that list merchants/items without an explicit id filter,
+# those can change when a new merchant/item is added.
+MERCHANT_LIST_TAG = "merchants"
+ITEM_LIST_TAG = "items"
+# Root fields that only return the public catalog, the same for every anonymous user
+_CACHEABLE_ROOT_FIELDS = frozenset({"merchants", "items", "search", "__typename"})
+_GLOBAL_RESPONSE_CACHE: Optional[ResponseCache] = None
+logger = logging.getLogger("GraphQL.ResponseCache")
+
+
+def merchant_tag(merchant_id: Any) -> str:
+    """The tag of a merchant data, `merchant_id` is the ObjectId of the merchant."""
+    return f"merchant:{merchant_id}"
+
+
+def merchant_items_tag(merchant_id: Any) -> str:
+    """The tag of the items owned by a merchant, `merchant_id` is the ObjectId of the merchant."""
+    return f"items:merchant:{merchant_id}"
+
+
+def is_cacheable_operation(document: DocumentNode, operation_name: Optional[str] = None) -> bool:
+    """Check if the operation is a query that only select the public catalog fields."""
+    operation = get_operation_ast(document, operation_name)
+    if operation is None or operation.operation != OperationType.QUERY:
+        return False
+    for selection in operation.selection_set.selections:
+        # Fragment on the root is rarely used, don't bother resolving it
+        if not isinstance(selection, FieldNode) or selection.name.value not in _CACHEABLE_ROOT_FIELDS:
+            return False
+    return True
+
+
+class ResponseCache:
+    """
+    A Redis backed cache of the GraphQL responses, keyed by the query, variables and auth scope.
+
+    Each entry is indexed by the tags of the entities it contains, so a write
+    can invalidate only the responses that include the changed entities.
+    Every invalidation also bumps a version, which is combined with the entry key
+    to make an ETag that can be checked without executing the operation.
+    """
+
+    def __init__(self, redis: RedisBridge, ttl: int = 60, *, key_prefix: str = "kidofood:gqlcache:") -> None:
+        self._redis = redis
+        self._ttl = ttl
+        self._key_prefix = key_prefix
+
+    async def _ensure_connected(self) -> None:
+        if not self._redis.is_connected:
+            await self._redis.connect()
+
+    def _tag_key(self, tag: str) -> str:
+        return f"{self._key_prefix}tag:{tag}"
+
+    @property
+    def _version_key(self) -> str:
+        return f"{self._key_prefix}version"
+
+    def make_key(
+        self, query: str, variables: Optional[Dict[str, Any]], operation_name: Optional[str], scope: str
+    ) -> str:
+        payload = orjson.dumps(
+            {"query": hash_query(query), "variables": variables or {}, "operation": operation_name, "scope": scope},
+            option=orjson.OPT_SORT_KEYS,
+        )
+        return f"{self._key_prefix}entry:{hashlib.sha256(payload).hexdigest()}"
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        await self._ensure_connected()
+        data = await self._redis.get(key)
+        if not isinstance(data, dict):
+            return None
+        return data
+
+    async def make_etag(self, key: str) -> Optional[str]:
+        """
+        Make the ETag of the entry `key`, which changes every time the cached responses are invalidated.
+
+        Returns `None` if the version can't be fetched.
+        """
+        await self._ensure_connected()
+        version = await self._redis.get(self._version_key, 0)
+        if not isinstance(version, (int, float)):
+            return None
+        return f'"{hashlib.sha256(f"{key}:{int(version)}".encode("utf-8")).hexdigest()[:32]}"'
+
+    async def set(self, key: str, response: Dict[str, Any], tags: Iterable[str]) -> None:
+        await self._ensure_connected()
+        if not await self._redis.setex(key, response, self._ttl):
+            return
+        tags = set(tags)
+        if not tags:
+            return
+        async with self._redis.lock_env("gqlcache_set"):
+            try:
+                async with self._redis.client.pipeline(transaction=False) as pipe:
+                    for tag in tags:
+                        pipe.sadd(self._tag_key(tag), key)
+                        pipe.expire(self._tag_key(tag), self._ttl)
+                    await pipe.execute()
+            except aioredis.RedisError as exc:
+                # Without the tag index the entry can't be invalidated, drop it
+                logger.warning(f"Failed to index cached response {key}: {exc}")
+                await self._redis.rm(key)
+
+    async def invalidate(self, *tags: str) -> int:
+        """Remove every cached response tagged with any of `tags`, returns the number of removed responses."""
+        if not tags:
+            return 0
+        await self._ensure_connected()
+        tag_keys = [self._tag_key(tag) for tag in set(tags)]
+        entries = set()
+        async with self._redis.lock_env("gqlcache_invalidate"):
+            try:
+                async with self._redis.client.pipeline(transaction=False) as pipe:
+                    for tag_key in tag_keys:
+                        pipe.smembers(tag_key)
+                    members = await pipe.execute()
+                entries = {entry for tagged in members for entry in tagged}
+                async with self._redis.client.pipeline(transaction=False) as pipe:
+                    pipe.delete(*entries, *tag_keys)
+                    # Even without any cached entry, clients can still hold a response with the old ETag
+                    pipe.incr(self._version_key)
+                    await pipe.execute()
+            except aioredis.RedisError as exc:
+                # The entries will expire by themselves, don't fail the write because of it
+                logger.error(f"Failed to invalidate cached responses for {tags}: {exc}")
+                return 0
+        logger.debug(f"Invalidated {len(entries)} cached responses for {tags}")
+        return len(entries)
+
+    async def close(self) -> None:
+        if self._redis.is_connected:
+            await self._redis.close()
+
+
+def create_response_cache(
+    redis_host: Optional[str] = None,
+    redis_port: int = 6379,
+    redis_password: Optional[str] = None,
+    *,
+    ttl: int = 0,
+) -> Optional[ResponseCache]:
+    global _GLOBAL_RESPONSE_CACHE
+
+    redis_host = redis_host.strip() if isinstance(redis_host, str) else redis_host
+    if not redis_host or ttl <= 0:
+        _GLOBAL_RESPONSE_CACHE = None
+        return None
+    _GLOBAL_RESPONSE_CACHE = ResponseCache(RedisBridge(redis_host, redis_port, redis_password), ttl)
+    return _GLOBAL_RESPONSE_CACHE
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    return _GLOBAL_RESPONSE_CACHE
+
+
+async def invalidate_response_cache(*tags: str) -> None:
+    """Invalidate the cached responses with the tags, does nothing if the response cache is disabled."""
+    cache = get_response_cache()
+    if cache is None:
+        return
+    await cache.invalidate(*tags)
@@ -24,15 +24,23 @@ SOFTWARE.
 
 from __future__ import annotations
 
+import asyncio
+import hashlib
+import json
 import logging
-from typing import Optional
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Union
 
+import orjson
 from fastapi import Request, Response
 from fastapi.responses import PlainTextResponse
+from graphql import GraphQLError
+from graphql import OperationType as GraphQLOperationType
+from graphql import get_operation_ast, parse
 from starlette import status
 from strawberry.exceptions import MissingQueryError
 from strawberry.fastapi import GraphQLRouter
-from strawberry.http import parse_request_data
+from strawberry.http import GraphQLRequestData, parse_request_data
 from strawberry.schema.exceptions import InvalidOperationTypeError
 from strawberry.types.graphql import OperationType
 
@@ -40,24 +48,160 @@ from internals.responses import ORJSONXResponse
 from internals.session import SessionError, UserSession
 
 from .context import KidoFoodContext
+from .extensions import get_document_cache
+from .persisted import get_persisted_query_store, hash_query
+from .response_cache import get_response_cache, is_cacheable_operation
 
 __all__ = ("KidoGraphQLRouter",)
 
 logger = logging.getLogger("GraphQL.Router")
 
 
+def _persisted_query_error(message: str, code: str) -> ORJSONXResponse:
+    # Follow the Apollo protocol, the client will retry with the full query on this error
+    return ORJSONXResponse(
+        {"data": None, "errors": [{"message": message, "extensions": {"code": code}}]},
+        status_code=status.HTTP_200_OK,
+    )
+
+
+@dataclass
+class OperationResult:
+    data: Dict[str, Any]
+    """The result to be sent to the client"""
+    cache: Optional[str] = None
+    """The response cache status (HIT or MISS), if the operation is cacheable"""
+    public: bool = False
+    """Whether the result is a public catalog data without errors, which can be cached by HTTP caches"""
+    etag: Optional[str] = None
+    """The ETag of the response cache entry, if the operation is cacheable"""
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison, as required for If-None-Match
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+def _error_result(response: Response) -> Dict[str, Any]:
+    # An operation error in a batch is sent as the operation result instead
+    if isinstance(response, ORJSONXResponse):
+        return orjson.loads(response.body)
+    return {"data": None, "errors": [{"message": bytes(response.body).decode("utf-8")}]}
+
+
+def _is_query_operation(data: Any) -> bool:
+    # Anything that we can't tell before executing it (e.g. a persisted query hash) is not assumed as a query
+    if not isinstance(data, dict) or not isinstance(data.get("query"), str):
+        return False
+    document = get_document_cache().get(data["query"])
+    if document is None:
+        try:
+            document = parse(data["query"])
+        except GraphQLError:
+            return False
+    operation_name = data.get("operationName")
+    operation = get_operation_ast(document, operation_name if isinstance(operation_name, str) else None)
+    return operation is not None and operation.operation == GraphQLOperationType.QUERY
+
+
 class KidoGraphQLRouter(GraphQLRouter):
-    async def execute_request(
-        self, request: Request, response: Response, data: dict, context: KidoFoodContext, root_value
-    ) -> Response:
+    def __init__(
+        self, *args: Any, max_batch_size: int = 10, cache_control: Optional[str] = None, **kwargs: Any
+    ) -> None:
+        super().__init__(*args, **kwargs)
+        self.max_batch_size = max_batch_size
+        # Cache-Control of the public queries over GET, `None` to not send the caching headers
+        self.cache_control = cache_control
+
+    async def resolve_persisted_query(self, data: Dict[str, Any]) -> Optional[Response]:
+        """
+        Resolve the automatic persisted query in `data` (in-place), returning a response if it can't be resolved.
+        """
+        extensions = data.get("extensions")
+        if isinstance(extensions, str):
+            # Query params from GET request
+            try:
+                extensions = json.loads(extensions)
+            except json.JSONDecodeError:
+                return PlainTextResponse("Unable to parse extensions as JSON", status_code=status.HTTP_400_BAD_REQUEST)
+        if not isinstance(extensions, dict) or not isinstance(extensions.get("persistedQuery"), dict):
+            return None
+
+        persisted = extensions["persistedQuery"]
+        if persisted.get("version") != 1:
+            return PlainTextResponse("Unsupported persisted query version", status_code=status.HTTP_400_BAD_REQUEST)
+        store = get_persisted_query_store()
+        if store is None:
+            return _persisted_query_error("PersistedQueryNotSupported", "PERSISTED_QUERY_NOT_SUPPORTED")
+        query_hash = persisted.get("sha256Hash")
+        if not isinstance(query_hash, str):
+            return PlainTextResponse("Missing persisted query hash", status_code=status.HTTP_400_BAD_REQUEST)
+
+        query = data.get("query")
+        if isinstance(query, str):
+            # Register the query for the next request
+            if hash_query(query) != query_hash.lower():
+                return PlainTextResponse("Provided sha does not match query", status_code=status.HTTP_400_BAD_REQUEST)
+            await store.set(query_hash.lower(), query)
+            return None
+
+        query = await store.get(query_hash.lower())
+        if query is None:
+            return _persisted_query_error("PersistedQueryNotFound", "PERSISTED_QUERY_NOT_FOUND")
+        data["query"] = query
+        return None
+
+    def is_public_operation(self, request_data: GraphQLRequestData, context: KidoFoodContext) -> bool:
+        """
+        Check if the operation is a public catalog query of an anonymous user, which result is the same for everyone
+        and can be cached by the response cache and HTTP caches.
+        """
+        if context.user is not None:
+            return False
+        document = get_document_cache().get(request_data.query)
+        if document is None:
+            try:
+                document = parse(request_data.query)
+            except GraphQLError:
+                return False
+        return is_cacheable_operation(document, request_data.operation_name)
+
+    def _not_modified(self, etag: str) -> Response:
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag, "Cache-Control": str(self.cache_control)}
+        )
+
+    async def execute_operation(
+        self,
+        request: Request,
+        data: Any,
+        context: KidoFoodContext,
+        root_value: Any,
+        *,
+        if_none_match: Optional[str] = None,
+    ) -> Union[Response, OperationResult]:
+        """
+        Execute a single operation, returns the result or the error response if it cannot be executed.
+
+        If `if_none_match` matches the ETag of the response cache entry, a 304 response is returned
+        without executing the operation.
+        """
+        if not isinstance(data, dict):
+            return PlainTextResponse("Operation must be a JSON object", status_code=status.HTTP_400_BAD_REQUEST)
+        # <-- KidoFood: Automatic persisted queries
+        persisted_response = await self.resolve_persisted_query(data)
+        if persisted_response is not None:
+            return persisted_response
+        # -->
         try:
             request_data = parse_request_data(data)
         except MissingQueryError:
-            missing_query_response = PlainTextResponse(
+            return PlainTextResponse(
                 "No GraphQL query found in the request",
                 status_code=status.HTTP_400_BAD_REQUEST,
             )
-            return self._merge_responses(response, missing_query_response)
 
         method = request.method
         allowed_operation_types = OperationType.from_http(method)
@@ -65,15 +209,33 @@ class KidoGraphQLRouter(GraphQLRouter):
         if not self.allow_queries_via_get and method == "GET":
             allowed_operation_types = allowed_operation_types - {OperationType.QUERY}
 
-        try:
-            result = await self.execute(
-                request_data.query,
-                variables=request_data.variables,
-                context=context,
-                operation_name=request_data.operation_name,
-                root_value=root_value,
-                allowed_operation_types=allowed_operation_types,
+        # <-- KidoFood: Response cache
+        public = OperationType.QUERY in allowed_operation_types and self.is_public_operation(request_data, context)
+        response_cache = get_response_cache()
+        cache_key: Optional[str] = None
+        if response_cache is not None and public:
+            cache_key = response_cache.make_key(
+                request_data.query, request_data.variables, request_data.operation_name, "anonymous"
             )
+            # Fetched before executing, a write in the middle of it will change the ETag of the next request
+            etag = await response_cache.make_etag(cache_key)
+            if etag is not None and if_none_match is not None and _etag_matches(if_none_match, etag):
+                return self._not_modified(etag)
+            cached_data = await response_cache.get(cache_key)
+            if cached_data is not None:
+                return OperationResult(cached_data, cache="HIT", public=True, etag=etag)
+        # -->
+
+        try:
+            with context.collect_cache_tags() as cache_tags:
+                result = await self.execute(
+                    request_data.query,
+                    variables=request_data.variables,
+                    context=context,
+                    operation_name=request_data.operation_name,
+                    root_value=root_value,
+                    allowed_operation_types=allowed_operation_types,
+                )
         except InvalidOperationTypeError as e:
             return PlainTextResponse(
                 e.as_http_error_reason(method),
@@ -82,12 +244,16 @@ class KidoGraphQLRouter(GraphQLRouter):
 
         response_data = await self.process_result(request, result)
 
-        # <-- KidoFood: Change response to ORJSONXResponse
-        actual_response: ORJSONXResponse = ORJSONXResponse(
-            response_data,
-            status_code=status.HTTP_200_OK,
-        )
+        # <-- KidoFood: Store the response without errors to the cache, traced response is never cached
+        public = public and not result.errors and "tracing" not in (result.extensions or {})
+        if response_cache is not None and cache_key is not None:
+            if public:
+                await response_cache.set(cache_key, response_data, cache_tags)
+            return OperationResult(response_data, cache="MISS", public=public, etag=etag)
         # -->
+        return OperationResult(response_data, public=public)
+
+    async def update_session(self, request: Request, context: KidoFoodContext, response: Response) -> None:
         # <-- KidoFood: Add session updater using latch
         if context.session_latch:
             logger.info("Updating session because of latch is True")
@@ -100,9 +266,81 @@ class KidoGraphQLRouter(GraphQLRouter):
                     pass
                     # Delete user session
                 if cr_user is not None:
-                    await context.session.remove_session(cr_user.session_id, actual_response)
+                    await context.session.remove_session(cr_user.session_id, response)
             else:
-                await context.session.set_session(context.user, actual_response)
+                await context.session.set_session(context.user, response)
+        # -->
+
+    async def execute_batch(
+        self, request: Request, response: Response, data: List[Any], context: KidoFoodContext, root_value
+    ) -> Response:
+        """
+        Execute a batch of operations sharing the same context (session and data loaders).
+
+        Query-only batch is executed concurrently, otherwise the operations are executed in order
+        since mutations can change the session user.
+        """
+        if self.max_batch_size <= 0:
+            return self._merge_responses(
+                response,
+                PlainTextResponse("Batched operations are not supported", status_code=status.HTTP_400_BAD_REQUEST),
+            )
+        if not data or len(data) > self.max_batch_size:
+            return self._merge_responses(
+                response,
+                PlainTextResponse(
+                    f"Batch must contain 1 to {self.max_batch_size} operations",
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                ),
+            )
+
+        results: List[Union[Response, OperationResult]] = []
+        if all(_is_query_operation(operation) for operation in data):
+            results = await asyncio.gather(
+                *(self.execute_operation(request, operation, context, root_value) for operation in data)
+            )
+        else:
+            for operation in data:
+                results.append(await self.execute_operation(request, operation, context, root_value))
+        actual_response = ORJSONXResponse(
+            [_error_result(result) if isinstance(result, Response) else result.data for result in results],
+            status_code=status.HTTP_200_OK,
+        )
+        await self.update_session(request, context, actual_response)
+        return self._merge_responses(response, actual_response)
+
+    async def execute_request(
+        self, request: Request, response: Response, data: Any, context: KidoFoodContext, root_value
+    ) -> Response:
+        # <-- KidoFood: Batched operations
+        if isinstance(data, list):
+            return await self.execute_batch(request, response, data, context, root_value)
+        # -->
+        http_cache = request.method == "GET" and self.cache_control is not None
+        if_none_match = request.headers.get("if-none-match") if http_cache else None
+        result = await self.execute_operation(request, data, context, root_value, if_none_match=if_none_match)
+        if isinstance(result, Response):
+            return self._merge_responses(response, result)
+
+        # <-- KidoFood: Change response to ORJSONXResponse
+        actual_response: ORJSONXResponse = ORJSONXResponse(
+            result.data,
+            status_code=status.HTTP_200_OK,
+        )
+        # -->
+        if result.cache is not None:
+            actual_response.headers["X-Cache"] = result.cache
+        # <-- KidoFood: HTTP caching of the public queries over GET
+        if http_cache and result.public:
+            etag = result.etag
+            if etag is None:
+                # Without the response cache the ETag is the hash of the executed response,
+                # so the 304 response only saves the bandwidth and not the execution.
+                etag = f'"{hashlib.sha256(actual_response.body).hexdigest()[:32]}"'
+                if if_none_match is not None and _etag_matches(if_none_match, etag):
+                    return self._merge_responses(response, self._not_modified(etag))
+            actual_response.headers.update({"ETag": etag, "Cache-Control": str(self.cache_control)})
         # -->
+        await self.update_session(request, context, actual_response)
 
         return self._merge_responses(response, actual_response)
@@ -0,0 +1,69 @@
+"""
+MIT License
+
+Copyright (c) 2022-present noaione
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+from __future__ import annotations
+
+from typing import Iterable, List, Optional, Set
+
+from strawberry.types import Info
+from strawberry.types.nodes import FragmentSpread, InlineFragment, SelectedField, Selection
+
+__all__ = (
+    "flatten_selections",
+    "get_selected_fields",
+)
+
+
+def flatten_selections(selections: Iterable[Selection]) -> List[SelectedField]:
+    """
+    Flatten a list of selection, expanding any fragment spread or inline fragment.
+    """
+    flattened: List[SelectedField] = []
+    for selection in selections:
+        if isinstance(selection, SelectedField):
+            flattened.append(selection)
+        elif isinstance(selection, (FragmentSpread, InlineFragment)):
+            flattened.extend(flatten_selections(selection.selections))
+    return flattened
+
+
+def get_selected_fields(info: Optional[Info], *path: str) -> Optional[Set[str]]:
+    """
+    Get the selected field names (in GraphQL naming) under the provided path
+    relative to the current resolved field.
+
+    Returns `None` if the selection set cannot be determined, and an empty set
+    if the path exist but nothing is selected or the path is not selected at all.
+    """
+    if info is None:
+        return None
+    # Start from the children of the current resolved field
+    current: List[Selection] = [
+        inner for selected in flatten_selections(info.selected_fields) for inner in selected.selections
+    ]
+    for name in path:
+        current = [
+            inner for selected in flatten_selections(current) if selected.name == name for inner in selected.selections
+        ]
+    return {selected.name for selected in flatten_selections(current)}
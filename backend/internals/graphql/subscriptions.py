@@ -29,19 +29,20 @@ from typing import AsyncGenerator, cast
 import strawberry as gql
 
 from internals.db import FoodOrder as FoodOrderDB
-from internals.pubsub import get_pubsub
+from internals.db import find_order
+from internals.pubsub import PubSubFanout
 from internals.utils import to_uuid
 
 from .models import FoodOrderGQL
 
 __all__ = ("subs_order_update",)
+# Every connection watching the same order share the lookup, listener and serialization
+_ORDER_UPDATES = PubSubFanout(lambda data: FoodOrderGQL.from_db(cast(FoodOrderDB, data)))
 
 
 async def subs_order_update(id: gql.ID) -> AsyncGenerator[FoodOrderGQL, None]:
-    verify_id = await FoodOrderDB.find_one(FoodOrderDB.order_id == to_uuid(id))
-    if verify_id is None:
-        return
+    async def verify_order() -> bool:
+        return await find_order(FoodOrderDB.order_id == to_uuid(id)) is not None
 
-    pubsub = get_pubsub()
-    async for data in pubsub.listen(f"order:updated:{id}"):
-        yield FoodOrderGQL.from_db(cast(FoodOrderDB, data))
+    async for order in _ORDER_UPDATES.listen(f"order:updated:{id}", verify_order):
+        yield order
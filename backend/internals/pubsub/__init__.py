@@ -8,3 +8,4 @@ Some internal pubsub module to handle communication between functions.
 """
 
 from .client import *
+from .fanout import *
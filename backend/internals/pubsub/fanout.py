@@ -0,0 +1,131 @@
+"""
+MIT License
+
+Copyright (c) 2022-present noaione
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+---
+
+Fan out a pubsub topic to many subscribers, with a single upstream listener per topic.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Any, AsyncGenerator, Awaitable, Callable, Dict, Generic, Optional, Set, TypeVar
+
+from .client import get_pubsub
+
+__all__ = ("PubSubFanout",)
+T = TypeVar("T")
+logger = logging.getLogger("Internals.PubSub.Fanout")
+# Sent to the subscribers when the upstream listener stopped
+_CLOSED = object()
+
+
+@dataclass
+class _FanoutTopic:
+    verified: asyncio.Future[bool]
+    queues: Set[asyncio.Queue[Any]] = field(default_factory=set)
+    task: Optional[asyncio.Task] = None
+
+
+class PubSubFanout(Generic[T]):
+    """
+    Share one upstream listener per topic between every subscriber of that topic.
+
+    The topic is verified once when the first subscriber arrives, and every message is transformed
+    once before being sent to all of the subscribers.
+    """
+
+    def __init__(self, transform: Callable[[Any], T], *, queue_size: int = 16) -> None:
+        self._transform = transform
+        self._queue_size = queue_size
+        self._topics: Dict[str, _FanoutTopic] = {}
+        # Upstream listener that are still being cancelled, per topic
+        self._stopping: Dict[str, asyncio.Task] = {}
+
+    def subscribers(self, topic: str) -> int:
+        topical = self._topics.get(topic)
+        return len(topical.queues) if topical is not None else 0
+
+    def _forget_stopped(self, topic: str, task: asyncio.Task) -> None:
+        if self._stopping.get(topic) is task:
+            del self._stopping[topic]
+
+    async def _pump(self, topic: str, topical: _FanoutTopic) -> None:
+        # Wait for the previous listener to deregister itself from the topic first
+        previous = self._stopping.pop(topic, None)
+        if previous is not None:
+            await asyncio.wait([previous])
+        try:
+            async for data in get_pubsub().listen(topic):
+                try:
+                    item = self._transform(data)
+                except Exception:
+                    logger.exception(f"Failed to transform the message of {topic}")
+                    continue
+                for queue in topical.queues:
+                    if queue.full():
+                        # The subscriber is too slow, drop the oldest message
+                        queue.get_nowait()
+                    queue.put_nowait(item)
+        finally:
+            for queue in topical.queues:
+                if queue.full():
+                    queue.get_nowait()
+                queue.put_nowait(_CLOSED)
+
+    async def listen(self, topic: str, verify: Callable[[], Awaitable[bool]]) -> AsyncGenerator[T, None]:
+        """
+        Listen to the topic, `verify` is only called by the first subscriber
+        and the subscription ends right away if it returns False.
+        """
+
+        topical = self._topics.get(topic)
+        if topical is None:
+            topical = _FanoutTopic(verified=asyncio.ensure_future(verify()))
+            self._topics[topic] = topical
+        queue: asyncio.Queue[Any] = asyncio.Queue(self._queue_size)
+        topical.queues.add(queue)
+
+        try:
+            # Shielded, so a subscriber leaving does not cancel the verification of the others
+            if not await asyncio.shield(topical.verified):
+                return
+            if topical.task is None:
+                topical.task = asyncio.create_task(self._pump(topic, topical), name=f"fanout:{topic}")
+            while True:
+                item = await queue.get()
+                if item is _CLOSED:
+                    return
+                yield item
+        finally:
+            topical.queues.discard(queue)
+            if not topical.queues:
+                if self._topics.get(topic) is topical:
+                    del self._topics[topic]
+                if topical.task is not None and not topical.task.done():
+                    topical.task.cancel()
+                    self._stopping[topic] = topical.task
+                    topical.task.add_done_callback(partial(self._forget_stopped, topic))
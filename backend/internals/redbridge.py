@@ -26,6 +26,7 @@ from __future__ import annotations
 
 import asyncio
 import logging
+import time
 import uuid
 from contextlib import asynccontextmanager
 from typing import Any, Dict, List, Optional, Union
@@ -34,6 +35,8 @@ import orjson
 from bson import ObjectId
 from redis import asyncio as aioredis
 
+from internals.tracing import record_call
+
 __all__ = ("RedisBridge",)
 
 
@@ -120,12 +123,14 @@ class RedisBridge:
         uniq_id = str(uuid.uuid4())
         key = f"{method}_{uniq_id}"
         self.lock(key)
+        start = time.perf_counter()
         try:
             yield
         except Exception:
             pass
         finally:
             self.unlock(key)
+            record_call("redis", method, (time.perf_counter() - start) * 1000.0)
 
     @property
     def client(self):
@@ -0,0 +1,100 @@
+"""
+MIT License
+
+Copyright (c) 2022-present noaione
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+---
+
+Request tracing, used to attribute the database and redis calls to the GraphQL resolver that made them.
+"""
+
+from __future__ import annotations
+
+import time
+from contextvars import ContextVar, Token
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+__all__ = (
+    "TraceCall",
+    "TraceSpan",
+    "current_span",
+    "record_call",
+    "set_span",
+    "reset_span",
+)
+
+
+@dataclass
+class TraceCall:
+    kind: str
+    """The backend called, e.g. `mongodb` or `redis`"""
+    name: str
+    """What's being called, e.g. `FoodItems.find` or `get`"""
+    duration_ms: float
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"kind": self.kind, "name": self.name, "duration": round(self.duration_ms, 3)}
+
+
+@dataclass
+class TraceSpan:
+    path: str
+    """The resolver path, e.g. `orders.nodes[3].merchant`"""
+    start_ns: int = field(default_factory=time.perf_counter_ns)
+    end_ns: Optional[int] = None
+    calls: List[TraceCall] = field(default_factory=list)
+
+    def finish(self) -> None:
+        self.end_ns = time.perf_counter_ns()
+
+    def to_dict(self, origin_ns: int) -> Dict[str, Any]:
+        end_ns = self.end_ns if self.end_ns is not None else time.perf_counter_ns()
+        return {
+            "path": self.path,
+            "startOffset": round((self.start_ns - origin_ns) / 1e6, 3),
+            "duration": round((end_ns - self.start_ns) / 1e6, 3),
+            "calls": [call.to_dict() for call in self.calls],
+        }
+
+
+# The span of the resolver that is currently running, motor copy the context
+# to the executor thread so it's also available on the command listener.
+_CURRENT_SPAN: ContextVar[Optional[TraceSpan]] = ContextVar("kidofood_trace_span", default=None)
+
+
+def current_span() -> Optional[TraceSpan]:
+    return _CURRENT_SPAN.get()
+
+
+def set_span(span: Optional[TraceSpan]) -> Token:
+    return _CURRENT_SPAN.set(span)
+
+
+def reset_span(token: Token) -> None:
+    _CURRENT_SPAN.reset(token)
+
+
+def record_call(kind: str, name: str, duration_ms: float, span: Optional[TraceSpan] = None) -> None:
+    """Record a call to the `span` or the current span, does nothing if there is no span."""
+    span = span or _CURRENT_SPAN.get()
+    if span is not None:
+        span.calls.append(TraceCall(kind, name, duration_ms))
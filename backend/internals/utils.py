@@ -73,7 +73,7 @@ def to_boolean(value: Any) -> bool:
 def try_int(value: Any) -> Optional[int]:
     try:
         return int(value)
-    except ValueError:
+    except (TypeError, ValueError):
         return None
 
 
@@ -8,4 +8,5 @@ The routes module contains all the routes for the backend.
 """
 
 from .images import *
+from .items import *
 from .server import *
@@ -0,0 +1,159 @@
+"""
+MIT License
+
+Copyright (c) 2022-present noaione
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+from __future__ import annotations
+
+import csv
+import logging
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+import orjson
+from fastapi import APIRouter, Request
+
+from internals.db import BulkImportResult, FoodItemBulkImporter, get_importable_merchant
+from internals.graphql import ITEM_LIST_TAG, invalidate_response_cache, merchant_items_tag
+from internals.responses import ResponseType
+from internals.session import check_session
+
+__all__ = ("router",)
+router = APIRouter(prefix="/items", tags=["Items"])
+logger = logging.getLogger("Routes.Items")
+
+_CSV_TYPES = ("text/csv", "application/csv")
+_INVALID_UTF8 = "Row is not valid UTF-8"
+# The decoded line, and whether it was valid UTF-8
+_Line = Tuple[str, bool]
+
+
+def _decode_line(line: bytes) -> _Line:
+    try:
+        return line.decode("utf-8"), True
+    except UnicodeDecodeError:
+        return line.decode("utf-8", errors="replace"), False
+
+
+async def _stream_lines(request: Request) -> AsyncIterator[_Line]:
+    # Split the request body into lines as it arrives, without buffering
+    # the whole body in memory.
+    remainder = b""
+    async for chunk in request.stream():
+        remainder += chunk
+        lines = remainder.split(b"\n")
+        remainder = lines.pop()
+        for line in lines:
+            yield _decode_line(line + b"\n")
+    if remainder:
+        yield _decode_line(remainder)
+
+
+async def _parse_ndjson(lines: AsyncIterator[_Line]) -> AsyncIterator[Tuple[int, Optional[Dict[str, Any]], str]]:
+    row = 0
+    async for line, valid in lines:
+        if not line.strip():
+            continue
+        row += 1
+        if not valid:
+            yield row, None, _INVALID_UTF8
+            continue
+        try:
+            data = orjson.loads(line)
+        except orjson.JSONDecodeError as exc:
+            yield row, None, f"Invalid JSON: {exc}"
+            continue
+        if not isinstance(data, dict):
+            yield row, None, "Row must be a JSON object"
+            continue
+        yield row, data, ""
+
+
+async def _parse_csv(lines: AsyncIterator[_Line]) -> AsyncIterator[Tuple[int, Optional[Dict[str, Any]], str]]:
+    header: Optional[list[str]] = None
+    buffer = ""
+    buffer_valid = True
+    row = 0
+    async for line, valid in lines:
+        buffer += line
+        buffer_valid = buffer_valid and valid
+        # A quoted field can contain a newline, wait until the quote is closed.
+        if buffer.count('"') % 2 == 1:
+            continue
+        record = next(csv.reader([buffer]), [])
+        record_valid = buffer_valid
+        buffer = ""
+        buffer_valid = True
+        if not any(field.strip() for field in record):
+            continue
+        if header is None:
+            if not record_valid:
+                yield 0, None, "Header is not valid UTF-8"
+                return
+            header = [field.strip().lower() for field in record]
+            continue
+        row += 1
+        if not record_valid:
+            yield row, None, _INVALID_UTF8
+            continue
+        if len(record) != len(header):
+            yield row, None, f"Expected {len(header)} columns, got {len(record)}"
+            continue
+        yield row, dict(zip(header, record)), ""
+    if buffer.strip():
+        yield row + 1, None, "Unterminated quoted field"
+
+
+@router.post("/import", summary="Bulk import food items", response_model=ResponseType[BulkImportResult])
+async def import_items(request: Request, ordered: bool = False):
+    """
+    Bulk import food items into the current user merchant.
+
+    The body is streamed and can either be NDJSON (one JSON object per line)
+    or CSV with a header row (`Content-Type: text/csv`).
+    Each row needs `name`, `price`, `stock`, `type` and an optional `description`.
+
+    When `ordered` is set, the import stops on the first row that fails to be written.
+    """
+
+    user = await check_session(request)
+    merchant = await get_importable_merchant(user.merchant_info)
+    if isinstance(merchant, str):
+        return ResponseType[BulkImportResult](error=merchant, code=403).to_orjson(403)
+
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    lines = _stream_lines(request)
+    rows = _parse_csv(lines) if content_type in _CSV_TYPES else _parse_ndjson(lines)
+
+    logger.info(f"Merchant<{merchant.id}>: Importing items from {content_type or 'ndjson'} body...")
+    importer = FoodItemBulkImporter(merchant, ordered=ordered)
+    async for row, data, error in rows:
+        if importer.halted:
+            break
+        if data is None:
+            importer.add_error(row, error)
+            continue
+        await importer.add(row, data)
+    result = await importer.finish()
+    if result.inserted > 0:
+        await invalidate_response_cache(merchant_items_tag(merchant.id), ITEM_LIST_TAG)
+    logger.info(f"Merchant<{merchant.id}>: Imported {result.inserted} items, {len(result.errors)} failed")
+    return ResponseType[BulkImportResult](data=result).to_orjson()
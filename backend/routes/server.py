@@ -30,16 +30,16 @@ import os
 import platform
 import time
 from dataclasses import dataclass
-from typing import TypedDict
+from typing import Any, Dict, List, TypedDict
 
 import psutil
-from fastapi import APIRouter
+from fastapi import APIRouter, Request
 from fastapi import __version__ as fastapi_version
 
-from internals.db import User
+from internals.db import CommandStats, User, get_database, get_plan_sampler
 from internals.enums import UserType
 from internals.responses import ResponseType
-from internals.session import PartialUserSession, encrypt_password
+from internals.session import PartialUserSession, check_session, encrypt_password
 from internals.version import __version__ as kf_version
 
 __all__ = ("router",)
@@ -119,6 +119,8 @@ class StatsResult(TypedDict):
     """Memory stats in MiB"""
     uptime: float
     """The uptime in seconds"""
+    database: Dict[str, CommandStats]
+    """The database command latency stats in ms, keyed by `collection.command`"""
 
 
 @router.get("/status", summary="Check server health and status", response_model=ResponseType[StatsResult])
@@ -140,6 +142,9 @@ async def server_status():
     os_system = f"{platform.system()} {platform.release()}"
     py_ver = platform.python_version()
 
+    command_monitor = get_database().command_monitor
+    database_stats = command_monitor.snapshot() if command_monitor is not None else {}
+
     data_res: StatsResult = {
         "os": os_system,
         "python": py_ver,
@@ -147,6 +152,25 @@ async def server_status():
         "version": kf_version,
         "memory": {"real": rss_mem, "virtual": vms_mem},
         "uptime": delta_uptime,
+        "database": database_stats,
     }
 
     return ResponseType[StatsResult](data=data_res).to_orjson()
+
+
+@router.get("/plans", summary="Get the sampled bad query plans", response_model=ResponseType[List[Dict[str, Any]]])
+async def server_query_plans(request: Request):
+    """
+    Get the sampled query shapes that are doing a collection scan or an in-memory sort.
+
+    Only available for admin, and only if the query plan sampling is enabled.
+    """
+    user = await check_session(request)
+    if user.type != UserType.ADMIN:
+        return ResponseType[List[Dict[str, Any]]](
+            error="You are not allowed to see the query plans", code=403
+        ).to_orjson(403)
+    sampler = get_plan_sampler()
+    if sampler is None:
+        return ResponseType[List[Dict[str, Any]]](error="Query plan sampling is not enabled", code=404).to_orjson(404)
+    return ResponseType[List[Dict[str, Any]]](data=sampler.report()).to_orjson()